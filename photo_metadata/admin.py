@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PhotoMetadata, ImportedFile
+from .models import PhotoMetadata, ImportedFile, Tag
 
 @admin.register(PhotoMetadata)
 class PhotoMetadataAdmin(admin.ModelAdmin):
@@ -7,9 +7,16 @@ class PhotoMetadataAdmin(admin.ModelAdmin):
     list_filter = ('format', 'camera_make', 'created_date')
     search_fields = ('filename', 'camera_model', 'description')
     readonly_fields = ('created_date',)
+    # Связи с тегами строятся из поля tags при сохранении
+    exclude = ('tag_set',)
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
 
 @admin.register(ImportedFile)
 class ImportedFileAdmin(admin.ModelAdmin):
-    list_display = ('file', 'upload_date', 'is_valid')
-    list_filter = ('is_valid', 'upload_date')
-    readonly_fields = ('upload_date',)
\ No newline at end of file
+    list_display = ('file', 'upload_date', 'is_valid', 'status', 'processed_count', 'added_count', 'duplicate_count')
+    list_filter = ('is_valid', 'status', 'upload_date')
+    readonly_fields = ('upload_date', 'status', 'processed_count', 'added_count', 'duplicate_count', 'invalid_count', 'error_message', 'sha256')
\ No newline at end of file
@@ -0,0 +1,455 @@
+"""JSON API для PhotoMetadata, версия 1.
+
+    GET    /api/v1/photos/             список записей
+    POST   /api/v1/photos/             создать запись
+    GET    /api/v1/photos/<id>/        одна запись
+    PATCH  /api/v1/photos/<id>/        изменить запись
+    DELETE /api/v1/photos/<id>/        удалить запись
+    POST   /api/v1/photos/batch/       {"create": [...], "update": [...], "delete": [...]}
+    GET    /api/v1/photos/nearby/      записи в радиусе: lat, lon, radius_km
+    GET    /api/v1/photos/clusters/    число записей по ячейкам: zoom или precision
+    GET    /api/v1/stats/              статистика каталога (см. stats.py)
+
+Список фильтруется параметрами q, tag (несколько), format, camera_make,
+camera_model, captured_after, captured_before, bbox=west,south,east,north
+и листается курсором (cursor, page_size). Фильтры списка действуют и
+на nearby, и на clusters. Параметр fields=a,b,c оставляет в ответе только
+нужные поля и из базы читает только их.
+
+Пакетный запрос выполняется в одной транзакции: если хоть одна операция
+не прошла проверку, не применяется ни одна, а в ответе перечислены
+ошибки по индексам. Операций в пакете — не больше PHOTO_API_MAX_BATCH.
+
+Изменяющие запросы (POST, PATCH, DELETE) требуют авторизации: заголовок
+Authorization: Bearer <токен из PHOTO_API_TOKENS> или вход на сайт. Тело
+запроса принимается только с Content-Type: application/json, иначе 415.
+"""
+import hmac
+import json
+from decimal import Decimal
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.http import HttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+
+from . import geo, geohash, search, stats
+from .db import atomic_with_retry
+from .importer import bulk_insert, bulk_update
+from .models import PhotoMetadata
+from .pagination import KeysetPaginator, InvalidCursor, get_page_size
+from .serializers import EDITABLE_FIELDS, InvalidFields, dumps, parse_fields, serialize_record
+from .tags import filter_by_tags
+
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_RADIUS_KM = 1000
+
+FILTER_FIELDS = ('format', 'camera_make', 'camera_model')
+# Поля, без которых не построить курсор keyset-пагинации
+CURSOR_FIELDS = ('id', 'created_date')
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+BODY_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+def _has_token(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    return any(
+        hmac.compare_digest(token.encode(), known.encode())
+        for known in getattr(settings, 'PHOTO_API_TOKENS', [])
+    )
+
+
+def _is_authenticated(request):
+    return request.user.is_authenticated
+
+
+def _check_write(request, authenticated):
+    """Изменяющий запрос: нужна авторизация и тело в JSON.
+
+    CSRF-токен API не проверяет. Поэтому запрос с сессией пользователя
+    принимается только с Content-Type: application/json: такой запрос с
+    чужого сайта браузер не отправит без CORS preflight, а HTML-форма
+    его отправить не может.
+    """
+    if not authenticated:
+        raise ApiError(401, 'Требуется авторизация')
+    if request.method in BODY_METHODS and request.content_type != 'application/json':
+        raise ApiError(415, 'Тело запроса должно быть в формате application/json')
+
+
+def api_view(*methods):
+    """JSON-ответы, проверка метода и ошибки ApiError в виде {"error": ...}.
+
+    Подходит и для обычных, и для асинхронных (async def) представлений.
+    Изменяющие запросы проверяет _check_write() вместо CSRF-токена.
+    """
+    def make_response(data, status):
+        if status == 204:
+            return HttpResponse(status=204)
+        return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+    def not_allowed():
+        response = make_response({'error': 'Метод не поддерживается'}, 405)
+        response['Allow'] = ', '.join(methods)
+        return response
+
+    def error_response(e):
+        payload = {'error': e.message}
+        if e.details is not None:
+            payload['details'] = e.details
+        response = make_response(payload, e.status)
+        if e.status == 401:
+            response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in methods:
+                    return not_allowed()
+                try:
+                    if request.method in WRITE_METHODS:
+                        authenticated = _has_token(request) or await sync_to_async(_is_authenticated)(request)
+                        _check_write(request, authenticated)
+                    data, status = await view(request, *args, **kwargs)
+                except ApiError as e:
+                    return error_response(e)
+                return make_response(data, status)
+            # csrf_exempt в Django 4.2 оборачивает представление синхронной
+            # функцией, поэтому для корутины отметка ставится напрямую
+            async_wrapper.csrf_exempt = True
+            return async_wrapper
+
+        @csrf_exempt
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return not_allowed()
+            try:
+                if request.method in WRITE_METHODS:
+                    _check_write(request, _has_token(request) or _is_authenticated(request))
+                data, status = view(request, *args, **kwargs)
+            except ApiError as e:
+                return error_response(e)
+            return make_response(data, status)
+        return wrapper
+    return decorator
+
+
+def _read_json(request):
+    try:
+        return json.loads(request.body, parse_float=Decimal)
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError(400, 'Тело запроса должно быть JSON')
+
+
+def _fields(request):
+    try:
+        return parse_fields(request.GET.get('fields'))
+    except InvalidFields as e:
+        raise ApiError(400, str(e))
+
+
+def _parse_capture_bound(value, name):
+    parsed = parse_datetime(value) or parse_date(value)
+    if parsed is None:
+        raise ApiError(400, f'Неверная дата в параметре {name}')
+    return parsed
+
+
+def _filter_photos(request):
+    records = PhotoMetadata.objects.all()
+    for name in FILTER_FIELDS:
+        value = request.GET.get(name)
+        if value:
+            records = records.filter(**{name: value})
+    if request.GET.get('captured_after'):
+        records = records.filter(capture_date__gte=_parse_capture_bound(request.GET['captured_after'], 'captured_after'))
+    if request.GET.get('captured_before'):
+        records = records.filter(capture_date__lt=_parse_capture_bound(request.GET['captured_before'], 'captured_before'))
+    if request.GET.get('bbox'):
+        try:
+            records = geo.within_bbox(records, *geo.parse_bbox(request.GET['bbox']))
+        except geo.InvalidArea as e:
+            raise ApiError(400, str(e))
+    return filter_by_tags(records, request.GET.getlist('tag'))
+
+
+def _float_param(request, name, low, high):
+    try:
+        value = float(request.GET[name])
+    except KeyError:
+        raise ApiError(400, f'Не задан параметр {name}')
+    except ValueError:
+        raise ApiError(400, f'Параметр {name} должен быть числом')
+    if not low <= value <= high:
+        raise ApiError(400, f'Параметр {name} должен быть от {low} до {high}')
+    return value
+
+
+def _validation_details(error):
+    return error.message_dict if hasattr(error, 'error_dict') else {'__all__': error.messages}
+
+
+def _check_item(item, allowed):
+    if not isinstance(item, dict):
+        return {'__all__': ['Ожидается объект']}
+    unknown = [name for name in item if name not in allowed]
+    if unknown:
+        return {name: ['Неизвестное поле'] for name in unknown}
+    return None
+
+
+def _check_filenames(instances, errors):
+    """Проверяет уникальность имён файлов одним запросом к базе.
+
+    instances — словарь {индекс в пакете: объект}.
+    """
+    seen = {}
+    for index, instance in instances.items():
+        if instance.filename in seen:
+            errors[index] = {'filename': ['Имя файла повторяется в пакете']}
+        seen[instance.filename] = index
+
+    existing = PhotoMetadata.objects.filter(filename__in=list(seen)).values_list('id', 'filename')
+    for pk, filename in existing:
+        instance = instances[seen[filename]]
+        if instance.pk != pk:
+            errors[seen[filename]] = {'filename': ['Запись с таким именем файла уже существует']}
+
+
+def _create(items, errors):
+    instances = {}
+    for index, item in enumerate(items):
+        item_errors = _check_item(item, EDITABLE_FIELDS)
+        if item_errors:
+            errors[index] = item_errors
+            continue
+        instance = PhotoMetadata(**item)
+        try:
+            instance.full_clean(validate_unique=False)
+        except ValidationError as e:
+            errors[index] = _validation_details(e)
+            continue
+        instances[index] = instance
+
+    _check_filenames(instances, errors)
+    if errors:
+        return []
+    return bulk_insert(list(instances.values()))
+
+
+def _update(items, errors):
+    allowed = ['id'] + EDITABLE_FIELDS
+    ids = [item.get('id') for item in items if isinstance(item, dict)]
+    existing = PhotoMetadata.objects.in_bulk([pk for pk in ids if isinstance(pk, int)])
+
+    instances = {}
+    previous = {}
+    for index, item in enumerate(items):
+        item_errors = _check_item(item, allowed)
+        if item_errors:
+            errors[index] = item_errors
+            continue
+        instance = existing.get(item.get('id'))
+        if instance is None:
+            errors[index] = {'id': ['Запись не найдена']}
+            continue
+        changes = previous.setdefault(instance.pk, {})
+        for name, value in item.items():
+            if name != 'id':
+                changes.setdefault(name, getattr(instance, name))
+                setattr(instance, name, value)
+        try:
+            instance.full_clean(validate_unique=False)
+        except ValidationError as e:
+            errors[index] = _validation_details(e)
+            continue
+        instances[index] = instance
+
+    _check_filenames(instances, errors)
+    if errors:
+        return []
+    # Сигнал photos_bulk_updated обновит поиск, теги, статистику и кэш
+    bulk_update(list({instance.pk: instance for instance in instances.values()}.values()), previous)
+    return list(instances.values())
+
+
+def _delete(ids, errors):
+    for index, pk in enumerate(ids):
+        if not isinstance(pk, int):
+            errors[index] = {'id': ['Ожидается целое число']}
+    if errors:
+        return []
+    found = set(PhotoMetadata.objects.filter(id__in=ids).values_list('id', flat=True))
+    for index, pk in enumerate(ids):
+        if pk not in found:
+            errors[index] = {'id': ['Запись не найдена']}
+    if errors:
+        return []
+    PhotoMetadata.objects.filter(id__in=ids).delete()
+    return ids
+
+
+def _apply(operations):
+    """Выполняет операции {'create': [...], 'update': [...], 'delete': [...]} в одной транзакции."""
+    for name, items in operations.items():
+        if not isinstance(items, list):
+            raise ApiError(400, f'Поле {name} должно быть списком')
+
+    max_batch = getattr(settings, 'PHOTO_API_MAX_BATCH', DEFAULT_MAX_BATCH)
+    total = sum(len(items) for items in operations.values())
+    if total > max_batch:
+        raise ApiError(413, f'В пакете не больше {max_batch} операций')
+
+    def apply():
+        errors = {name: {} for name in operations}
+        # Сначала удаление и изменение, чтобы освободившиеся имена файлов
+        # можно было занять новыми записями в том же пакете
+        deleted = _delete(operations.get('delete', []), errors['delete']) if 'delete' in operations else []
+        updated = _update(operations.get('update', []), errors['update']) if 'update' in operations else []
+        created = _create(operations.get('create', []), errors['create']) if 'create' in operations else []
+        # Индексы — ключи-строки, как их записал бы json
+        errors = {
+            name: {str(index): details for index, details in op_errors.items()}
+            for name, op_errors in errors.items() if op_errors
+        }
+        if errors:
+            raise ApiError(400, 'Пакет не применён: есть ошибки', errors)
+        return created, updated, deleted
+
+    try:
+        # Если база занята другим процессом, пакет повторяется целиком
+        return atomic_with_retry(apply)
+    except IntegrityError:
+        raise ApiError(409, 'Конфликт с параллельным изменением, повторите запрос')
+
+
+async def _list(request):
+    fields = _fields(request)
+    page_size = get_page_size(request)
+    cursor = request.GET.get('cursor')
+    records = _filter_photos(request)
+    query_fields = list(dict.fromkeys(list(fields) + list(CURSOR_FIELDS)))
+
+    rows = records.values(*query_fields)
+    try:
+        q = request.GET.get('q', '').strip()
+        if q:
+            # Результаты поиска упорядочены по релевантности
+            page_records, next_cursor, prev_cursor = await search.aranked_page(rows, q, cursor, page_size)
+        else:
+            page = await KeysetPaginator(rows, page_size=page_size).apage(cursor)
+            page_records, next_cursor, prev_cursor = page.object_list, page.next_cursor, page.prev_cursor
+    except InvalidCursor:
+        raise ApiError(400, 'Неверный курсор')
+
+    return {
+        'results': [serialize_record(record, fields) for record in page_records],
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    }
+
+
+# Изменения выполняются в транзакции, а транзакции доступны только
+# синхронному коду — пакет целиком применяется в отдельном потоке
+_aapply = sync_to_async(_apply)
+
+
+@api_view('GET', 'POST')
+async def photo_list(request):
+    if request.method == 'GET':
+        return await _list(request), 200
+    item = _read_json(request)
+    created, _, _ = await _aapply({'create': [item]})
+    return serialize_record(created[0]), 201
+
+
+@api_view('GET', 'PATCH', 'DELETE')
+async def photo_detail(request, record_id):
+    if request.method == 'GET':
+        fields = _fields(request)
+        record = await PhotoMetadata.objects.filter(id=record_id).values(*fields).afirst()
+        if record is None:
+            raise ApiError(404, 'Запись не найдена')
+        return serialize_record(record, fields), 200
+
+    if not await PhotoMetadata.objects.filter(id=record_id).aexists():
+        raise ApiError(404, 'Запись не найдена')
+    if request.method == 'DELETE':
+        await _aapply({'delete': [record_id]})
+        return None, 204
+
+    item = _read_json(request)
+    if not isinstance(item, dict):
+        raise ApiError(400, 'Ожидается объект')
+    _, updated, _ = await _aapply({'update': [dict(item, id=record_id)]})
+    return serialize_record(updated[0]), 200
+
+
+@api_view('GET')
+def photo_nearby(request):
+    latitude = _float_param(request, 'lat', -90, 90)
+    longitude = _float_param(request, 'lon', -180, 180)
+    max_radius = getattr(settings, 'PHOTO_GEO_MAX_RADIUS_KM', DEFAULT_MAX_RADIUS_KM)
+    radius = _float_param(request, 'radius_km', 0, max_radius)
+    fields = _fields(request)
+
+    found = geo.nearest(_filter_photos(request), latitude, longitude, radius, get_page_size(request))
+    rows = {
+        row['id']: row
+        for row in PhotoMetadata.objects.filter(id__in=[pk for pk, _ in found])
+        .values(*dict.fromkeys(['id'] + fields))
+    }
+    return {
+        'results': [
+            dict(serialize_record(rows[pk], fields), distance_km=round(distance, 3))
+            for pk, distance in found
+        ],
+    }, 200
+
+
+@api_view('GET')
+def photo_clusters(request):
+    if request.GET.get('precision'):
+        precision = int(_float_param(request, 'precision', 1, geohash.MAX_PRECISION))
+    else:
+        precision = geohash.precision_for_zoom(int(_float_param(request, 'zoom', 0, 30)))
+    return {
+        'precision': precision,
+        'clusters': geo.clusters(_filter_photos(request), precision),
+    }, 200
+
+
+@api_view('POST')
+async def photo_batch(request):
+    operations = _read_json(request)
+    if not isinstance(operations, dict) or not set(operations) <= {'create', 'update', 'delete'}:
+        raise ApiError(400, 'Ожидается объект с полями create, update, delete')
+    created, updated, deleted = await _aapply(operations)
+    return {
+        'created': [serialize_record(record) for record in created],
+        'updated': [serialize_record(record) for record in updated],
+        'deleted': deleted,
+    }, 200
+
+
+@api_view('GET')
+def catalog_stats(request):
+    return stats.summary(), 200
@@ -0,0 +1,105 @@
+"""Кэш результатов поиска и страниц списка записей.
+
+Ключ содержит номер поколения данных. Любое изменение PhotoMetadata
+меняет номер поколения, и все прежние записи кэша перестают
+использоваться. Их вытесняет LRU-политика бэкенда кэша.
+
+Сами результаты лежат в кэше PHOTO_CACHE_ALIAS (обычно локальном для
+процесса), а номер поколения — в кэше PHOTO_CACHE_GENERATION_ALIAS,
+общем для всех процессов: запись в одном воркере gunicorn или в команде
+import_photos сбрасывает кэш и в остальных.
+
+Содержимое JSON файлов кэшируется без поколения: ключ file_key() меняется
+вместе с путём, размером и датой изменения файла.
+"""
+import hashlib
+import json
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GENERATION_KEY = 'photo_metadata:generation'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PHOTO_CACHE_ALIAS', 'default')]
+
+
+def get_generation_cache():
+    alias = getattr(settings, 'PHOTO_CACHE_GENERATION_ALIAS', None)
+    return caches[alias] if alias else get_cache()
+
+
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', query or '').strip().lower()
+
+
+def get_generation():
+    cache = get_generation_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Начальное значение берётся от времени, чтобы после вытеснения
+        # счётчика не совпасть с одним из прежних поколений
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    # Новое значение, а не incr: incr файлового кэша — чтение и запись,
+    # и два процесса могли бы записать одно и то же поколение
+    get_generation_cache().set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate():
+    """Сбрасывает кэш после фиксации текущей транзакции."""
+    transaction.on_commit(bump_generation)
+
+
+async def aget_generation():
+    cache = get_generation_cache()
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def _key(namespace, params, generation):
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.md5(payload.encode()).hexdigest()
+    return f'photo_metadata:{namespace}:{generation}:{digest}'
+
+
+def make_key(namespace, params):
+    return _key(namespace, params, get_generation())
+
+
+def file_key(stored_file):
+    """Ключ кэша содержимого файла из индекса StoredJSONFile."""
+    params = [stored_file.name, stored_file.path, stored_file.offset, stored_file.size, stored_file.modified]
+    return _key('file', params, 'static')
+
+
+def get_or_compute(namespace, params, compute):
+    cache = get_cache()
+    key = make_key(namespace, params)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+
+async def aget_or_compute(namespace, params, compute):
+    """То же, что get_or_compute(), для асинхронных представлений; compute — корутинная функция."""
+    cache = get_cache()
+    key = _key(namespace, params, await aget_generation())
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value)
+    return value
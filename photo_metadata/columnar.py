@@ -0,0 +1,491 @@
+"""Колоночный снимок каталога для аналитики без нагрузки на рабочую базу.
+
+Команда snapshot_catalog одним проходом читает PhotoMetadata и записывает
+каждое поле отдельной колонкой фиксированного типа в каталог снимка:
+
+* 'npy' — по файлу .npy на колонку; с NumPy они открываются через mmap,
+  без NumPy читаются в array.array (формат .npy разбирается здесь же);
+* 'parquet' — один файл catalog.parquet (нужен пакет pyarrow).
+
+Строковые поля (формат, производитель, модель) кодируются словарём:
+в колонке — номер значения, сами значения — в meta.json. Отсутствующие
+значения числовых полей хранятся как NaN, месяца съёмки — как -1.
+
+Snapshot выполняет фильтры, группировки и гистограммы над колонками:
+векторно через NumPy, если он установлен, иначе циклами по массивам.
+Результаты совпадают с агрегатными запросами ORM (см. benchmark_snapshot).
+"""
+import ast
+import json
+import math
+import os
+import shutil
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import PhotoMetadata
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SNAPSHOT_FORMATS = ('npy', 'parquet')
+SNAPSHOT_VERSION = 1
+
+# Колонки снимка и коды типов array: 'i' — int32, 'q' — int64, 'd' — float64
+COLUMNS = {
+    'id': 'q',
+    'format': 'i',
+    'camera_make': 'i',
+    'camera_model': 'i',
+    'file_size': 'q',
+    'width': 'i',
+    'height': 'i',
+    'iso': 'd',
+    'aperture': 'd',
+    'focal_length': 'd',
+    'latitude': 'd',
+    'longitude': 'd',
+    'capture_date': 'd',
+    'capture_month': 'i',
+    'created_date': 'd',
+}
+DICTIONARY_COLUMNS = ('format', 'camera_make', 'camera_model')
+DATE_COLUMNS = ('capture_date', 'created_date')
+# Месяц съёмки — год * 12 + номер месяца - 1; NO_MONTH — дата не указана
+NO_MONTH = -1
+
+# Вычисляемые колонки: число пикселей для гистограмм разрешения
+DERIVED_COLUMNS = ('pixels',)
+
+SOURCE_FIELDS = (
+    'id', 'format', 'camera_make', 'camera_model', 'file_size', 'width', 'height',
+    'iso', 'aperture', 'focal_length', 'latitude', 'longitude', 'capture_date', 'created_date',
+)
+
+NPY_MAGIC = b'\x93NUMPY'
+NPY_DTYPES = {'i': '<i4', 'q': '<i8', 'd': '<f8'}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+META_FILE = 'meta.json'
+PARQUET_FILE = 'catalog.parquet'
+
+
+def default_path():
+    return str(getattr(settings, 'PHOTO_SNAPSHOT_PATH', os.path.join(settings.BASE_DIR, 'snapshots', 'catalog')))
+
+
+def to_epoch(value):
+    """Секунды от 1970-01-01; даты без часового пояса считаются UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
+
+def month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def month_label(index):
+    year, month = divmod(index, 12)
+    return f'{year:04d}-{month + 1:02d}'
+
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+
+# Запись снимка
+
+def _npy_header(typecode, length):
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (NPY_DTYPES[typecode], length)
+    # Формат .npy 1.0: заголовок дополняется пробелами до границы 64 байт
+    unpadded = len(NPY_MAGIC) + 2 + 2 + len(header) + 1
+    header += ' ' * (-unpadded % 64) + '\n'
+    return NPY_MAGIC + b'\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def _little_endian(data):
+    if sys.byteorder != 'little':
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data
+
+
+def _write_npy(path, data):
+    with open(path, 'wb') as f:
+        f.write(_npy_header(data.typecode, len(data)))
+        f.write(_little_endian(data).tobytes())
+
+
+def _write_parquet(path, columns):
+    if pyarrow is None:
+        raise ImproperlyConfigured("Для снимка в формате Parquet установите пакет pyarrow")
+    types = {'i': pyarrow.int32(), 'q': pyarrow.int64(), 'd': pyarrow.float64()}
+    table = pyarrow.table({
+        name: pyarrow.Array.from_buffers(types[data.typecode], len(data), [None, pyarrow.py_buffer(_little_endian(data))])
+        for name, data in columns.items()
+    })
+    pyarrow.parquet.write_table(table, path, compression='zstd')
+
+
+def read_columns(queryset=None, chunk_size=5000):
+    """Колонки и словари значений строковых полей: (columns, dictionaries)."""
+    if queryset is None:
+        queryset = PhotoMetadata.objects.all()
+    columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+    codes = {name: {} for name in DICTIONARY_COLUMNS}
+    (ids, formats, makes, models, sizes, widths, heights, isos, apertures, focals,
+     latitudes, longitudes, captures, months, created) = columns.values()
+    format_codes, make_codes, model_codes = codes.values()
+
+    rows = queryset.order_by('id').values_list(*SOURCE_FIELDS).iterator(chunk_size=chunk_size)
+    for (pk, photo_format, make, model, size, width, height, iso, aperture, focal,
+         latitude, longitude, capture_date, created_date) in rows:
+        ids.append(pk)
+        formats.append(format_codes.setdefault(photo_format, len(format_codes)))
+        makes.append(make_codes.setdefault(make, len(make_codes)))
+        models.append(model_codes.setdefault(model, len(model_codes)))
+        sizes.append(size)
+        widths.append(width)
+        heights.append(height)
+        isos.append(_float(iso))
+        apertures.append(_float(aperture))
+        focals.append(_float(focal))
+        latitudes.append(_float(latitude))
+        longitudes.append(_float(longitude))
+        if capture_date is None:
+            captures.append(math.nan)
+            months.append(NO_MONTH)
+        else:
+            captures.append(to_epoch(capture_date))
+            months.append(month_index(capture_date))
+        created.append(to_epoch(created_date))
+
+    return columns, {name: list(values) for name, values in codes.items()}
+
+
+def build(path=None, snapshot_format='npy', queryset=None, chunk_size=5000):
+    """Записывает снимок в каталог path и возвращает его метаданные.
+
+    Снимок собирается во временном каталоге и заменяет прежний целиком,
+    так что читатели не видят наполовину записанных колонок.
+    """
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f'Неизвестный формат снимка: {snapshot_format}')
+    path = path or default_path()
+    columns, dictionaries = read_columns(queryset, chunk_size)
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'format': snapshot_format,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'rows': len(columns['id']),
+        'columns': COLUMNS,
+        'dictionaries': dictionaries,
+    }
+
+    temporary = f'{path}.tmp'
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    if snapshot_format == 'parquet':
+        _write_parquet(os.path.join(temporary, PARQUET_FILE), columns)
+    else:
+        for name, data in columns.items():
+            _write_npy(os.path.join(temporary, f'{name}.npy'), data)
+    with open(os.path.join(temporary, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    previous = f'{path}.old'
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(temporary, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    return meta
+
+
+# Чтение снимка
+
+def _read_npy(path, typecode):
+    if numpy is not None:
+        return numpy.load(path, mmap_mode='r')
+    with open(path, 'rb') as f:
+        if f.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise ValueError(f'{path}: не файл .npy')
+        major = f.read(2)[0]
+        header_length, = struct.unpack('<H' if major == 1 else '<I', f.read(2 if major == 1 else 4))
+        header = ast.literal_eval(f.read(header_length).decode('latin1'))
+        if header['descr'] != NPY_DTYPES[typecode] or header['fortran_order']:
+            raise ValueError(f'{path}: тип {header["descr"]} вместо {NPY_DTYPES[typecode]}')
+        data = array(typecode)
+        data.frombytes(f.read())
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data
+
+
+def _read_parquet(path, columns):
+    if pyarrow is None:
+        raise ImproperlyConfigured("Для чтения снимка в формате Parquet установите пакет pyarrow")
+    table = pyarrow.parquet.read_table(path, columns=list(columns))
+    result = {}
+    for name, typecode in columns.items():
+        column = table.column(name)
+        result[name] = column.to_numpy() if numpy is not None else array(typecode, column.to_pylist())
+    return result
+
+
+def load(path=None):
+    path = path or default_path()
+    with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f'Снимок версии {meta["version"]}, ожидается {SNAPSHOT_VERSION}')
+    if meta['format'] == 'parquet':
+        columns = _read_parquet(os.path.join(path, PARQUET_FILE), meta['columns'])
+    else:
+        columns = {
+            name: _read_npy(os.path.join(path, f'{name}.npy'), typecode)
+            for name, typecode in meta['columns'].items()
+        }
+    return Snapshot(columns, meta['dictionaries'], meta)
+
+
+class Snapshot:
+    """Колонки снимка с фильтрами, группировками и гистограммами.
+
+    Условия фильтра (mask) задаются как в filter(): значение, кортеж
+    (от, до) включительно — None означает открытую границу — или список
+    значений. Строковые поля сравниваются по значению, даты — по datetime,
+    месяц съёмки — строкой 'ГГГГ-ММ'. Группы с отсутствующим значением
+    получают ключ None, как NULL в GROUP BY.
+    """
+
+    def __init__(self, columns, dictionaries, meta=None):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.meta = meta or {}
+        self.codes = {name: {value: code for code, value in enumerate(values)} for name, values in dictionaries.items()}
+        self._derived = {}
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def column(self, name):
+        if name in DERIVED_COLUMNS:
+            if name not in self._derived:
+                width, height = self.columns['width'], self.columns['height']
+                if numpy is not None:
+                    self._derived[name] = width.astype(numpy.int64) * height
+                else:
+                    self._derived[name] = array('q', (w * h for w, h in zip(width, height)))
+            return self._derived[name]
+        return self.columns[name]
+
+    def encode(self, name, value):
+        """Значение поля в том виде, в каком оно хранится в колонке."""
+        if value is None:
+            return NO_MONTH if name == 'capture_month' else math.nan
+        if name in self.codes:
+            # Значения нет в словаре — ни одна строка ему не соответствует
+            return self.codes[name].get(value, -1)
+        if name in DATE_COLUMNS:
+            return to_epoch(value)
+        if name == 'capture_month':
+            year, month = value.split('-')
+            return int(year) * 12 + int(month) - 1
+        return value
+
+    def decode(self, name, value):
+        """Значение из колонки в исходном виде; отсутствующее — None."""
+        if name in self.dictionaries:
+            return self.dictionaries[name][int(value)]
+        if name == 'capture_month':
+            return None if value == NO_MONTH else month_label(int(value))
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return None
+            return from_epoch(float(value)) if name in DATE_COLUMNS else float(value)
+        return int(value)
+
+    # Фильтры
+
+    def mask(self, **conditions):
+        result = None
+        for name, condition in conditions.items():
+            part = self._condition(name, condition)
+            if result is None:
+                result = part
+            elif numpy is not None:
+                result = result & part
+            else:
+                result = [a and b for a, b in zip(result, part)]
+        return result
+
+    def _condition(self, name, condition):
+        values = self.column(name)
+        if isinstance(condition, tuple):
+            if name in self.codes:
+                raise ValueError(f'Диапазон для строкового поля {name} не поддерживается')
+            low, high = (None if bound is None else self.encode(name, bound) for bound in condition)
+            if name == 'capture_month':
+                # Строки без месяца (-1) не попадают в диапазон
+                low = NO_MONTH + 1 if low is None else low
+            if numpy is not None:
+                part = numpy.ones(len(values), dtype=bool)
+                if low is not None:
+                    part &= values >= low
+                if high is not None:
+                    part &= values <= high
+                if values.dtype.kind == 'f' and low is None and high is None:
+                    part &= ~numpy.isnan(values)
+                return part
+            return [
+                value == value and (low is None or value >= low) and (high is None or value <= high)
+                for value in values
+            ]
+        if isinstance(condition, (list, set, frozenset)):
+            encoded = [self.encode(name, value) for value in condition]
+            if numpy is not None:
+                return numpy.isin(values, encoded)
+            encoded = set(encoded)
+            return [value in encoded for value in values]
+        encoded = self.encode(name, condition)
+        if numpy is not None:
+            return numpy.isnan(values) if encoded != encoded else values == encoded
+        if encoded != encoded:
+            return [value != value for value in values]
+        return [value == encoded for value in values]
+
+    def _selected(self, name, mask):
+        values = self.column(name)
+        if mask is None:
+            return values
+        if numpy is not None:
+            return values[mask]
+        return [value for value, keep in zip(values, mask) if keep]
+
+    def count(self, mask=None):
+        if mask is None:
+            return len(self)
+        return int(mask.sum()) if numpy is not None else sum(mask)
+
+    # Группировки
+
+    def _groups(self, names, mask):
+        """Ключи групп и номер группы каждой выбранной строки: (keys, inverse)."""
+        if numpy is not None:
+            uniques = []
+            combined = None
+            for name in names:
+                values = self._selected(name, mask)
+                if values.dtype.kind == 'f':
+                    # NaN — отдельная группа; np.unique сравнивает бесконечность, а не NaN
+                    values = numpy.where(numpy.isnan(values), numpy.inf, values)
+                unique, inverse = numpy.unique(values, return_inverse=True)
+                uniques.append(unique)
+                inverse = inverse.reshape(-1).astype(numpy.int64)
+                combined = inverse if combined is None else combined * len(unique) + inverse
+            if combined is None or not len(combined):
+                return [], numpy.zeros(0, dtype=numpy.int64)
+            groups, inverse = numpy.unique(combined, return_inverse=True)
+            keys = []
+            for group in groups.tolist():
+                parts = []
+                for name, unique in zip(reversed(names), reversed(uniques)):
+                    group, index = divmod(group, len(unique))
+                    parts.append(self.decode(name, unique[index].item()))
+                keys.append(tuple(reversed(parts)))
+            return keys, inverse.reshape(-1)
+
+        columns = [self._selected(name, mask) for name in names]
+        index = {}
+        inverse = []
+        for row in zip(*columns):
+            # NaN не равен сам себе — для ключа группы он заменяется на None
+            row = tuple(value if value == value else None for value in row)
+            inverse.append(index.setdefault(row, len(index)))
+        keys = [
+            tuple(None if value is None else self.decode(name, value) for name, value in zip(names, row))
+            for row in index
+        ]
+        return keys, inverse
+
+    @staticmethod
+    def _key(key, names):
+        return key[0] if len(names) == 1 else key
+
+    def count_by(self, *names, mask=None):
+        """{значение или кортеж значений: число строк}, по убыванию числа строк."""
+        keys, inverse = self._groups(names, mask)
+        if numpy is not None:
+            counts = numpy.bincount(inverse, minlength=len(keys)).tolist()
+        else:
+            counts = [0] * len(keys)
+            for group in inverse:
+                counts[group] += 1
+        result = sorted(zip(keys, counts), key=lambda item: -item[1])
+        return {self._key(key, names): count for key, count in result}
+
+    def mean_by(self, value_name, *names, mask=None):
+        """{ключ группы: среднее value_name}; отсутствующие значения не учитываются, как в AVG."""
+        keys, inverse = self._groups(names, mask)
+        values = self._selected(value_name, mask)
+        if numpy is not None:
+            values = numpy.asarray(values, dtype=numpy.float64)
+            known = ~numpy.isnan(values)
+            sums = numpy.bincount(inverse, weights=numpy.where(known, values, 0), minlength=len(keys))
+            counts = numpy.bincount(inverse, weights=known, minlength=len(keys))
+            pairs = zip(sums.tolist(), counts.tolist())
+        else:
+            sums = [0.0] * len(keys)
+            counts = [0] * len(keys)
+            for group, value in zip(inverse, values):
+                if value == value:
+                    sums[group] += value
+                    counts[group] += 1
+            pairs = zip(sums, counts)
+        return {
+            self._key(key, names): (total / count if count else None)
+            for key, (total, count) in zip(keys, pairs)
+        }
+
+    def histogram(self, name, edges, mask=None):
+        """Число строк в интервалах [edges[i], edges[i + 1]): список (от, до, число).
+
+        Значения вне интервалов и отсутствующие не учитываются.
+        """
+        values = self._selected(name, mask)
+        bins = len(edges) - 1
+        if numpy is not None:
+            values = numpy.asarray(values)
+            if values.dtype.kind == 'f':
+                values = values[~numpy.isnan(values)]
+            indexes = numpy.searchsorted(numpy.asarray(edges, dtype=numpy.float64), values, side='right') - 1
+            indexes = indexes[(indexes >= 0) & (indexes < bins)]
+            counts = numpy.bincount(indexes, minlength=bins).tolist()
+        else:
+            counts = [0] * bins
+            for value in values:
+                if value == value:
+                    index = bisect_right(edges, value) - 1
+                    if 0 <= index < bins:
+                        counts[index] += 1
+        return [(edges[index], edges[index + 1], counts[index]) for index in range(bins)]
@@ -0,0 +1,101 @@
+"""Настройка соединений с базой и повтор транзакций при блокировке.
+
+Новым соединениям с SQLite задаются PRAGMA из PHOTO_SQLITE_PRAGMAS.
+
+Django 4.2 начинает транзакцию SQLite с BEGIN (DEFERRED), и блокировка
+записи берётся только на первой записи. Если к этому моменту другой
+процесс уже записал своё, транзакция, начавшаяся с чтения, получает
+"database is locked" сразу, без ожидания busy_timeout. Поэтому
+atomic_with_retry на SQLite берёт блокировку записи первым же запросом
+транзакции, как BEGIN IMMEDIATE, а транзакцию, которая всё же
+наткнулась на занятую базу, повторяет с задержкой.
+"""
+import random
+import re
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.backends.signals import connection_created
+
+from . import metrics
+from .models import PhotoMetadata
+
+DEFAULT_WRITE_RETRIES = 5
+DEFAULT_RETRY_DELAY = 0.05
+MAX_RETRY_DELAY = 1.0
+
+# Коды PostgreSQL, после которых транзакцию можно повторить:
+# конфликт сериализации и взаимоблокировка
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+_NAME_RE = re.compile(r'^[a-z_]+$')
+_VALUE_RE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+
+def apply_sqlite_pragmas(db_connection, pragmas):
+    """Выполняет PRAGMA name = value для каждой пары.
+
+    journal_mode сохраняется в самом файле базы, остальные действуют до
+    закрытия соединения.
+    """
+    with db_connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if not _NAME_RE.match(name) or not _VALUE_RE.match(str(value)):
+                raise ValueError(f'Недопустимая PRAGMA: {name} = {value}')
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        pragmas = getattr(settings, 'PHOTO_SQLITE_PRAGMAS', {})
+        if pragmas:
+            apply_sqlite_pragmas(connection, pragmas)
+
+
+connection_created.connect(configure_connection)
+
+
+def is_lock_error(error):
+    if not isinstance(error, OperationalError):
+        return False
+    if getattr(error.__cause__, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def lock_for_write(db_connection):
+    """Берёт блокировку записи SQLite в начале текущей транзакции, ожидая её по busy_timeout."""
+    if db_connection.settings_dict['OPTIONS'].get('transaction_mode') in ('IMMEDIATE', 'EXCLUSIVE'):
+        return
+    with db_connection.cursor() as cursor:
+        # Пустой UPDATE ничего не меняет, но открывает транзакцию записи
+        cursor.execute(f'UPDATE {db_connection.ops.quote_name(PhotoMetadata._meta.db_table)} SET id = id WHERE 0')
+
+
+def atomic_with_retry(func, *args, **kwargs):
+    """Выполняет func(*args, **kwargs) в transaction.atomic(), повторяя транзакцию, если база занята.
+
+    Задержка перед повтором удваивается от PHOTO_WRITE_RETRY_DELAY и берётся
+    со случайным разбросом, чтобы столкнувшиеся воркеры не повторяли
+    попытку одновременно. Внутри уже открытой транзакции повторять нечего —
+    ошибка передаётся вызывающему.
+    """
+    retries = getattr(settings, 'PHOTO_WRITE_RETRIES', DEFAULT_WRITE_RETRIES)
+    delay = getattr(settings, 'PHOTO_WRITE_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    outermost = not connection.in_atomic_block
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                if outermost and connection.vendor == 'sqlite':
+                    lock_for_write(connection)
+                return func(*args, **kwargs)
+        except OperationalError as error:
+            if not is_lock_error(error):
+                raise
+            if attempt == retries or not outermost:
+                metrics.count_write('lock_failure')
+                raise
+        metrics.count_write('lock_retry')
+        time.sleep(min(delay * 2 ** attempt, MAX_RETRY_DELAY) * random.uniform(0.5, 1.5))
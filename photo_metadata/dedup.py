@@ -0,0 +1,13 @@
+"""Хэш для поиска дубликатов загруженных файлов.
+
+Дубликаты записей ищутся по имени файла — оно уникально (см. importer.py).
+"""
+import hashlib
+
+
+def file_sha256(chunks):
+    """SHA-256 содержимого, переданного частями (например, UploadedFile.chunks())."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
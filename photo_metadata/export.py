@@ -0,0 +1,87 @@
+"""Потоковая выгрузка PhotoMetadata в JSON, JSON Lines и CSV.
+
+Выгрузка читает таблицу через .iterator(chunk_size=...) и отдаёт байты
+порциями, поэтому память не зависит от размера таблицы. Файлы
+выгрузки без изменений загружаются обратно через upload_file.
+"""
+import csv
+import io
+import json
+import zlib
+
+from .serializers import RECORD_FIELDS, iter_serialized
+
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+}
+
+EXPORT_FIELDS = RECORD_FIELDS
+
+CHUNK_SIZE = 2000
+# Размер порции байт, отдаваемой клиенту за один раз
+FLUSH_SIZE = 64 * 1024
+
+
+def iter_rows(queryset):
+    return iter_serialized(queryset, EXPORT_FIELDS, chunk_size=CHUNK_SIZE)
+
+
+def _iter_json(queryset):
+    yield '['
+    separator = '\n'
+    for row in iter_rows(queryset):
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def _iter_jsonl(queryset):
+    for row in iter_rows(queryset):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _iter_csv(queryset):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in iter_rows(queryset):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_export(queryset, export_format, compress=False):
+    """Возвращает генератор байт выгрузки в формате export_format."""
+    texts = {
+        'json': _iter_json,
+        'jsonl': _iter_jsonl,
+        'csv': _iter_csv,
+    }[export_format](queryset.order_by('id'))
+
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    pending = []
+    pending_size = 0
+    for text in texts:
+        pending.append(text)
+        pending_size += len(text)
+        if pending_size >= FLUSH_SIZE:
+            data = ''.join(pending).encode('utf-8')
+            pending, pending_size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_filename(export_format, compress=False):
+    extension = EXPORT_FORMATS[export_format][1]
+    return f"photos.{extension}{'.gz' if compress else ''}"
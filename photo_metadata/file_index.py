@@ -0,0 +1,143 @@
+"""Индекс сохранённых JSON файлов.
+
+Список файлов хранится в таблице StoredJSONFile и обновляется при
+сохранении и загрузке, поэтому просмотр файлов не обходит каталоги.
+Расхождения с файловой системой исправляет reconcile().
+
+Записи, дописанные в файлы-сегменты (см. storage.SegmentStorage),
+хранятся в индексе со смещением offset внутри сегмента; сами сегменты
+в список файлов не попадают.
+"""
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import StoredJSONFile
+
+JSON_FILES_DIR = 'json_files'
+JSON_UPLOADS_DIR = 'json_uploads'
+SEGMENTS_SUBDIR = 'segments'
+
+DIRECTORY_TYPES = {
+    JSON_FILES_DIR: StoredJSONFile.TYPE_CREATED,
+    JSON_UPLOADS_DIR: StoredJSONFile.TYPE_UPLOADED,
+}
+
+
+def _modified(timestamp):
+    modified = datetime.fromtimestamp(timestamp)
+    if settings.USE_TZ:
+        modified = timezone.make_aware(modified)
+    return modified
+
+
+def _file_type(relative_path):
+    # Файлы могут лежать в подкаталогах (шардах) — тип задаёт верхний каталог
+    return DIRECTORY_TYPES[relative_path.split('/', 1)[0]]
+
+
+def _is_segment(relative_path):
+    return relative_path.startswith(f'{JSON_FILES_DIR}/{SEGMENTS_SUBDIR}/')
+
+
+def register_file(relative_path, record_count=None):
+    """Добавляет или обновляет запись о файле по пути относительно MEDIA_ROOT."""
+    name = os.path.basename(relative_path)
+    stat = os.stat(os.path.join(settings.MEDIA_ROOT, relative_path))
+    defaults = {
+        'file_type': _file_type(relative_path),
+        'path': relative_path,
+        'offset': None,
+        'size': stat.st_size,
+        'modified': _modified(stat.st_mtime),
+    }
+    if record_count is not None:
+        defaults['record_count'] = record_count
+    stored_file, _ = StoredJSONFile.objects.update_or_create(name=name, defaults=defaults)
+    return stored_file
+
+
+def register_segment_record(name, segment_path, offset, size, record_count=None):
+    """Добавляет запись, дописанную в сегмент segment_path по смещению offset."""
+    return StoredJSONFile.objects.create(
+        name=name,
+        file_type=StoredJSONFile.TYPE_CREATED,
+        path=segment_path,
+        offset=offset,
+        size=size,
+        modified=timezone.now(),
+        record_count=record_count,
+    )
+
+
+def unregister_file(relative_path):
+    StoredJSONFile.objects.filter(name=os.path.basename(relative_path)).delete()
+
+
+def _scan_directory(full_directory, relative_directory, found):
+    with os.scandir(full_directory) as entries:
+        for entry in entries:
+            relative_path = f'{relative_directory}/{entry.name}'
+            if entry.is_dir():
+                if not _is_segment(relative_path + '/'):
+                    _scan_directory(entry.path, relative_path, found)
+            elif entry.is_file():
+                found[entry.name] = (relative_path, entry.stat())
+
+
+def scan_files():
+    """Обходит каталоги с JSON файлами вместе с шардами: {имя: (путь, stat)}."""
+    found = {}
+    for directory in DIRECTORY_TYPES:
+        full_directory = os.path.join(settings.MEDIA_ROOT, directory)
+        if os.path.isdir(full_directory):
+            _scan_directory(full_directory, directory, found)
+    return found
+
+
+def reconcile(model=StoredJSONFile, batch_size=1000):
+    """Сверяет индекс с файловой системой. Возвращает (добавлено, обновлено, удалено)."""
+    found = scan_files()
+    indexed = {
+        stored.name: stored
+        for stored in model.objects.only('id', 'name', 'path', 'size', 'modified').iterator()
+    }
+
+    # Записи из сегментов сверяются только с наличием самого сегмента
+    for name, stored in list(indexed.items()):
+        if _is_segment(stored.path) and name not in found:
+            if os.path.exists(os.path.join(settings.MEDIA_ROOT, stored.path)):
+                del indexed[name]
+
+    new_files = []
+    changed_files = []
+    for name, (relative_path, stat) in found.items():
+        modified = _modified(stat.st_mtime)
+        stored = indexed.get(name)
+        if stored is None:
+            new_files.append(model(
+                name=name,
+                file_type=_file_type(relative_path),
+                path=relative_path,
+                size=stat.st_size,
+                modified=modified,
+            ))
+        elif (stored.path, stored.size, stored.modified) != (relative_path, stat.st_size, modified):
+            stored.path, stored.size, stored.modified = relative_path, stat.st_size, modified
+            stored.file_type = _file_type(relative_path)
+            # Файл изменился — прежнее количество записей больше не верно
+            stored.record_count = None
+            changed_files.append(stored)
+
+    removed_ids = [stored.id for name, stored in indexed.items() if name not in found]
+
+    model.objects.bulk_create(new_files, batch_size=batch_size)
+    model.objects.bulk_update(
+        changed_files, ['path', 'file_type', 'size', 'modified', 'record_count'], batch_size=batch_size
+    )
+    for start in range(0, len(removed_ids), batch_size):
+        model.objects.filter(id__in=removed_ids[start:start + batch_size]).delete()
+
+    return len(new_files), len(changed_files), len(removed_ids)
@@ -80,8 +80,8 @@ class PhotoMetadataForm(forms.ModelForm):
 class FileUploadForm(forms.Form):
     file = forms.FileField(
         label="Выберите JSON файл",
-        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.json'}),
-        help_text="Поддерживаемый формат: JSON"
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.json,.jsonl,.csv,.gz'}),
+        help_text="Поддерживаемые форматы: JSON (массив или объект), JSON Lines (.jsonl) и CSV, в том числе сжатые gzip (.gz)"
     )
 
 class EditPhotoMetadataForm(forms.ModelForm):
@@ -0,0 +1,130 @@
+"""Поиск записей по области, по расстоянию и кластеры для карты.
+
+Работает на SQLite и PostgreSQL без PostGIS: область сначала покрывается
+ячейками geohash (см. geohash.py), и база выбирает кандидатов по индексу
+photo_geohash_idx — по одному диапазону строк на ячейку. Затем точные
+границы проверяются по latitude/longitude, а расстояние для поиска
+по радиусу считается формулой гаверсинуса только для кандидатов.
+"""
+import heapq
+import math
+from functools import reduce
+from operator import or_
+
+from django.db.models import Avg, Count, Q
+from django.db.models.functions import Substr
+
+from . import geohash
+from .models import PhotoMetadata
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Сколько ячеек geohash покрывает область запроса
+COVER_CELLS = 32
+
+
+class InvalidArea(ValueError):
+    pass
+
+
+def parse_bbox(value):
+    """Разбирает "west,south,east,north" (порядок GeoJSON) в кортеж чисел.
+
+    west > east означает область через линию перемены дат.
+    """
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise InvalidArea('Область задаётся как west,south,east,north')
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise InvalidArea('Неверные границы области')
+    return west, south, east, north
+
+
+def _boxes(west, south, east, north):
+    # Область через линию перемены дат делится на две
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def bbox_q(west, south, east, north, max_cells=COVER_CELLS):
+    """Условие для filter(): записи внутри прямоугольника."""
+    conditions = []
+    for box_south, box_west, box_north, box_east in _boxes(west, south, east, north):
+        cells = geohash.cover(box_south, box_west, box_north, box_east, max_cells)
+        cells_q = reduce(or_, (Q(geohash__range=geohash.prefix_range(cell)) for cell in cells))
+        conditions.append(cells_q & Q(
+            latitude__range=(box_south, box_north),
+            longitude__range=(box_west, box_east),
+        ))
+    return reduce(or_, conditions)
+
+
+def within_bbox(queryset, west, south, east, north):
+    return queryset.filter(bbox_q(west, south, east, north))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Расстояние по поверхности Земли (гаверсинус)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Прямоугольник (west, south, east, north), в который вписан круг."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    south, north = latitude - lat_delta, latitude + lat_delta
+    if south <= -90 or north >= 90:
+        # Круг захватывает полюс — берём все долготы
+        return -180.0, max(south, -90.0), 180.0, min(north, 90.0)
+    lon_delta = lat_delta / math.cos(math.radians(max(abs(south), abs(north))))
+    if lon_delta >= 180:
+        return -180.0, south, 180.0, north
+    west = (longitude - lon_delta + 540) % 360 - 180
+    east = (longitude + lon_delta + 540) % 360 - 180
+    return west, south, east, north
+
+
+def nearest(queryset, latitude, longitude, radius_km, limit):
+    """До limit записей в радиусе radius_km, от ближних к дальним.
+
+    Возвращает список (id, расстояние в км). Кандидаты выбираются по
+    описанному прямоугольнику, из базы читаются только id и координаты.
+    """
+    candidates = within_bbox(queryset, *radius_bbox(latitude, longitude, radius_km))
+    found = (
+        (distance_km(latitude, longitude, float(lat), float(lon)), pk)
+        for pk, lat, lon in candidates.values_list('id', 'latitude', 'longitude').iterator(chunk_size=5000)
+    )
+    closest = heapq.nsmallest(limit, (item for item in found if item[0] <= radius_km))
+    return [(pk, distance) for distance, pk in closest]
+
+
+def clusters(queryset, precision):
+    """Число записей по ячейкам geohash заданной точности.
+
+    Для каждой ячейки — её код и границы, число записей и средние
+    координаты (точка для маркера кластера).
+    """
+    rows = (
+        queryset.filter(geohash__isnull=False)
+        .annotate(cell=Substr('geohash', 1, precision))
+        .values('cell')
+        .annotate(count=Count('id'), latitude=Avg('latitude'), longitude=Avg('longitude'))
+        .order_by('cell')
+    )
+    result = []
+    for row in rows:
+        south, west, north, east = geohash.bounds(row['cell'])
+        result.append({
+            'cell': row['cell'],
+            'count': row['count'],
+            'latitude': round(float(row['latitude']), 6),
+            'longitude': round(float(row['longitude']), 6),
+            'bbox': [west, south, east, north],
+        })
+    return result
@@ -0,0 +1,123 @@
+"""Geohash: кодирование координат в строку и покрытие прямоугольника ячейками.
+
+Geohash делит мир на 32 ячейки, каждую из них — ещё на 32 и так далее;
+каждый символ строки — номер ячейки на очередном уровне. У точек внутри
+одной ячейки общий префикс, поэтому выборка по ячейке — это диапазон
+строк, который обслуживает обычный B-tree индекс в любой базе.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# 12 символов — ячейка около 4 x 2 см, точнее координат в модели
+MAX_PRECISION = 12
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # чётные биты — долгота, нечётные — широта
+    while len(chars) < precision:
+        if even:
+            middle = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= middle:
+                value = value * 2 + 1
+                lon_range[0] = middle
+            else:
+                value *= 2
+                lon_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                value = value * 2 + 1
+                lat_range[0] = middle
+            else:
+                value *= 2
+                lat_range[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Размер ячейки в градусах: (по широте, по долготе)."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounds(cell):
+    """Границы ячейки: (south, west, north, east)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            middle = (target[0] + target[1]) / 2
+            target[1 - bit] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def prefix_range(cell):
+    """Диапазон полных geohash внутри ячейки, для фильтра __range."""
+    return cell, cell + BASE32[-1] * (MAX_PRECISION - len(cell))
+
+
+def _cell_span(south, west, north, east, precision):
+    lat_size, lon_size = cell_size(precision)
+    rows = range(
+        math.floor((south + 90) / lat_size),
+        min(math.floor((north + 90) / lat_size), 2 ** (precision * 5 // 2) - 1) + 1,
+    )
+    columns = range(
+        math.floor((west + 180) / lon_size),
+        min(math.floor((east + 180) / lon_size), 2 ** math.ceil(precision * 5 / 2) - 1) + 1,
+    )
+    return rows, columns, lat_size, lon_size
+
+
+def cover(south, west, north, east, max_cells=32):
+    """Ячейки одной точности, покрывающие прямоугольник.
+
+    Выбирается самая мелкая точность, при которой ячеек не больше
+    max_cells: крупные ячейки захватывают лишние точки, а слишком
+    много диапазонов в запросе замедляет его. Прямоугольник не должен
+    пересекать линию перемены дат (west <= east).
+    """
+    precision = 1
+    for candidate in range(1, MAX_PRECISION + 1):
+        rows, columns, _, _ = _cell_span(south, west, north, east, candidate)
+        if len(rows) * len(columns) > max_cells:
+            break
+        precision = candidate
+
+    rows, columns, lat_size, lon_size = _cell_span(south, west, north, east, precision)
+    return [
+        encode(-90 + (row + 0.5) * lat_size, -180 + (column + 0.5) * lon_size, precision)
+        for row in rows
+        for column in columns
+    ]
+
+
+def precision_for_zoom(zoom, cells_per_tile=8):
+    """Точность geohash для уровня масштаба карты (0 — весь мир в одном тайле).
+
+    Подбирается так, чтобы по ширине тайла помещалось не меньше
+    cells_per_tile ячеек.
+    """
+    tile_width = 360.0 / 2 ** zoom
+    for precision in range(1, MAX_PRECISION + 1):
+        if cell_size(precision)[1] * cells_per_tile <= tile_width:
+            return precision
+    return MAX_PRECISION
@@ -0,0 +1,193 @@
+import itertools
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+
+from .db import atomic_with_retry
+from .models import PhotoMetadata
+from .signals import photos_bulk_created, photos_bulk_updated
+from .utils import JSONFileProcessor
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Поля, которые никогда не берутся из импортируемого файла
+SKIPPED_FIELDS = ('id', 'created_date', 'geohash')
+
+_FIELDS = {
+    field.name: field
+    for field in PhotoMetadata._meta.concrete_fields
+    if field.name not in SKIPPED_FIELDS
+}
+
+
+def bulk_insert(objects, batch_size=None):
+    """Вставляет объекты одним bulk_create и сообщает о них сигналом photos_bulk_created.
+
+    Возвращает сохранённые объекты с заполненным id.
+    """
+    if not objects:
+        return objects
+    for obj in objects:
+        # bulk_create не вызывает save(), поэтому производные поля заполняются здесь
+        obj.update_geohash()
+    PhotoMetadata.objects.bulk_create(objects, batch_size=batch_size)
+    if objects[0].pk is None:
+        # БД не вернула id из bulk_create — перечитываем вставленные записи
+        objects = list(PhotoMetadata.objects.filter(
+            filename__in=[obj.filename for obj in objects]
+        ))
+    photos_bulk_created.send(sender=PhotoMetadata, instances=objects)
+    return objects
+
+
+def bulk_update(objects, previous, batch_size=None):
+    """Сохраняет изменённые поля объектов через bulk_update и сообщает о них сигналом photos_bulk_updated.
+
+    previous — прежние значения изменённых полей: {id: {поле: значение}}.
+    У каждого объекта записываются только его изменённые поля, поэтому
+    объекты с одинаковым набором полей сохраняются одним запросом.
+    """
+    groups = {}
+    for obj in objects:
+        fields = set(previous[obj.pk])
+        if {'latitude', 'longitude'} & fields:
+            obj.update_geohash()
+            fields.add('geohash')
+        groups.setdefault(frozenset(fields), []).append(obj)
+    for fields, group in groups.items():
+        if fields:
+            PhotoMetadata.objects.bulk_update(group, sorted(fields), batch_size=batch_size)
+    photos_bulk_updated.send(sender=PhotoMetadata, instances=objects, previous=previous)
+    return objects
+
+
+class ImportStats:
+    def __init__(self):
+        self.added = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    @property
+    def processed(self):
+        return self.added + self.duplicates + self.invalid
+
+    def __repr__(self):
+        return (f"ImportStats(added={self.added}, duplicates={self.duplicates}, "
+                f"invalid={self.invalid})")
+
+
+def prepare_record(item):
+    """Проверяет запись из JSON и приводит значения к типам полей модели.
+
+    Возвращает словарь, готовый для PhotoMetadata(**record), или None,
+    если запись не проходит проверку.
+    """
+    if not JSONFileProcessor._validate_photo_metadata(item):
+        return None
+
+    record = {}
+    for name, value in item.items():
+        if name in SKIPPED_FIELDS:
+            continue
+        field = _FIELDS.get(name)
+        if field is None:
+            return None
+        if value is None and not field.null:
+            value = ''
+        elif isinstance(value, float):
+            # 2.8 -> '2.8', иначе DecimalField получит 2.80 и не пройдёт проверку
+            value = str(value)
+        try:
+            record[name] = field.clean(value, None)
+        except ValidationError:
+            return None
+    return record
+
+
+class PhotoMetadataImporter:
+    """Пакетный импорт записей PhotoMetadata.
+
+    Записи обрабатываются порциями по batch_size: на каждую порцию
+    выполняется один запрос за уже существующими ключами и один
+    bulk_create внутри отдельной транзакции. После каждой порции
+    вызывается on_progress(stats), если он передан. При dry_run записи
+    только сверяются с базой, но не сохраняются.
+    """
+
+    def __init__(self, batch_size=None, on_progress=None, dry_run=False):
+        self.batch_size = batch_size or getattr(settings, 'PHOTO_IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.on_progress = on_progress
+        self.dry_run = dry_run
+        self.stats = ImportStats()
+
+    def run(self, items):
+        iterator = iter(items)
+        while True:
+            chunk = list(itertools.islice(iterator, self.batch_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+            if self.on_progress:
+                self.on_progress(self.stats)
+        return self.stats
+
+    def _import_chunk(self, chunk):
+        records = []
+        for item in chunk:
+            record = prepare_record(item)
+            if record is None:
+                self.stats.invalid += 1
+            else:
+                records.append(record)
+        self.write_records(records)
+
+    def write_records(self, records):
+        """Записывает порцию уже проверенных prepare_record записей."""
+        # filename уникален, поэтому совпадение по ключу
+        # (filename, format, file_size, width, height) всегда означает
+        # и совпадение имени файла — сверяем только имена
+        unique_records = {}
+        for record in records:
+            if record['filename'] in unique_records:
+                self.stats.duplicates += 1
+            else:
+                unique_records[record['filename']] = record
+
+        if not unique_records:
+            return
+
+        try:
+            added, duplicates = atomic_with_retry(self._write, unique_records)
+        except IntegrityError:
+            # Параллельный импорт успел вставить часть записей —
+            # повторяем порцию поштучно
+            added, duplicates = self._write_one_by_one(unique_records)
+
+        self.stats.added += added
+        self.stats.duplicates += duplicates
+
+    def _write(self, records):
+        existing = set(
+            PhotoMetadata.objects
+            .filter(filename__in=list(records))
+            .values_list('filename', flat=True)
+        )
+        new_objects = [
+            PhotoMetadata(**record)
+            for filename, record in records.items()
+            if filename not in existing
+        ]
+        if not self.dry_run:
+            new_objects = bulk_insert(new_objects, batch_size=self.batch_size)
+        return len(new_objects), len(records) - len(new_objects)
+
+    def _write_one_by_one(self, records):
+        added = duplicates = 0
+        for record in records.values():
+            try:
+                atomic_with_retry(PhotoMetadata.objects.create, **record)
+                added += 1
+            except IntegrityError:
+                duplicates += 1
+        return added, duplicates
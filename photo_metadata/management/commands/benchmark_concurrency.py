@@ -0,0 +1,231 @@
+import asyncio
+import io
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+
+from photo_metadata.management.commands.benchmark_views import percentile
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.synthetic import temporary_catalog
+
+DEFAULT_PATHS = [
+    '/search/?q=canon',
+    '/files/',
+    '/api/v1/photos/?page_size=20',
+    '/api/v1/photos/?page_size=20&q=nikon',
+]
+
+# Поиск отвечает только на AJAX-запросы
+HEADERS = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+def wsgi_call(app, url, delay):
+    """Один запрос к WSGI приложению; медленный клиент держит поток воркера delay секунд."""
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in HEADERS.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+    status = []
+    result = app(environ, lambda line, headers, exc_info=None: status.append(line))
+    try:
+        for _ in result:
+            pass
+        # Воркер отдаёт ответ сам и ждёт, пока клиент его примет
+        time.sleep(delay)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_call(app, url, delay):
+    """Один запрос к ASGI приложению; медленный клиент задерживает только свою задачу."""
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost')] + [
+            (name.lower().encode(), value.encode()) for name, value in HEADERS.items()
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    request_sent = False
+    status = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается, пока не получит ответ
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            await asyncio.sleep(delay)
+
+    await app(scope, receive, send)
+    return status
+
+
+def summarize(latencies, errors, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed,
+        'mean_ms': statistics.fmean(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies),
+    }
+
+
+def run_wsgi(urls, concurrency, threads, delay):
+    """concurrency клиентов по очереди отправляют запросы пулу из threads потоков (как gunicorn --threads)."""
+    app = get_wsgi_application()
+    pending = iter(urls)
+    lock = threading.Lock()
+    latencies = []
+    errors = 0
+
+    with ThreadPoolExecutor(max_workers=threads) as workers:
+        def client():
+            nonlocal errors
+            while True:
+                with lock:
+                    url = next(pending, None)
+                if url is None:
+                    return
+                started = time.perf_counter()
+                status = workers.submit(wsgi_call, app, url, delay).result()
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    errors += status >= 400
+
+        started = time.perf_counter()
+        clients = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed)
+
+
+def run_asgi(urls, concurrency, delay):
+    """concurrency клиентов по очереди отправляют запросы ASGI приложению в одном цикле событий."""
+    app = get_asgi_application()
+    latencies = []
+    errors = 0
+
+    async def main():
+        nonlocal errors
+        pending = iter(urls)
+
+        async def client():
+            nonlocal errors
+            for url in pending:
+                started = time.perf_counter()
+                status = await asgi_call(app, url, delay)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += status >= 400
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает WSGI (пул потоков) и ASGI (цикл событий) при медленных клиентах: '
+            'пропускная способность и задержки одних и тех же представлений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Сколько записей должно быть в каталоге (недостающие добавляются)')
+        parser.add_argument('--requests', type=int, default=400, help='Всего запросов в каждом режиме')
+        parser.add_argument('--concurrency', type=int, default=32, help='Одновременных клиентов')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Потоков WSGI воркера (как gunicorn --threads)')
+        parser.add_argument('--client-delay', type=float, default=0.1,
+                            help='Сколько секунд медленный клиент принимает ответ')
+        parser.add_argument('--path', action='append',
+                            help='Адрес для запросов (можно несколько); по умолчанию поиск, файлы и API')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        missing = options['rows'] - PhotoMetadata.objects.count()
+        if missing > 0:
+            self.stdout.write(f'Заполнение каталога: {missing} записей...')
+        # Запросы идут из нескольких потоков, и откат транзакции скрыл бы от
+        # них добавленные записи — поэтому после замеров они удаляются
+        with temporary_catalog(missing, seed=20, batch_size=5000):
+            rows = PhotoMetadata.objects.count()
+            paths = options['path'] or DEFAULT_PATHS
+            urls = [paths[number % len(paths)] for number in range(options['requests'])]
+            delay = options['client_delay']
+
+            # Разогрев: кэш поиска и соединения с базой в обоих режимах одинаковы
+            run_wsgi(paths, 1, 1, 0)
+
+            results = {
+                'wsgi': run_wsgi(urls, options['concurrency'], options['threads'], delay),
+                'asgi': run_asgi(urls, options['concurrency'], delay),
+            }
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{options['concurrency']} клиентов, задержка клиента {delay * 1000:.0f} мс, "
+            f"WSGI потоков: {options['threads']}"
+        ))
+        for mode, result in results.items():
+            self.stdout.write(
+                f"  {mode}: {result['throughput_rps']:.1f} запр/с, p50 {result['p50_ms']:.1f} мс, "
+                f"p99 {result['p99_ms']:.1f} мс, ошибок {result['errors']}"
+            )
+        self.stdout.write(f"  ASGI быстрее в {results['asgi']['throughput_rps'] / results['wsgi']['throughput_rps']:.1f} раза")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'rows': rows,
+                    'options': {key: options[key] for key in ('requests', 'concurrency', 'threads', 'client_delay')},
+                    'paths': paths,
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,211 @@
+import io
+import json
+import secrets
+import statistics
+import time
+from urllib.parse import urlsplit
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+
+from photo_metadata.db import apply_sqlite_pragmas
+from photo_metadata.management.commands.benchmark_views import percentile
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.synthetic import generate_records, seed_catalog
+
+PREFIX = 'benchmark-db'
+
+READ_PATHS = [
+    '/api/v1/photos/?page_size=20',
+    '/api/v1/photos/?page_size=20&format=PNG',
+    '/api/v1/stats/',
+]
+
+# Значения SQLite по умолчанию: журнал с удалением, полная синхронизация, без mmap
+SQLITE_DEFAULT_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full', 'mmap_size': 0}
+
+# Токен API на время замеров: запись через API требует авторизации
+API_TOKEN = secrets.token_urlsafe()
+
+# Пул соединений PostgreSQL в конфигурации с пулом (как DB_POOL_SIZE=10)
+POOL_OPTIONS = {'min_size': 1, 'max_size': 10}
+
+
+def wsgi_request(app, method, url, body=b''):
+    """Запрос к WSGI приложению в текущем потоке: соединение с базой живёт, как под gunicorn."""
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_AUTHORIZATION': f'Bearer {API_TOKEN}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    status = []
+    result = app(environ, lambda line, headers, exc_info=None: status.append(line))
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(status[0].split()[0])
+
+
+def sqlite_pragmas():
+    """Действующие значения PRAGMA, которые меняет PHOTO_SQLITE_PRAGMAS."""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in ('journal_mode', 'synchronous', 'mmap_size', 'busy_timeout'):
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
+
+
+def pool_supported():
+    """Есть ли пул соединений Django: нужны Django 5.1+ и psycopg_pool."""
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return django.VERSION >= (5, 1)
+
+
+def configurations(vendor):
+    """(название, CONN_MAX_AGE, PRAGMA для SQLite или None — оставить настройки, параметры пула или None)."""
+    if vendor == 'sqlite':
+        return [
+            ('соединение на запрос', 0, SQLITE_DEFAULT_PRAGMAS, None),
+            ('постоянное соединение', 60, SQLITE_DEFAULT_PRAGMAS, None),
+            ('постоянное соединение + PRAGMA', 60, None, None),
+        ]
+    result = [
+        ('соединение на запрос', 0, None, None),
+        ('постоянное соединение', 60, None, None),
+    ]
+    if vendor == 'postgresql' and pool_supported():
+        # С пулом соединение возвращается в пул после каждого запроса
+        result.append(('пул соединений', 0, None, POOL_OPTIONS))
+    return result
+
+
+def reconnect(settings_dict, max_age, pool):
+    """Закрывает соединение и пул: следующий запрос откроет их с новыми настройками."""
+    connection.close()
+    if hasattr(connection, 'close_pool'):
+        connection.close_pool()
+    settings_dict['CONN_MAX_AGE'] = max_age
+    if pool is None:
+        settings_dict['OPTIONS'].pop('pool', None)
+    else:
+        settings_dict['OPTIONS']['pool'] = pool
+
+
+def summarize(latencies, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': statistics.fmean(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку запросов с новым соединением на каждый запрос, '
+            'с постоянным соединением, (для PostgreSQL) с пулом соединений и (для SQLite) '
+            'с PRAGMA из PHOTO_SQLITE_PRAGMAS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Сколько записей должно быть в каталоге (недостающие добавляются)')
+        parser.add_argument('--reads', type=int, default=300, help='Запросов на чтение в каждой конфигурации')
+        parser.add_argument('--writes', type=int, default=100, help='Созданий записи через API в каждой конфигурации')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        missing = options['rows'] - PhotoMetadata.objects.count()
+        if missing > 0:
+            self.stdout.write(f'Заполнение каталога: {missing} записей...')
+            seed_catalog(missing, seed=24, batch_size=5000, prefix='benchmark')
+
+        app = get_wsgi_application()
+        # journal_mode хранится в файле базы — после замеров он возвращается прежним
+        journal_mode = sqlite_pragmas()['journal_mode'] if connection.vendor == 'sqlite' else None
+        settings_dict = connection.settings_dict
+        original_max_age = settings_dict['CONN_MAX_AGE']
+        original_pool = settings_dict['OPTIONS'].get('pool')
+        reads = [READ_PATHS[number % len(READ_PATHS)] for number in range(options['reads'])]
+        results = []
+        try:
+            for index, (name, max_age, pragmas, pool) in enumerate(configurations(connection.vendor)):
+                # Новое соединение получит настройки этой конфигурации
+                reconnect(settings_dict, max_age, pool)
+                overrides = {'PHOTO_API_TOKENS': [API_TOKEN]}
+                if pragmas is not None:
+                    overrides['PHOTO_SQLITE_PRAGMAS'] = pragmas
+                with override_settings(**overrides):
+                    result = {'configuration': name, 'conn_max_age': max_age, 'pool': pool}
+                    wsgi_request(app, 'GET', READ_PATHS[0])
+                    if connection.vendor == 'sqlite':
+                        result['pragmas'] = sqlite_pragmas()
+
+                    result['read'] = self.run(app, [('GET', url, b'') for url in reads])
+                    records = generate_records(options['writes'], seed=index, prefix=f'{PREFIX}-{index}')
+                    result['write'] = self.run(app, [
+                        ('POST', '/api/v1/photos/', json.dumps(record).encode()) for record in records
+                    ])
+                results.append(result)
+        finally:
+            reconnect(settings_dict, original_max_age, original_pool)
+            if journal_mode is not None:
+                apply_sqlite_pragmas(connection, {'journal_mode': journal_mode})
+            for photo in PhotoMetadata.objects.filter(filename__startswith=PREFIX):
+                photo.delete()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{connection.vendor}, {PhotoMetadata.objects.count()} записей'))
+        for result in results:
+            pool = f", пул до {result['pool']['max_size']}" if result['pool'] else ''
+            self.stdout.write(f"  {result['configuration']} (CONN_MAX_AGE={result['conn_max_age']}{pool}):")
+            if 'pragmas' in result:
+                self.stdout.write('    PRAGMA: ' + ', '.join(f'{key}={value}' for key, value in result['pragmas'].items()))
+            for kind, title in (('read', 'чтение'), ('write', 'запись')):
+                stats = result[kind]
+                self.stdout.write(
+                    f"    {title}: среднее {stats['mean_ms']:.2f} мс, p50 {stats['p50_ms']:.2f} мс, "
+                    f"p99 {stats['p99_ms']:.2f} мс, ошибок {stats['errors']}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'rows': PhotoMetadata.objects.count(),
+                    'options': {key: options[key] for key in ('reads', 'writes')},
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+
+    def run(self, app, requests):
+        latencies = []
+        errors = 0
+        for method, url, body in requests:
+            started = time.perf_counter()
+            status = wsgi_request(app, method, url, body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += status >= 400
+        return summarize(latencies, errors)
@@ -0,0 +1,113 @@
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.synthetic import seed_catalog
+from photo_metadata.tags import filter_by_tags
+
+PAGE_SIZE = 50
+
+
+def query_patterns():
+    """Запросы, которые выполняют представления и админка, по одному на сценарий."""
+    photos = PhotoMetadata.objects.all()
+    ordered = photos.order_by('-created_date', '-id')
+    cursor = ordered.values_list('created_date', 'id')[PAGE_SIZE * 100:PAGE_SIZE * 100 + 1].first()
+    sample = list(photos.order_by('-id').values_list('id', 'filename')[:PAGE_SIZE])
+
+    patterns = [
+        ('view_database_records: первая страница', ordered[:PAGE_SIZE]),
+        ('view_files?source=db: все записи по дате', photos.order_by('-created_date')),
+        ('search_records: фильтр по тегу', filter_by_tags(ordered, ['море'])[:PAGE_SIZE]),
+        ('admin: фильтр по производителю', photos.filter(camera_make='Canon').order_by('-id')[:100]),
+        ('admin: производитель и модель', photos.filter(camera_make='Canon', camera_model='EOS R5')[:100]),
+        ('фильтр по формату с сортировкой по дате', photos.filter(format='PNG').order_by('-created_date')[:PAGE_SIZE]),
+        ('диапазон даты съёмки', photos.filter(
+            capture_date__range=(datetime(2020, 1, 1), datetime(2020, 1, 31))
+        ).order_by('capture_date')[:PAGE_SIZE]),
+        ('upload_file: проверка дубликатов', photos.filter(
+            filename__in=[filename for _, filename in sample]
+        ).values_list('filename', flat=True)),
+        ('view_record', photos.filter(id=sample[0][0] if sample else 0)),
+    ]
+    if cursor:
+        created_date, record_id = cursor
+        patterns.insert(1, ('view_database_records: страница 100 по курсору', ordered.filter(
+            models.Q(created_date__lt=created_date) |
+            models.Q(created_date=created_date, id__lt=record_id)
+        )[:PAGE_SIZE]))
+    return patterns
+
+
+def measure(patterns, repeat):
+    results = []
+    for name, queryset in patterns:
+        plan = queryset.explain()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - started) * 1000)
+        results.append({'query': name, 'plan': plan, 'ms': min(timings)})
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Показывает планы (EXPLAIN) и время запросов представлений без индексов и с индексами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Сначала добавить столько синтетических записей')
+        parser.add_argument('--repeat', type=int, default=3, help='Сколько раз выполнять каждый запрос')
+        parser.add_argument('--analyze', action='store_true', help='Обновить статистику планировщика (ANALYZE)')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        # Синтетические записи и удалённые индексы живут только во временной транзакции
+        with transaction.atomic():
+            if options['seed']:
+                self.stdout.write(f"Заполнение: {options['seed']} записей...")
+                seed_catalog(options['seed'], batch_size=5000)
+            if options['analyze']:
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            patterns = query_patterns()
+            index_names = [index.name for index in PhotoMetadata._meta.indexes]
+
+            # Индексы удаляются во вложенной транзакции, которая затем откатывается
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in index_names:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                before = measure(patterns, options['repeat'])
+                transaction.set_rollback(True)
+
+            after = measure(patterns, options['repeat'])
+            rows = PhotoMetadata.objects.count()
+            transaction.set_rollback(True)
+
+        report = []
+        for old, new in zip(before, after):
+            self.stdout.write(self.style.MIGRATE_HEADING(old['query']))
+            self.stdout.write(f"  без индексов: {old['ms']:.2f} мс")
+            self.stdout.write('    ' + old['plan'].replace('\n', '\n    '))
+            self.stdout.write(f"  с индексами: {new['ms']:.2f} мс")
+            self.stdout.write('    ' + new['plan'].replace('\n', '\n    '))
+            report.append({
+                'query': old['query'],
+                'before': {'ms': old['ms'], 'plan': old['plan']},
+                'after': {'ms': new['ms'], 'plan': new['plan']},
+            })
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'rows': rows,
+                    'indexes': index_names,
+                    'results': report,
+                }, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,139 @@
+import json
+import statistics
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from photo_metadata import serializers
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.synthetic import seed_catalog
+
+
+def legacy_view_record(queryset):
+    """Прежний код view_record: объект модели и словарь, собранный вручную."""
+    records = []
+    for record in queryset:
+        record_data = {
+            'id': record.id,
+            'filename': record.filename,
+            'format': record.format,
+            'file_size': record.file_size,
+            'width': record.width,
+            'height': record.height,
+            'camera_make': record.camera_make,
+            'camera_model': record.camera_model,
+            'exposure_time': record.exposure_time,
+            'aperture': str(record.aperture) if record.aperture else None,
+            'iso': record.iso,
+            'focal_length': str(record.focal_length) if record.focal_length else None,
+            'latitude': str(record.latitude) if record.latitude else None,
+            'longitude': str(record.longitude) if record.longitude else None,
+            'capture_date': record.capture_date.isoformat() if record.capture_date else None,
+            'description': record.description,
+            'tags': record.tags,
+            'created_date': record.created_date.isoformat(),
+        }
+        records.append({k: v for k, v in record_data.items() if v is not None})
+    return json.dumps(records, ensure_ascii=False).encode()
+
+
+def legacy_search_records(queryset):
+    """Прежний код search_records: .only() и словарь с отформатированной датой."""
+    records_data = []
+    for record in queryset.only(
+        'id', 'filename', 'format', 'file_size', 'width', 'height',
+        'camera_make', 'camera_model', 'description', 'created_date'
+    ):
+        records_data.append({
+            'id': record.id,
+            'filename': record.filename,
+            'format': record.format,
+            'file_size': record.file_size,
+            'width': record.width,
+            'height': record.height,
+            'camera_make': record.camera_make,
+            'camera_model': record.camera_model,
+            'description': record.description,
+            'created_date': record.created_date.strftime('%d.%m.%Y %H:%M')
+        })
+    return json.dumps({'records': records_data}, cls=DjangoJSONEncoder).encode()
+
+
+def serializer_all_fields(queryset):
+    return serializers.dumps(serializers.serialize_queryset(queryset))
+
+
+def serializer_search_fields(queryset):
+    fields = ['id', 'filename', 'format', 'file_size', 'width', 'height',
+              'camera_make', 'camera_model', 'description', 'created_date']
+    return serializers.dumps({'records': serializers.serialize_queryset(queryset, fields)})
+
+
+def serializer_stdlib_json(queryset):
+    # Тот же сериализатор, но всегда со стандартным json — для сравнения с orjson
+    return json.dumps(
+        serializers.serialize_queryset(queryset), ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+VARIANTS = [
+    ('view_record (прежний код)', legacy_view_record),
+    ('serializer: все поля', serializer_all_fields),
+    ('serializer: все поля, stdlib json', serializer_stdlib_json),
+    ('search_records (прежний код)', legacy_search_records),
+    ('serializer: поля поиска', serializer_search_fields),
+]
+
+
+def measure(function, queryset, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(function(queryset.all()))
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'ms_min': min(timings), 'ms_median': statistics.median(timings), 'bytes': size}
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время сериализации записей прежним кодом представлений и модулем serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                            help='Размеры выборок (по умолчанию 10000 и 100000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Сколько раз повторять каждый замер')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        largest = max(options['rows'])
+        report = []
+
+        # Недостающие синтетические записи добавляются во временной транзакции
+        with transaction.atomic():
+            missing = largest - PhotoMetadata.objects.count()
+            if missing > 0:
+                self.stdout.write(f'Заполнение: {missing} записей...')
+                seed_catalog(missing, seed=15, batch_size=5000, prefix='benchmark')
+
+            for rows in options['rows']:
+                queryset = PhotoMetadata.objects.order_by('id')[:rows]
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{rows} записей (JSON: {serializers.JSON_ENCODER})'))
+                for name, function in VARIANTS:
+                    result = measure(function, queryset, options['repeat'])
+                    self.stdout.write(
+                        f"  {name}: {result['ms_min']:.1f} мс "
+                        f"({rows / result['ms_min'] * 1000:.0f} записей/с, {result['bytes']} байт)"
+                    )
+                    report.append({'rows': rows, 'variant': name, **result})
+
+            transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'json_encoder': serializers.JSON_ENCODER,
+                    'results': report,
+                }, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,187 @@
+import json
+import math
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Avg, BigIntegerField, Case, Count, ExpressionWrapper, F, Value, When
+from django.db.models.functions import TruncMonth
+
+from photo_metadata import columnar
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.stats import RESOLUTION_CLASSES, RESOLUTION_TOP_CLASS
+from photo_metadata.synthetic import seed_catalog
+
+RESOLUTION_EDGES = [0] + [bound for bound, _ in RESOLUTION_CLASSES] + [math.inf]
+RESOLUTION_LABELS = [label for _, label in RESOLUTION_CLASSES] + [RESOLUTION_TOP_CLASS]
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def _month(value):
+    return value.strftime('%Y-%m') if value else None
+
+
+def orm_resolution():
+    photos = PhotoMetadata.objects.order_by()
+    pixels = ExpressionWrapper(F('width') * F('height'), output_field=BigIntegerField())
+    bucket = Case(
+        *[When(pixels__lt=bound, then=Value(label)) for bound, label in RESOLUTION_CLASSES],
+        default=Value(RESOLUTION_TOP_CLASS),
+    )
+    rows = photos.annotate(pixels=pixels, bucket=bucket).values('bucket').annotate(count=Count('id'))
+    return {row['bucket']: row['count'] for row in rows}
+
+
+def snapshot_resolution(snapshot):
+    histogram = snapshot.histogram('pixels', RESOLUTION_EDGES)
+    return {label: count for label, (_, _, count) in zip(RESOLUTION_LABELS, histogram) if count}
+
+
+def orm_iso_aperture():
+    rows = PhotoMetadata.objects.order_by().values('iso', 'aperture').annotate(count=Count('id'))
+    return {(_number(row['iso']), _number(row['aperture'])): row['count'] for row in rows}
+
+
+def snapshot_iso_aperture(snapshot):
+    return snapshot.count_by('iso', 'aperture')
+
+
+def orm_camera_month():
+    rows = (
+        PhotoMetadata.objects.order_by().annotate(month=TruncMonth('capture_date'))
+        .values('camera_make', 'camera_model', 'month').annotate(count=Count('id'))
+    )
+    return {(row['camera_make'], row['camera_model'], _month(row['month'])): row['count'] for row in rows}
+
+
+def snapshot_camera_month(snapshot):
+    return snapshot.count_by('camera_make', 'camera_model', 'capture_month')
+
+
+def orm_high_iso_jpeg():
+    rows = (
+        PhotoMetadata.objects.order_by().filter(format='JPEG', iso__gte=800)
+        .values('camera_make').annotate(count=Count('id'))
+    )
+    return {row['camera_make']: row['count'] for row in rows}
+
+
+def snapshot_high_iso_jpeg(snapshot):
+    return snapshot.count_by('camera_make', mask=snapshot.mask(format='JPEG', iso=(800, None)))
+
+
+def orm_mean_size():
+    rows = PhotoMetadata.objects.order_by().values('format').annotate(mean=Avg('file_size'))
+    return {row['format']: _number(row['mean']) for row in rows}
+
+
+def snapshot_mean_size(snapshot):
+    return snapshot.mean_by('file_size', 'format')
+
+
+# (название, запрос ORM, тот же расчёт по снимку)
+QUERIES = [
+    ('гистограмма разрешения', orm_resolution, snapshot_resolution),
+    ('ISO × диафрагма', orm_iso_aperture, snapshot_iso_aperture),
+    ('камера × месяц съёмки', orm_camera_month, snapshot_camera_month),
+    ('JPEG с ISO от 800 по производителю', orm_high_iso_jpeg, snapshot_high_iso_jpeg),
+    ('средний размер файла по формату', orm_mean_size, snapshot_mean_size),
+]
+
+
+def same_result(expected, actual):
+    if expected.keys() != actual.keys():
+        return False
+    for key, value in expected.items():
+        other = actual[key]
+        if isinstance(value, float) or isinstance(other, float):
+            if value is None or other is None or not math.isclose(value, other, rel_tol=1e-9):
+                return False
+        elif value != other:
+            return False
+    return True
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает аналитические запросы к базе через ORM с теми же расчётами '
+            'по колоночному снимку: время и совпадение результатов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='Сколько записей должно быть в каталоге (недостающие добавляются)')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз выполнять каждый запрос (медиана)')
+        parser.add_argument('--format', choices=columnar.SNAPSHOT_FORMATS, default='npy', help='Формат снимка')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        directory = tempfile.mkdtemp(prefix='photo-snapshot-')
+        try:
+            # Недостающие синтетические записи добавляются во временной транзакции
+            with transaction.atomic():
+                missing = options['rows'] - PhotoMetadata.objects.count()
+                if missing > 0:
+                    self.stdout.write(f'Заполнение каталога: {missing} записей...')
+                    seed_catalog(missing, seed=23, batch_size=5000, prefix='benchmark')
+
+                path = f'{directory}/catalog'
+                meta, build_ms = timed(lambda: columnar.build(path, options['format']), 1)
+                snapshot, load_ms = timed(lambda: columnar.load(path), 1)
+
+                results = []
+                for name, orm_query, snapshot_query in QUERIES:
+                    expected, orm_ms = timed(orm_query, repeat)
+                    actual, snapshot_ms = timed(lambda: snapshot_query(snapshot), repeat)
+                    results.append({
+                        'query': name,
+                        'orm_ms': orm_ms,
+                        'snapshot_ms': snapshot_ms,
+                        'groups': len(expected),
+                        'same_result': same_result(expected, actual),
+                    })
+
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        engine = 'NumPy' if columnar.numpy is not None else 'array (без NumPy)'
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{meta['rows']} записей, снимок {options['format']}, вычисления: {engine}"
+        ))
+        self.stdout.write(f'  снимок записан за {build_ms:.0f} мс, загружен за {load_ms:.1f} мс')
+        for result in results:
+            self.stdout.write(
+                f"  {result['query']}: ORM {result['orm_ms']:.1f} мс, снимок {result['snapshot_ms']:.1f} мс "
+                f"(в {result['orm_ms'] / max(result['snapshot_ms'], 1e-6):.1f} раза), групп {result['groups']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'rows': meta['rows'],
+                    'format': options['format'],
+                    'numpy': columnar.numpy is not None,
+                    'build_ms': build_ms,
+                    'load_ms': load_ms,
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+
+        mismatched = [result['query'] for result in results if not result['same_result']]
+        if mismatched:
+            raise CommandError(f"Результаты снимка не совпали с ORM: {', '.join(mismatched)}")
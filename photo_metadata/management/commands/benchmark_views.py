@@ -0,0 +1,278 @@
+import http.client
+import json
+import math
+import random
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Max, Q
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+from photo_metadata.models import ImportedFile, PhotoMetadata
+from photo_metadata.synthetic import CAMERAS, TAGS, generate_records, seed_catalog
+
+PERCENTILES = (50, 90, 99)
+
+# Записи, которые создаёт сам бенчмарк, удаляются после прогона
+RUN_PREFIX = 'benchmark-run'
+
+
+def percentile(values, p):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class TestClientTransport:
+    """Запросы через django.test.Client, в том же процессе и без сети."""
+
+    name = 'test'
+
+    def __init__(self):
+        self.client = Client()
+
+    def get(self, path, params=None, headers=None):
+        response = self.client.get(path, params or {}, headers=headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data).status_code
+
+    def close(self):
+        pass
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class WSGITransport:
+    """Запросы по HTTP к локальному WSGI серверу (wsgiref) в отдельном потоке."""
+
+    name = 'wsgi'
+
+    def __init__(self):
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(), handler_class=_QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.cookies = SimpleCookie()
+
+    def _request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{key}={morsel.value}' for key, morsel in self.cookies.items())
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            for cookie in response.headers.get_all('Set-Cookie') or []:
+                self.cookies.load(cookie)
+            return response.status
+        finally:
+            connection.close()
+
+    def get(self, path, params=None, headers=None):
+        if params:
+            path = f'{path}?{urlencode(params, doseq=True)}'
+        return self._request('GET', path, headers=headers)
+
+    def post(self, path, data):
+        if 'csrftoken' not in self.cookies:
+            self.get(path)
+        data = dict(data, csrfmiddlewaretoken=self.cookies['csrftoken'].value)
+        body = encode_multipart(BOUNDARY, data)
+        return self._request('POST', path, body=body, headers={
+            'Content-Type': MULTIPART_CONTENT,
+            'X-CSRFToken': self.cookies['csrftoken'].value,
+        })
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Scenarios:
+    """Сценарии запросов к представлениям; каждый метод выполняет один запрос."""
+
+    def __init__(self, transport, upload_records, seed):
+        self.transport = transport
+        self.upload_records = upload_records
+        self.rng = random.Random(seed)
+        self.counter = 0
+        self.search_terms = [make.lower() for make, _ in CAMERAS if make] + TAGS
+
+    def _unique(self):
+        self.counter += 1
+        return f'{RUN_PREFIX}-{uuid.uuid4().hex[:8]}-{self.counter}'
+
+    def input_form(self):
+        return self.transport.post('/input/', {
+            'filename': f'{self._unique()}.jpg',
+            'format': 'JPEG',
+            'file_size': self.rng.randint(1, 10 ** 7),
+            'width': 4032,
+            'height': 3024,
+            'camera_make': 'Canon',
+            'camera_model': 'EOS R5',
+            'tags': ', '.join(self.rng.sample(TAGS, 2)),
+            'save_option': 'db',
+        })
+
+    def upload_file(self):
+        prefix = self._unique()
+        records = list(generate_records(self.upload_records, seed=self.counter, prefix=prefix))
+        content = json.dumps(records, ensure_ascii=False).encode('utf-8')
+        upload = SimpleUploadedFile(f'{prefix}.json', content, content_type='application/json')
+        return self.transport.post('/upload/', {'file': upload})
+
+    def search_records(self):
+        return self.transport.get(
+            '/search/', {'q': self.rng.choice(self.search_terms)},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+    def view_database_records(self):
+        params = {}
+        if self.rng.random() < 0.3:
+            params['tag'] = self.rng.choice(TAGS[:5])
+        return self.transport.get('/database/', params)
+
+    def view_files(self):
+        return self.transport.get('/files/', {'source': self.rng.choice(['files', 'db'])})
+
+
+SCENARIOS = ['input_form', 'upload_file', 'search_records', 'view_database_records', 'view_files']
+
+
+def run_scenario(function, requests, warmup):
+    for _ in range(warmup):
+        function()
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        status = function()
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        if status >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': requests / elapsed,
+        'mean_ms': statistics.fmean(latencies),
+        'max_ms': max(latencies),
+    }
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = percentile(latencies, p)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Сравнивает p50/p99 с прошлым прогоном; возвращает список регрессий."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            change = (result[key] - previous[key]) / previous[key] * 100 if previous[key] else 0
+            result[f'{key}_change_percent'] = change
+            if change > threshold:
+                regressions.append(f'{name}: {key} {previous[key]:.1f} -> {result[key]:.1f} мс (+{change:.0f}%)')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный бенчмарк представлений: пропускная способность и p50/p90/p99 задержки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Сколько записей должно быть в каталоге (недостающие добавляются)')
+        parser.add_argument('--seed', type=int, default=17, help='Зерно генератора каталога и запросов')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=10, help='Разогревочных запросов на сценарий')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Сценарий (можно несколько); по умолчанию все')
+        parser.add_argument('--client', choices=['test', 'wsgi'], default='test',
+                            help='test — django.test.Client, wsgi — HTTP к локальному WSGI серверу')
+        parser.add_argument('--upload-records', type=int, default=100, help='Записей в загружаемом файле')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Рост p50/p99 в процентах, который считается регрессией')
+        parser.add_argument('--keep', action='store_true', help='Не удалять записи, созданные бенчмарком и добавленные в каталог')
+
+    def handle(self, *args, **options):
+        last_photo = PhotoMetadata.objects.aggregate(last=Max('id'))['last'] or 0
+        missing = options['rows'] - PhotoMetadata.objects.count()
+        if missing > 0:
+            self.stdout.write(f'Заполнение каталога: {missing} записей...')
+            seed_catalog(missing, seed=options['seed'], batch_size=5000, prefix='benchmark')
+
+        last_import = ImportedFile.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        transport = TestClientTransport() if options['client'] == 'test' else WSGITransport()
+        scenarios = Scenarios(transport, options['upload_records'], options['seed'])
+        results = {}
+        try:
+            # Импорт выполняется сразу, чтобы время upload_file включало разбор и запись
+            with override_settings(PHOTO_IMPORT_ASYNC=False):
+                for name in options['scenario'] or SCENARIOS:
+                    result = run_scenario(getattr(scenarios, name), options['requests'], options['warmup'])
+                    results[name] = result
+                    self.stdout.write(
+                        f"{name}: {result['throughput_rps']:.1f} запр/с, "
+                        f"p50 {result['p50_ms']:.1f} мс, p90 {result['p90_ms']:.1f} мс, "
+                        f"p99 {result['p99_ms']:.1f} мс, ошибок {result['errors']}"
+                    )
+            rows = PhotoMetadata.objects.count()
+        finally:
+            transport.close()
+            if not options['keep']:
+                self._cleanup(last_import, last_photo, options['seed'])
+
+        regressions = []
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                regressions = compare(results, json.load(f), options['threshold'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'started': datetime.now().isoformat(timespec='seconds'),
+                    'vendor': connection.vendor,
+                    'rows': rows,
+                    'client': transport.name,
+                    'options': {key: options[key] for key in ('seed', 'requests', 'warmup', 'upload_records')},
+                    'scenarios': results,
+                }, f, ensure_ascii=False, indent=2)
+
+        if regressions:
+            raise CommandError('Регрессия производительности:\n' + '\n'.join(regressions))
+
+    def _cleanup(self, last_import, last_photo, seed):
+        # Записи сценариев и записи, которыми был дополнен каталог
+        PhotoMetadata.objects.filter(
+            Q(filename__startswith=RUN_PREFIX) | Q(id__gt=last_photo, filename__startswith=f'benchmark_{seed}_')
+        ).delete()
+        for imported_file in ImportedFile.objects.filter(id__gt=last_import):
+            imported_file.file.delete(save=False)
+            imported_file.delete()
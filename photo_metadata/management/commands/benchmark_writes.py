@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import statistics
+import threading
+import time
+from collections import Counter
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.test.utils import override_settings
+
+from photo_metadata import metrics, writes
+from photo_metadata.importer import PhotoMetadataImporter, prepare_record
+from photo_metadata.management.commands.benchmark_views import percentile
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.synthetic import generate_records
+
+PREFIX = 'benchmark-writes'
+
+# Режимы записи: как сохраняет форма и сколько повторов при блокировке
+MODES = {
+    # Без повторов: под ASGI — транзакция формы без повтора, в потоках — save()
+    'save': {'PHOTO_WRITE_QUEUE': False, 'PHOTO_WRITE_RETRIES': 0},
+    # Запись в потоке запроса с повтором при блокировке
+    'retry': {'PHOTO_WRITE_QUEUE': False},
+    # Очередь записи: один поток-писатель на процесс, пакеты и повтор
+    'queue': {'PHOTO_WRITE_QUEUE': True},
+}
+
+# Как форма получает запросы: через ASGI приложение, как под UvicornWorker,
+# или вызовом writes.insert() из потоков, как под gthread
+SERVERS = ('asgi', 'threads')
+
+# Записей в генераторе каждого клиента — больше, чем успеет записать любой режим
+RECORDS_PER_THREAD = 10 ** 7
+
+FORM_PATH = '/input/'
+
+
+def form_writer(mode, records, deadline, result, lock):
+    """Сохраняет записи по одной, как input_form, до deadline."""
+    latencies = []
+    errors = Counter()
+    while time.monotonic() < deadline:
+        obj = PhotoMetadata(**prepare_record(next(records)))
+        started = time.perf_counter()
+        try:
+            if mode == 'save':
+                obj.save()
+            else:
+                writes.insert(obj)
+        except (DatabaseError, writes.WriteTimeout) as error:
+            errors[type(error).__name__] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    connection.close()
+    with lock:
+        result['errors'].update(errors)
+        result['latencies'].extend(latencies)
+
+
+async def asgi_request(app, method, path, headers=(), body=b''):
+    """Запрос к ASGI приложению в текущем цикле событий: (статус, заголовки ответа)."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'localhost')] + [(name.encode(), value.encode()) for name, value in headers],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    request_sent = False
+    response = {}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Клиент не отключается, пока не получит ответ
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = [(name.decode(), value.decode()) for name, value in message['headers']]
+
+    await app(scope, receive, send)
+    return response['status'], response['headers']
+
+
+async def asgi_form_client(app, records, deadline, result):
+    """Отправляет форму input_form через ASGI приложение, как браузер, до deadline."""
+    _, headers = await asgi_request(app, 'GET', FORM_PATH)
+    cookies = SimpleCookie()
+    for name, value in headers:
+        if name.lower() == 'set-cookie':
+            cookies.load(value)
+    token = cookies[settings.CSRF_COOKIE_NAME].value
+    headers = [
+        ('cookie', f'{settings.CSRF_COOKIE_NAME}={token}'),
+        ('x-csrftoken', token),
+        ('content-type', 'application/x-www-form-urlencoded'),
+    ]
+    while time.monotonic() < deadline:
+        body = urlencode({**next(records), 'save_option': 'db'}).encode()
+        started = time.perf_counter()
+        status, _ = await asgi_request(app, 'POST', FORM_PATH, headers, body)
+        result['latencies'].append((time.perf_counter() - started) * 1000)
+        # Обработанные ошибки записи форма показывает сообщением после редиректа
+        if status >= 500:
+            result['errors'][f'HTTP {status}'] += 1
+
+
+async def run_asgi_clients(clients, deadline, result):
+    app = get_asgi_application()
+    await asyncio.gather(*(asgi_form_client(app, records, deadline, result) for records in clients))
+
+
+def import_writer(records, batch_size, deadline, result, lock):
+    """Импортирует записи порциями batch_size, как задача импорта загруженного файла, до deadline."""
+    errors = Counter()
+    while time.monotonic() < deadline:
+        importer = PhotoMetadataImporter(batch_size=batch_size)
+        try:
+            importer.write_records([prepare_record(next(records)) for _ in range(batch_size)])
+        except DatabaseError as error:
+            errors[type(error).__name__] += 1
+    connection.close()
+    with lock:
+        result['import_errors'].update(errors)
+
+
+def run_process(mode, server, index, threads, importers, import_batch, duration, results):
+    """Один воркер: threads одновременных отправок формы и importers потоков импорта."""
+    result = {'errors': Counter(), 'import_errors': Counter(), 'latencies': []}
+    lock = threading.Lock()
+    # Ошибки 500 режима без повторов считаются, а не печатаются
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    with override_settings(**MODES[mode]):
+        metrics.reset()
+        deadline = time.monotonic() + duration
+        form_records = [
+            generate_records(RECORDS_PER_THREAD, seed=index * 1000 + number, prefix=f'{PREFIX}-{mode}-form')
+            for number in range(threads)
+        ]
+        workers = [
+            threading.Thread(target=import_writer, args=(
+                generate_records(RECORDS_PER_THREAD, seed=index * 1000 + threads + number,
+                                 prefix=f'{PREFIX}-{mode}-import'),
+                import_batch, deadline, result, lock,
+            ))
+            for number in range(importers)
+        ]
+        if server == 'threads':
+            workers += [
+                threading.Thread(target=form_writer, args=(mode, records, deadline, result, lock))
+                for records in form_records
+            ]
+        for worker in workers:
+            worker.start()
+        if server == 'asgi':
+            asyncio.run(run_asgi_clients(form_records, deadline, result))
+        for worker in workers:
+            worker.join()
+        # Как при остановке воркера: писатель сохраняет очередь и завершается
+        writes.get_queue().join()
+        result['write_events'] = metrics.write_events()
+    connections.close_all()
+    results.put(result)
+
+
+def run_mode(mode, server, processes, threads, importers, import_batch, duration):
+    context = multiprocessing.get_context('fork')
+    results = context.SimpleQueue()
+    # Дочерние процессы не должны получить открытое соединение родителя
+    connections.close_all()
+    started = time.perf_counter()
+    workers = [
+        context.Process(target=run_process, args=(
+            mode, server, index, threads, importers if index == 0 else 0, import_batch, duration, results,
+        ))
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    collected = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    errors = Counter()
+    import_errors = Counter()
+    events = Counter()
+    latencies = []
+    for result in collected:
+        errors.update(result['errors'])
+        import_errors.update(result['import_errors'])
+        events.update(result['write_events'])
+        latencies.extend(result['latencies'])
+    # Сохранённые записи считаются по базе: под ASGI форма отвечает редиректом и при ошибке записи
+    form_inserts = PhotoMetadata.objects.filter(filename__startswith=f'{PREFIX}-{mode}-form').count()
+    import_inserts = PhotoMetadata.objects.filter(filename__startswith=f'{PREFIX}-{mode}-import').count()
+    return {
+        'inserts': form_inserts + import_inserts,
+        'import_inserts': import_inserts,
+        'inserts_per_second': (form_inserts + import_inserts) / elapsed,
+        'form_saves': len(latencies),
+        'form_inserts': form_inserts,
+        'errors': dict(errors),
+        'error_rate': 1 - form_inserts / len(latencies) if latencies else 0.0,
+        'import_errors': dict(import_errors),
+        'lock_retries': events['lock_retry'],
+        'queue_batches': events['batch'],
+        'queue_timeouts': events['queue_timeout'],
+        'mean_batch': events['batched_record'] / events['batch'] if events['batch'] else None,
+        'mean_ms': statistics.fmean(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 50) if latencies else None,
+        'p99_ms': percentile(latencies, 99) if latencies else None,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест записи: несколько процессов одновременно отправляют форму input_form '
+            '(через ASGI приложение, как под UvicornWorker, или из потоков) и импортируют порции '
+            '(как upload_file); сравнивает запись без повторов, запись с повтором и очередь записи')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Процессов (как воркеров gunicorn)')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Одновременных отправок формы в каждом процессе')
+        parser.add_argument('--server', choices=SERVERS, default='asgi',
+                            help='Как процесс получает запросы формы')
+        parser.add_argument('--importers', type=int, default=1,
+                            help='Потоков импорта в первом процессе')
+        parser.add_argument('--import-batch', type=int, default=200, help='Записей в порции импорта')
+        parser.add_argument('--duration', type=float, default=5, help='Секунд на каждый режим')
+        parser.add_argument('--mode', action='append', choices=list(MODES),
+                            help='Режим записи (можно несколько); по умолчанию все')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('Нужен запуск процессов через fork (Linux, macOS)')
+
+        results = {}
+        try:
+            for mode in options['mode'] or list(MODES):
+                results[mode] = run_mode(
+                    mode, options['server'], options['processes'], options['threads'], options['importers'],
+                    options['import_batch'], options['duration'],
+                )
+        finally:
+            PhotoMetadata.objects.filter(filename__startswith=PREFIX).delete()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{connection.vendor}, {options['server']}: {options['processes']} процессов × "
+            f"{options['threads']} отправок формы, потоков импорта {options['importers']}, "
+            f"{options['duration']:g} с на режим"
+        ))
+        for mode, result in results.items():
+            errors = ', '.join(f'{name} {count}' for name, count in sorted(result['errors'].items())) or 'нет'
+            line = (
+                f"  {mode}: {result['inserts_per_second']:.0f} записей/с "
+                f"(из них импорт {result['import_inserts']}), "
+                f"не сохранено из формы {result['error_rate']:.1%} (ошибки: {errors}), "
+                f"неудачных порций импорта {sum(result['import_errors'].values())}, "
+                f"повторов {result['lock_retries']}"
+            )
+            if result['p50_ms'] is not None:
+                line += f", p50 {result['p50_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс"
+            if result['mean_batch']:
+                line += f", средний пакет {result['mean_batch']:.1f}, не дождались писателя {result['queue_timeouts']}"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'rows': PhotoMetadata.objects.count(),
+                    'options': {key: options[key] for key in (
+                        'processes', 'threads', 'server', 'importers', 'import_batch', 'duration',
+                    )},
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
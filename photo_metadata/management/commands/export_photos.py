@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from photo_metadata import search
+from photo_metadata.export import EXPORT_FORMATS, iter_export
+from photo_metadata.models import PhotoMetadata
+from photo_metadata.tags import filter_by_tags
+
+
+class Command(BaseCommand):
+    help = 'Выгружает метаданные фотографий в JSON, JSON Lines или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='jsonl', help='Формат выгрузки')
+        parser.add_argument('--output', '-o', help='Файл для записи (по умолчанию stdout)')
+        parser.add_argument('--gzip', action='store_true', help='Сжать выгрузку gzip')
+        parser.add_argument('--query', '-q', default='', help='Выгрузить только результаты поиска')
+        parser.add_argument('--tag', action='append', default=[], help='Выгрузить только записи с тегом (можно несколько)')
+
+    def handle(self, *args, **options):
+        records = PhotoMetadata.objects.all()
+        if options['query']:
+            records = search.get_backend().filter(records, options['query'])
+        records = filter_by_tags(records, options['tag'])
+
+        chunks = iter_export(records, options['format'], compress=options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from photo_metadata import neardup
+
+
+class Command(BaseCommand):
+    help = ('Ищет похожие записи — один снимок в разных размерах или форматах — '
+            'и сохраняет их группы для страницы /duplicates/')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Сравнить с каталогом только записи, добавленные после прошлой проверки')
+        parser.add_argument('--window', type=float,
+                            help='Наибольшая разница дат съёмки, секунд (по умолчанию PHOTO_NEAR_DUPLICATE_WINDOW)')
+        parser.add_argument('--aspect-tolerance', type=float,
+                            help='Допуск соотношения сторон, доля (по умолчанию PHOTO_NEAR_DUPLICATE_ASPECT_TOLERANCE)')
+        parser.add_argument('--threshold', type=float,
+                            help='Порог сходства от 0 до 1 (по умолчанию PHOTO_NEAR_DUPLICATE_THRESHOLD)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        result = neardup.scan(
+            incremental=options['incremental'],
+            window=timedelta(seconds=options['window']) if options['window'] is not None else None,
+            tolerance=options['aspect_tolerance'],
+            threshold=options['threshold'],
+        )
+        elapsed = time.monotonic() - started
+        mode = 'новых записей' if result.incremental else 'записей'
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено {result.checked_count} {mode} за {elapsed:.1f} с: "
+            f"найдено пар {result.pair_count}, групп в каталоге {result.cluster_count}"
+        ))
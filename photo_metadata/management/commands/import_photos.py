@@ -0,0 +1,97 @@
+import csv
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from photo_metadata.importer import PhotoMetadataImporter, prepare_record
+from photo_metadata.utils import JSONFileProcessor
+
+
+def parse_file(file_path):
+    """Разбирает один файл в процессе пула.
+
+    Возвращает путь, список проверенных записей, число некорректных
+    записей и текст ошибки, если файл прочитать не удалось.
+    """
+    records = []
+    invalid = 0
+    try:
+        for item in JSONFileProcessor.iter_records(file_path):
+            record = prepare_record(item)
+            if record is None:
+                invalid += 1
+            else:
+                records.append(record)
+    except (OSError, ValueError, csv.Error) as e:
+        return file_path, [], 0, str(e)
+    return file_path, records, invalid, None
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        matched = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(path for path in matched if JSONFileProcessor.is_supported_file(path))
+    return list(dict.fromkeys(paths))
+
+
+class Command(BaseCommand):
+    help = 'Импортирует метаданные фотографий из JSON/JSONL/CSV файлов (пути, каталоги или glob-шаблоны)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы, каталоги или glob-шаблоны')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Количество процессов для разбора файлов')
+        parser.add_argument('--batch-size', type=int, default=None, help='Размер пакета записи в БД')
+        parser.add_argument('--dry-run', action='store_true', help='Только разобрать и проверить файлы, ничего не записывая')
+
+    def handle(self, *args, **options):
+        paths = expand_paths(options['paths'])
+        if not paths:
+            raise CommandError('Не найдено ни одного JSON файла')
+
+        dry_run = options['dry_run']
+        importer = PhotoMetadataImporter(batch_size=options['batch_size'], dry_run=dry_run)
+        seen_filenames = set()
+        pending = []
+        total = 0
+        failed_files = 0
+        started = time.monotonic()
+
+        with Pool(processes=max(1, options['workers'])) as pool:
+            for file_path, records, invalid, error in pool.imap_unordered(parse_file, paths):
+                if error:
+                    failed_files += 1
+                    self.stderr.write(f'{file_path}: {error}')
+                    continue
+
+                total += len(records) + invalid
+                importer.stats.invalid += invalid
+                for record in records:
+                    # Дубликаты между файлами отсекаются до обращения к БД
+                    if record['filename'] in seen_filenames:
+                        importer.stats.duplicates += 1
+                        continue
+                    seen_filenames.add(record['filename'])
+                    pending.append(record)
+
+                while len(pending) >= importer.batch_size:
+                    importer.write_records(pending[:importer.batch_size])
+                    del pending[:importer.batch_size]
+
+        if pending:
+            importer.write_records(pending)
+
+        elapsed = time.monotonic() - started
+        stats = importer.stats
+        rate = total / elapsed if elapsed else 0
+        prefix = '[dry-run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Файлов: {len(paths)} (с ошибками: {failed_files}), записей: {total}, '
+            f'добавлено: {stats.added}, дубликатов: {stats.duplicates}, некорректных: {stats.invalid}'
+        ))
+        self.stdout.write(f'Время: {elapsed:.2f} с, скорость: {rate:.0f} записей/с')
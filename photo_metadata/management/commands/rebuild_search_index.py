@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from photo_metadata import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс метаданных фотографий'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен ({backend.__class__.__name__})'))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from photo_metadata import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику каталога (таблица CatalogStat) по всем записям'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = stats.rebuild()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Статистика пересчитана: {sum(count for (dimension, _), count in counts.items() if dimension == 'format')} записей, "
+            f"{sum(1 for count in counts.values() if count)} счётчиков за {elapsed:.1f} с"
+        ))
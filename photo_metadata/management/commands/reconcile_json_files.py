@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from photo_metadata import file_index
+
+
+class Command(BaseCommand):
+    help = 'Сверяет индекс сохранённых JSON файлов с содержимым каталогов media'
+
+    def handle(self, *args, **options):
+        added, updated, removed = file_index.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {added}, обновлено: {updated}, удалено: {removed}'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from photo_metadata import tasks
+from photo_metadata.models import ImportedFile
+
+
+class Command(BaseCommand):
+    help = ('Находит импорты, зависшие в очереди или в работе после перезапуска процесса, '
+            'и выполняет их заново или помечает ошибкой')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int,
+                            help='Считать зависшими импорты, не обновлявшиеся столько секунд '
+                                 '(по умолчанию PHOTO_IMPORT_STALE_AFTER); 0 — все незавершённые, '
+                                 'если других процессов с импортом нет')
+        parser.add_argument('--fail', action='store_true',
+                            help='Пометить зависшие импорты ошибкой вместо повторного импорта; '
+                                 'их можно запустить заново из формы загрузки')
+
+    def handle(self, *args, **options):
+        stale_after = options['older_than']
+        if options['fail']:
+            failed = tasks.fail_stale_imports(stale_after)
+            self.stdout.write(self.style.SUCCESS(f'Помечено ошибкой: {failed}'))
+            return
+
+        stale_ids = list(
+            ImportedFile.objects.filter(tasks.stale_filter(stale_after)).order_by('id').values_list('id', flat=True)
+        )
+        retried = 0
+        for imported_file_id in stale_ids:
+            if tasks.reset_import(imported_file_id, stale_after):
+                # Импорт выполняется здесь же, а не в пуле потоков веб-процесса
+                tasks.run_import(imported_file_id)
+                retried += 1
+        statuses = dict(
+            ImportedFile.objects.filter(id__in=stale_ids).values_list('id', 'status')
+        )
+        done = sum(1 for status in statuses.values() if status == ImportedFile.STATUS_DONE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Зависших импортов: {len(stale_ids)}, запущено заново: {retried}, завершено: {done}'
+        ))
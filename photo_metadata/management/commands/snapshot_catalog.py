@@ -0,0 +1,27 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from photo_metadata import columnar
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет колоночный снимок PhotoMetadata для аналитических запросов (см. photo_metadata/columnar.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o',
+                            help='Каталог снимка (по умолчанию PHOTO_SNAPSHOT_PATH); прежний снимок заменяется')
+        parser.add_argument('--format', choices=columnar.SNAPSHOT_FORMATS, default='npy',
+                            help='npy — файл .npy на колонку; parquet — один файл (нужен pyarrow)')
+
+    def handle(self, *args, **options):
+        path = options['output'] or columnar.default_path()
+        started = time.monotonic()
+        meta = columnar.build(path, options['format'])
+        elapsed = time.monotonic() - started
+        size = sum(entry.stat().st_size for entry in os.scandir(path))
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок {path}: {meta['rows']} записей, {len(meta['columns'])} колонок, "
+            f"{size / 1024 / 1024:.1f} МБ за {elapsed:.1f} с"
+        ))
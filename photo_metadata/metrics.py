@@ -0,0 +1,148 @@
+"""Счётчики производительности представлений в формате Prometheus.
+
+Значения копит PerformanceMiddleware (см. middleware.py), а отдаёт
+представление metrics. Счётчики живут в памяти процесса: при
+нескольких воркерах gunicorn каждый воркер отдаёт свои значения,
+и Prometheus суммирует их по меткам instance.
+"""
+import sys
+import threading
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Границы гистограммы времени ответа, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = defaultdict(int)  # (method, status) -> количество
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.response_bytes = 0
+        self.over_budget = 0
+        self.repeated_queries = 0
+        self.peak_memory = 0
+
+
+_views = defaultdict(ViewStats)
+
+# События записи в базу (см. writes.py, db.atomic_with_retry): повторы при блокировке,
+# пакеты очереди записи и записи, не дождавшиеся писателя
+_write_events = defaultdict(int)
+
+
+def observe(view, method, status, duration, queries, db_time, response_bytes,
+            over_budget=False, repeated_queries=False, peak_memory=None):
+    with _lock:
+        stats = _views[view]
+        stats.requests[(method, status)] += 1
+        for position, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                stats.latency_buckets[position] += 1
+        stats.latency_sum += duration
+        stats.latency_count += 1
+        stats.queries += queries
+        stats.db_time += db_time
+        stats.response_bytes += response_bytes or 0
+        stats.over_budget += int(over_budget)
+        stats.repeated_queries += int(repeated_queries)
+        if peak_memory:
+            stats.peak_memory = max(stats.peak_memory, peak_memory)
+
+
+def count_write(event, amount=1):
+    with _lock:
+        _write_events[event] += amount
+
+
+def write_events():
+    with _lock:
+        return dict(_write_events)
+
+
+def reset():
+    with _lock:
+        _views.clear()
+        _write_events.clear()
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_label(label)}"' for key, label in labels)
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+
+def render():
+    """Текст в формате Prometheus exposition 0.0.4."""
+    with _lock:
+        views = sorted(_views.items())
+        lines = []
+        _metric(lines, 'photo_http_requests_total', 'counter', 'Запросы по представлениям', [
+            ((('view', view), ('method', method), ('status', status)), count)
+            for view, stats in views
+            for (method, status), count in sorted(stats.requests.items())
+        ])
+
+        histogram = []
+        for view, stats in views:
+            for bound, count in zip(LATENCY_BUCKETS, stats.latency_buckets):
+                histogram.append(((('view', view), ('le', bound)), count))
+            histogram.append(((('view', view), ('le', '+Inf')), stats.latency_count))
+        lines.append('# HELP photo_http_request_duration_seconds Время ответа представления')
+        lines.append('# TYPE photo_http_request_duration_seconds histogram')
+        for labels, value in histogram:
+            label_text = ','.join(f'{key}="{_label(label)}"' for key, label in labels)
+            lines.append(f'photo_http_request_duration_seconds_bucket{{{label_text}}} {value}')
+        for view, stats in views:
+            lines.append(f'photo_http_request_duration_seconds_sum{{view="{_label(view)}"}} {stats.latency_sum:.6f}')
+            lines.append(f'photo_http_request_duration_seconds_count{{view="{_label(view)}"}} {stats.latency_count}')
+
+        for name, kind, help_text, attribute in (
+            ('photo_db_queries_total', 'counter', 'SQL запросы', 'queries'),
+            ('photo_db_query_duration_seconds_total', 'counter', 'Время SQL запросов', 'db_time'),
+            ('photo_http_response_bytes_total', 'counter', 'Отданные байты', 'response_bytes'),
+            ('photo_query_budget_exceeded_total', 'counter',
+             'Запросы, превысившие PHOTO_PERF_QUERY_BUDGET', 'over_budget'),
+            ('photo_repeated_queries_total', 'counter',
+             'Запросы с повторяющимся SQL (вероятный N+1)', 'repeated_queries'),
+            ('photo_request_peak_memory_bytes', 'gauge',
+             'Наибольший пик памяти процесса за время запроса (tracemalloc)', 'peak_memory'),
+        ):
+            samples = [((('view', view),), getattr(stats, attribute)) for view, stats in views]
+            if attribute == 'db_time':
+                samples = [(labels, f'{value:.6f}') for labels, value in samples]
+            _metric(lines, name, kind, help_text, samples)
+
+        _metric(lines, 'photo_db_write_events_total', 'counter',
+                'Повторы транзакций при блокировке базы и пакеты очереди записи', [
+                    ((('event', event),), count) for event, count in sorted(_write_events.items())
+                ])
+
+    rss = peak_rss_bytes()
+    if rss is not None:
+        _metric(lines, 'photo_process_peak_rss_bytes', 'gauge', 'Пиковый RSS процесса', [((), rss)])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,206 @@
+import contextvars
+import json
+import logging
+import re
+import time
+import tracemalloc
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import FileResponse
+
+from . import metrics
+
+logger = logging.getLogger('photo_metadata.performance')
+
+DEFAULT_QUERY_BUDGET = 50
+DEFAULT_REPEATED_QUERY_THRESHOLD = 10
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def normalize_sql(sql):
+    """Шаблон запроса без значений: одинаковые запросы с разными id совпадут."""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _NUMBER_RE.sub('N', sql)
+
+
+# Замер текущего запроса. Переменная контекста видна и в потоках,
+# где sync_to_async выполняет запросы асинхронного ORM
+_current = contextvars.ContextVar('photo_request_metrics', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    return request_metrics(execute, sql, params, many, context)
+
+
+def install(db_connection):
+    if count_query not in db_connection.execute_wrappers:
+        db_connection.execute_wrappers.append(count_query)
+
+
+def _install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_install_on_connect)
+
+
+class RequestMetrics:
+    """Счётчики одного запроса; SQL запросы передаёт в __call__ обёртка count_query."""
+
+    def __init__(self, request, trace_memory):
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.templates = Counter()
+        self.response_bytes = 0
+        self.trace_memory = trace_memory
+        self.finished = False
+        _current.set(self)
+        install(connection)
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.templates[normalize_sql(sql)] += 1
+
+    def detach(self):
+        if _current.get() is self:
+            _current.set(None)
+
+    def count_stream(self, chunks):
+        for chunk in chunks:
+            self.response_bytes += len(chunk)
+            yield chunk
+
+    def finish(self, response):
+        if self.finished:
+            return
+        self.finished = True
+        self.detach()
+
+        duration = time.perf_counter() - self.started
+        match = self.request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        peak_memory = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+
+        budget = getattr(settings, 'PHOTO_PERF_QUERY_BUDGET', DEFAULT_QUERY_BUDGET)
+        threshold = getattr(settings, 'PHOTO_PERF_REPEATED_QUERY_THRESHOLD', DEFAULT_REPEATED_QUERY_THRESHOLD)
+        repeated = [(sql, count) for sql, count in self.templates.most_common(3) if count >= threshold]
+        over_budget = self.queries > budget
+
+        metrics.observe(
+            view, self.request.method, response.status_code, duration, self.queries, self.db_time,
+            self.response_bytes, over_budget=over_budget, repeated_queries=bool(repeated),
+            peak_memory=peak_memory,
+        )
+
+        entry = {
+            'view': view,
+            'method': self.request.method,
+            'path': self.request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'response_bytes': self.response_bytes,
+        }
+        if peak_memory is not None:
+            entry['peak_memory_bytes'] = peak_memory
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(entry, ensure_ascii=False))
+
+        if over_budget or repeated:
+            logger.warning(json.dumps({
+                'view': view,
+                'path': self.request.path,
+                'queries': self.queries,
+                'query_budget': budget,
+                # Один и тот же запрос много раз за запрос — вероятный N+1
+                'repeated_queries': [{'sql': sql, 'count': count} for sql, count in repeated],
+            }, ensure_ascii=False))
+
+
+class PerformanceMiddleware:
+    """Время ответа, число и время SQL запросов, размер ответа по представлениям.
+
+    Копит счётчики для /metrics/ и пишет строку JSON на каждый запрос
+    в лог photo_metadata.performance на уровне DEBUG. Если запрос
+    выполнил больше PHOTO_PERF_QUERY_BUDGET SQL запросов или один шаблон
+    запроса повторился PHOTO_PERF_REPEATED_QUERY_THRESHOLD раз, пишется
+    предупреждение с повторяющимися запросами. Пик памяти запроса
+    (tracemalloc) считается только при PHOTO_PERF_TRACE_MEMORY = True:
+    трассировка заметно замедляет работу. tracemalloc следит за всем
+    процессом, поэтому пик точен, только когда процесс обслуживает один
+    запрос за раз; при потоках или ASGI в него попадает память
+    одновременных запросов.
+
+    Для потоковых ответов замер заканчивается, когда ответ отдан целиком.
+    Работает и под WSGI, и под ASGI: в асинхронном режиме не заставляет
+    Django переводить асинхронные представления в отдельный поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_metrics = self._start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._abort(request_metrics)
+            raise
+        return self._finish(request_metrics, response)
+
+    async def __acall__(self, request):
+        request_metrics = self._start(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self._abort(request_metrics)
+            raise
+        return self._finish(request_metrics, response)
+
+    def _start(self, request):
+        return RequestMetrics(request, getattr(settings, 'PHOTO_PERF_TRACE_MEMORY', False))
+
+    def _abort(self, request_metrics):
+        request_metrics.detach()
+
+    def _finish(self, request_metrics, response):
+        if not response.streaming:
+            request_metrics.response_bytes = len(response.content)
+            request_metrics.finish(response)
+            return response
+
+        if isinstance(response, FileResponse):
+            # Содержимое файла не перебираем, чтобы не отключить sendfile
+            request_metrics.response_bytes = int(response.get('Content-Length') or 0)
+        else:
+            response.streaming_content = request_metrics.count_stream(response.streaming_content)
+        response._resource_closers.append(lambda: request_metrics.finish(response))
+        return response
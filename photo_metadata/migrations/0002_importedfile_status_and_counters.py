@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+def mark_existing_files_done(apps, schema_editor):
+    # Файлы, загруженные до появления фонового импорта, уже обработаны
+    ImportedFile = apps.get_model('photo_metadata', 'ImportedFile')
+    ImportedFile.objects.filter(is_valid=True).update(status='done')
+    ImportedFile.objects.filter(is_valid=False).update(status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importedfile',
+            name='added_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавлено записей'),
+        ),
+        migrations.AddField(
+            model_name='importedfile',
+            name='duplicate_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Найдено дубликатов'),
+        ),
+        migrations.AddField(
+            model_name='importedfile',
+            name='error_message',
+            field=models.TextField(blank=True, verbose_name='Ошибка'),
+        ),
+        migrations.AddField(
+            model_name='importedfile',
+            name='invalid_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Некорректных записей'),
+        ),
+        migrations.AddField(
+            model_name='importedfile',
+            name='processed_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обработано записей'),
+        ),
+        migrations.AddField(
+            model_name='importedfile',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Завершён'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус импорта'),
+        ),
+        migrations.RunPython(mark_existing_files_done, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# Копия значений из photo_metadata/search.py на момент миграции: миграция
+# не должна зависеть от текущего кода приложения
+SEARCH_FIELDS = ('filename', 'camera_make', 'camera_model', 'description', 'tags')
+SQLITE_FTS_TABLE = 'photo_metadata_photometadata_fts'
+POSTGRES_SEARCH_INDEX = 'photo_metadata_photometadata_search_idx'
+POSTGRES_SEARCH_VECTOR = (
+    "to_tsvector('simple', coalesce(filename, '') || ' ' || coalesce(camera_make, '') || ' ' || "
+    "coalesce(camera_model, '') || ' ' || coalesce(description, '') || ' ' || coalesce(tags, ''))"
+)
+
+PHOTO_TABLE = 'photo_metadata_photometadata'
+
+
+def sqlite_has_fts5(connection):
+    """Собран ли SQLite с FTS5."""
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    columns = ', '.join(SEARCH_FIELDS)
+    if vendor == 'sqlite':
+        # Без FTS5 таблица не создаётся: search.get_backend() не найдёт её
+        # и будет искать через LIKE
+        if not sqlite_has_fts5(schema_editor.connection):
+            return
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+            f"USING fts5({columns}, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, {columns}) SELECT id, {columns} FROM {PHOTO_TABLE}"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {POSTGRES_SEARCH_INDEX} "
+            f"ON {PHOTO_TABLE} USING GIN ({POSTGRES_SEARCH_VECTOR})"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {POSTGRES_SEARCH_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0002_importedfile_status_and_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:06
+
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_tags(apps, schema_editor):
+    PhotoMetadata = apps.get_model('photo_metadata', 'PhotoMetadata')
+    Tag = apps.get_model('photo_metadata', 'Tag')
+    PhotoTag = PhotoMetadata.tag_set.through
+
+    tag_ids = {}
+    links = []
+    photos = PhotoMetadata.objects.exclude(tags='').values_list('id', 'tags')
+    for photo_id, tags in photos.iterator(chunk_size=BATCH_SIZE):
+        names = (re.sub(r'\s+', ' ', name).strip().lower()[:100] for name in tags.split(','))
+        for name in dict.fromkeys(name for name in names if name):
+            if name not in tag_ids:
+                tag_ids[name] = Tag.objects.create(name=name).id
+            links.append(PhotoTag(photometadata_id=photo_id, tag_id=tag_ids[name]))
+        if len(links) >= BATCH_SIZE:
+            PhotoTag.objects.bulk_create(links)
+            links = []
+    PhotoTag.objects.bulk_create(links)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Тег')),
+            ],
+            options={
+                'verbose_name': 'Тег',
+                'verbose_name_plural': 'Теги',
+            },
+        ),
+        migrations.AddField(
+            model_name='photometadata',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='photos', to='photo_metadata.tag', verbose_name='Теги'),
+        ),
+        migrations.RunPython(backfill_tags, migrations.RunPython.noop),
+    ]
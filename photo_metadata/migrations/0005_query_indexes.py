@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0004_tags'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photometadata',
+            index=models.Index(fields=['created_date', 'id'], name='photo_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photometadata',
+            index=models.Index(fields=['camera_make', 'camera_model'], name='photo_camera_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photometadata',
+            index=models.Index(fields=['format', 'created_date'], name='photo_format_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photometadata',
+            index=models.Index(fields=['capture_date'], name='photo_capture_date_idx'),
+        ),
+    ]
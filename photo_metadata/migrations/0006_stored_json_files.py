@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:12
+
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Каталоги и типы файлов на момент миграции (см. file_index.py):
+# тогда файлы лежали прямо в каталогах, без шардов и сегментов
+DIRECTORY_TYPES = {
+    'json_files': 'created',
+    'json_uploads': 'uploaded',
+}
+
+
+def index_existing_files(apps, schema_editor):
+    StoredJSONFile = apps.get_model('photo_metadata', 'StoredJSONFile')
+    stored_files = []
+    for directory, file_type in DIRECTORY_TYPES.items():
+        full_directory = os.path.join(settings.MEDIA_ROOT, directory)
+        if not os.path.isdir(full_directory):
+            continue
+        with os.scandir(full_directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                modified = datetime.fromtimestamp(stat.st_mtime)
+                if settings.USE_TZ:
+                    modified = timezone.make_aware(modified)
+                stored_files.append(StoredJSONFile(
+                    name=entry.name,
+                    file_type=file_type,
+                    path=f'{directory}/{entry.name}',
+                    size=stat.st_size,
+                    modified=modified,
+                ))
+    StoredJSONFile.objects.bulk_create(stored_files, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredJSONFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('file_type', models.CharField(choices=[('created', 'Создан через форму'), ('uploaded', 'Загружен')], max_length=20, verbose_name='Тип')),
+                ('path', models.CharField(max_length=500, verbose_name='Путь относительно MEDIA_ROOT')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер (байт)')),
+                ('modified', models.DateTimeField(verbose_name='Дата изменения')),
+                ('record_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='Количество записей')),
+            ],
+            options={
+                'verbose_name': 'Сохранённый JSON файл',
+                'verbose_name_plural': 'Сохранённые JSON файлы',
+                'indexes': [models.Index(fields=['file_type', 'name'], name='stored_file_type_name_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0006_stored_json_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedjsonfile',
+            name='offset',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Смещение в сегменте'),
+        ),
+    ]
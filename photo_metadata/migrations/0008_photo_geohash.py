@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Копия geohash.encode на момент миграции
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 12
+
+
+def encode(latitude, longitude):
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # чётные биты — долгота, нечётные — широта
+    while len(chars) < PRECISION:
+        if even:
+            middle = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= middle:
+                value = value * 2 + 1
+                lon_range[0] = middle
+            else:
+                value *= 2
+                lon_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                value = value * 2 + 1
+                lat_range[0] = middle
+            else:
+                value *= 2
+                lat_range[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    PhotoMetadata = apps.get_model('photo_metadata', 'PhotoMetadata')
+    photos = PhotoMetadata.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude')
+    batch = []
+    for photo in photos.iterator(chunk_size=BATCH_SIZE):
+        photo.geohash = encode(photo.latitude, photo.longitude)
+        batch.append(photo)
+        if len(batch) >= BATCH_SIZE:
+            PhotoMetadata.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    PhotoMetadata.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0007_stored_file_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photometadata',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True, verbose_name='Geohash'),
+        ),
+        migrations.AddIndex(
+            model_name='photometadata',
+            index=models.Index(fields=['geohash'], name='photo_geohash_idx'),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
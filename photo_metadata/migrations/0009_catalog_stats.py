@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:28
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Case, Count, ExpressionWrapper, F, Value, When
+from django.db.models.functions import TruncMonth
+
+
+# Копия групп из stats.py на момент миграции: миграция не должна
+# зависеть от того, как stats.py изменится позже
+ISO_BUCKETS = [(100, '≤ 100'), (400, '101–400'), (1600, '401–1600'), (6400, '1601–6400')]
+ISO_TOP_BUCKET = '> 6400'
+RESOLUTION_CLASSES = [
+    (2_000_000, '< 2 Мп'), (8_000_000, '2–8 Мп'), (16_000_000, '8–16 Мп'), (24_000_000, '16–24 Мп'),
+]
+RESOLUTION_TOP_CLASS = '≥ 24 Мп'
+
+
+def build_stats(apps, schema_editor):
+    PhotoMetadata = apps.get_model('photo_metadata', 'PhotoMetadata')
+    CatalogStat = apps.get_model('photo_metadata', 'CatalogStat')
+    photos = PhotoMetadata.objects.order_by()
+    counts = Counter({('total', ''): photos.count()})
+
+    for dimension in ('format', 'camera_make'):
+        for row in photos.values(dimension).annotate(count=Count('id')):
+            counts[(dimension, row[dimension])] += row['count']
+
+    for row in photos.values('camera_make', 'camera_model').annotate(count=Count('id')):
+        counts[('camera_model', f"{row['camera_make']} {row['camera_model']}".strip())] += row['count']
+
+    iso = Case(
+        When(iso__isnull=True, then=Value('')),
+        *[When(iso__lte=bound, then=Value(label)) for bound, label in ISO_BUCKETS],
+        default=Value(ISO_TOP_BUCKET),
+    )
+    for row in photos.annotate(bucket=iso).values('bucket').annotate(count=Count('id')):
+        counts[('iso', row['bucket'])] += row['count']
+
+    pixels = ExpressionWrapper(F('width') * F('height'), output_field=models.BigIntegerField())
+    resolution = Case(
+        *[When(pixels__lt=bound, then=Value(label)) for bound, label in RESOLUTION_CLASSES],
+        default=Value(RESOLUTION_TOP_CLASS),
+    )
+    for row in photos.annotate(pixels=pixels, bucket=resolution).values('bucket').annotate(count=Count('id')):
+        counts[('resolution', row['bucket'])] += row['count']
+
+    for row in photos.annotate(month=TruncMonth('capture_date')).values('month').annotate(count=Count('id')):
+        counts[('capture_month', row['month'].strftime('%Y-%m') if row['month'] else '')] += row['count']
+
+    CatalogStat.objects.bulk_create([
+        CatalogStat(dimension=dimension, value=value, count=count)
+        for (dimension, value), count in counts.items()
+        if count
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0008_photo_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Всего'), ('format', 'Формат'), ('camera_make', 'Производитель камеры'), ('camera_model', 'Модель камеры'), ('iso', 'ISO'), ('resolution', 'Разрешение'), ('capture_month', 'Месяц съёмки')], max_length=20, verbose_name='Признак')),
+                ('value', models.CharField(blank=True, max_length=255, verbose_name='Значение')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Количество записей')),
+            ],
+            options={
+                'verbose_name': 'Статистика каталога',
+                'verbose_name_plural': 'Статистика каталога',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogstat',
+            constraint=models.UniqueConstraint(fields=('dimension', 'value'), name='catalog_stat_dimension_value_uniq'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:34
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Копия dedup.record_fingerprint на момент миграции
+FINGERPRINT_FIELDS = ('filename', 'format', 'file_size', 'width', 'height')
+
+
+def record_fingerprint(photo):
+    canonical = json.dumps([
+        photo.filename,
+        photo.format.upper(),
+        int(photo.file_size),
+        int(photo.width),
+        int(photo.height),
+    ], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    PhotoMetadata = apps.get_model('photo_metadata', 'PhotoMetadata')
+    batch = []
+    for photo in PhotoMetadata.objects.only(*FINGERPRINT_FIELDS).iterator(chunk_size=BATCH_SIZE):
+        photo.fingerprint = record_fingerprint(photo)
+        batch.append(photo)
+        if len(batch) >= BATCH_SIZE:
+            PhotoMetadata.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    PhotoMetadata.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0009_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importedfile',
+            name='sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='SHA-256 файла'),
+        ),
+        migrations.AddField(
+            model_name='photometadata',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Отпечаток записи'),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='importedfile',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'failed'), _negated=True), fields=('sha256',), name='imported_file_sha256_uniq'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0010_content_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата проверки')),
+                ('incremental', models.BooleanField(default=False, verbose_name='Только новые записи')),
+                ('last_photo_id', models.PositiveBigIntegerField(default=0, verbose_name='Проверены записи до id')),
+                ('checked_count', models.PositiveIntegerField(default=0, verbose_name='Проверено записей')),
+                ('pair_count', models.PositiveIntegerField(default=0, verbose_name='Найдено пар')),
+                ('cluster_count', models.PositiveIntegerField(default=0, verbose_name='Групп после проверки')),
+            ],
+            options={
+                'verbose_name': 'Проверка на похожие записи',
+                'verbose_name_plural': 'Проверки на похожие записи',
+            },
+        ),
+        migrations.CreateModel(
+            name='NearDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='near_duplicate_members', to='photo_metadata.photometadata', verbose_name='Группа')),
+                ('photo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='near_duplicate', to='photo_metadata.photometadata', verbose_name='Запись')),
+            ],
+            options={
+                'verbose_name': 'Похожая запись',
+                'verbose_name_plural': 'Похожие записи',
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+import django.core.validators
+from django.db import migrations, models
+
+MAX_FILENAME_LENGTH = 255
+
+
+def rename_duplicate_filenames(apps, schema_editor):
+    # До этой миграции имя файла в базе уникальным не было. Первая запись
+    # с именем сохраняет его, остальные получают суффикс со своим id
+    PhotoMetadata = apps.get_model('photo_metadata', 'PhotoMetadata')
+    seen = set(PhotoMetadata.objects.values_list('filename', flat=True))
+    taken = set()
+    for photo in PhotoMetadata.objects.order_by('id').only('id', 'filename'):
+        if photo.filename not in taken:
+            taken.add(photo.filename)
+            continue
+        suffix = f' ({photo.id})'
+        filename = photo.filename[:MAX_FILENAME_LENGTH - len(suffix)] + suffix
+        if filename in seen:
+            raise RuntimeError(f'Не удалось переименовать дубликат {photo.filename!r}: имя {filename!r} занято')
+        PhotoMetadata.objects.filter(id=photo.id).update(filename=filename)
+        seen.add(filename)
+        taken.add(filename)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0011_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_filenames, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='photometadata',
+            name='file_size',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Размер файла (байт)'),
+        ),
+        migrations.AlterField(
+            model_name='photometadata',
+            name='filename',
+            field=models.CharField(max_length=255, unique=True, verbose_name='Имя файла'),
+        ),
+        migrations.AlterField(
+            model_name='photometadata',
+            name='height',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Высота (px)'),
+        ),
+        migrations.AlterField(
+            model_name='photometadata',
+            name='width',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Ширина (px)'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='photometadata',
+            unique_together={('filename', 'format', 'file_size', 'width', 'height')},
+        ),
+    ]
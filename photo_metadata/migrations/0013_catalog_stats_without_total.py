@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+def delete_total(apps, schema_editor):
+    # Всего записей теперь считается суммой счётчиков по форматам
+    CatalogStat = apps.get_model('photo_metadata', 'CatalogStat')
+    CatalogStat.objects.filter(dimension='total').delete()
+
+
+def restore_total(apps, schema_editor):
+    CatalogStat = apps.get_model('photo_metadata', 'CatalogStat')
+    total = sum(CatalogStat.objects.filter(dimension='format').values_list('count', flat=True))
+    CatalogStat.objects.update_or_create(dimension='total', value='', defaults={'count': total})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0012_unique_filename'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_total, restore_total),
+        migrations.AlterField(
+            model_name='catalogstat',
+            name='dimension',
+            field=models.CharField(choices=[('format', 'Формат'), ('camera_make', 'Производитель камеры'), ('camera_model', 'Модель камеры'), ('iso', 'ISO'), ('resolution', 'Разрешение'), ('capture_month', 'Месяц съёмки')], max_length=20, verbose_name='Признак'),
+        ),
+    ]
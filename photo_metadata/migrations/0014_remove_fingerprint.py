@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0013_catalog_stats_without_total'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='photometadata',
+            name='fingerprint',
+        ),
+    ]
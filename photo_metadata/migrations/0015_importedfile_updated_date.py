@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photo_metadata', '0014_remove_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importedfile',
+            name='updated_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последнее обновление'),
+        ),
+    ]
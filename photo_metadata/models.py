@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 import os
 import uuid
 from django.core.validators import MinValueValidator
 
+from . import geohash
+
 class PhotoMetadata(models.Model):
     FORMAT_CHOICES = [
         ('JPEG', 'JPEG'),
@@ -38,17 +42,65 @@ class PhotoMetadata(models.Model):
     capture_date = models.DateTimeField(null=True, blank=True, verbose_name="Дата съемки")
     description = models.TextField(blank=True, verbose_name="Описание")
     tags = models.CharField(max_length=500, blank=True, verbose_name="Теги (через запятую)")
+    # Нормализованные теги; заполняются из поля tags при сохранении
+    tag_set = models.ManyToManyField('Tag', blank=True, related_name='photos', verbose_name="Теги")
+    # Geohash координат для поиска по области; заполняется при сохранении
+    geohash = models.CharField(max_length=geohash.MAX_PRECISION, null=True, blank=True, editable=False,
+                               verbose_name="Geohash")
     
     class Meta:
         verbose_name = "Метаданные фотографии"
         verbose_name_plural = "Метаданные фотографий"
         unique_together = ['filename', 'format', 'file_size', 'width', 'height']  
+        indexes = [
+            # Сортировка списков и keyset-пагинация по (created_date, id)
+            models.Index(fields=['created_date', 'id'], name='photo_created_id_idx'),
+            # Фильтры по камере в админке
+            models.Index(fields=['camera_make', 'camera_model'], name='photo_camera_idx'),
+            # Фильтр по формату с сортировкой по дате
+            models.Index(fields=['format', 'created_date'], name='photo_format_created_idx'),
+            # Диапазоны по дате съёмки
+            models.Index(fields=['capture_date'], name='photo_capture_date_idx'),
+            # Поиск по области и кластеры для карты (см. geo.py)
+            models.Index(fields=['geohash'], name='photo_geohash_idx'),
+        ]
     
     def __str__(self):
         return f"{self.filename} ({self.width}x{self.height})"
 
+    def update_geohash(self):
+        """Пересчитывает geohash по координатам.
+
+        Вызывается из save(), перед bulk_create (importer.bulk_insert)
+        и для loaddata (signals.fill_raw_photo_geohash);
+        QuerySet.update() координат geohash не обновляет.
+        """
+        if self.latitude is None or self.longitude is None:
+            self.geohash = None
+        else:
+            self.geohash = geohash.encode(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+class Tag(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="Тег")
+    
+    class Meta:
+        verbose_name = "Тег"
+        verbose_name_plural = "Теги"
+    
+    def __str__(self):
+        return self.name
+
 def get_upload_path(instance, filename):
-    ext = filename.split('.')[-1]
+    parts = filename.lower().split('.')
+    # Для сжатых файлов сохраняем и внутреннее расширение: data.jsonl.gz -> jsonl.gz
+    ext = '.'.join(parts[-2:]) if parts[-1] in ('gz', 'zst') and len(parts) > 2 else parts[-1]
     filename = f"{uuid.uuid4().hex}.{ext}"
     return os.path.join('json_uploads', filename)
 def clean(self):
@@ -56,13 +108,142 @@ def clean(self):
         raise ValidationError({'filename': 'Запись с таким именем файла уже существует'})
 
 class ImportedFile(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_DONE, 'Завершён'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    
     file = models.FileField(upload_to=get_upload_path, verbose_name="Файл JSON")
     upload_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+    # Обновляется при смене статуса и после каждой порции записей (см. tasks.py).
+    # Не auto_now: loaddata сохраняет записи в обход pre_save полей
+    updated_date = models.DateTimeField(default=timezone.now, verbose_name="Последнее обновление")
     is_valid = models.BooleanField(default=True, verbose_name="Валидный файл")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Статус импорта")
+    processed_count = models.PositiveIntegerField(default=0, verbose_name="Обработано записей")
+    added_count = models.PositiveIntegerField(default=0, verbose_name="Добавлено записей")
+    duplicate_count = models.PositiveIntegerField(default=0, verbose_name="Найдено дубликатов")
+    invalid_count = models.PositiveIntegerField(default=0, verbose_name="Некорректных записей")
+    error_message = models.TextField(blank=True, verbose_name="Ошибка")
+    sha256 = models.CharField(max_length=64, null=True, blank=True, editable=False, verbose_name="SHA-256 файла")
     
     class Meta:
         verbose_name = "Импортированный файл"
         verbose_name_plural = "Импортированные файлы"
+        constraints = [
+            # Один и тот же файл не импортируется дважды; после ошибки его можно загрузить снова
+            models.UniqueConstraint(
+                fields=['sha256'], condition=~models.Q(status='failed'), name='imported_file_sha256_uniq',
+            ),
+        ]
     
     def __str__(self):
         return f"{os.path.basename(self.file.name)}"
+
+class StoredJSONFile(models.Model):
+    TYPE_CREATED = 'created'
+    TYPE_UPLOADED = 'uploaded'
+    TYPE_CHOICES = [
+        (TYPE_CREATED, 'Создан через форму'),
+        (TYPE_UPLOADED, 'Загружен'),
+    ]
+    
+    name = models.CharField(max_length=255, unique=True, verbose_name="Имя файла")
+    file_type = models.CharField(max_length=20, choices=TYPE_CHOICES, verbose_name="Тип")
+    path = models.CharField(max_length=500, verbose_name="Путь относительно MEDIA_ROOT")
+    # Смещение записи внутри файла-сегмента; None для отдельных файлов
+    offset = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Смещение в сегменте")
+    size = models.PositiveBigIntegerField(verbose_name="Размер (байт)")
+    modified = models.DateTimeField(verbose_name="Дата изменения")
+    record_count = models.PositiveIntegerField(null=True, blank=True, verbose_name="Количество записей")
+    
+    class Meta:
+        verbose_name = "Сохранённый JSON файл"
+        verbose_name_plural = "Сохранённые JSON файлы"
+        indexes = [
+            models.Index(fields=['file_type', 'name'], name='stored_file_type_name_idx'),
+        ]
+    
+    def __str__(self):
+        return self.name
+    
+    @property
+    def is_segment_record(self):
+        return self.offset is not None
+    
+    @property
+    def url(self):
+        # Запись из сегмента нельзя скачать по прямой ссылке на файл
+        if self.is_segment_record:
+            return None
+        return f"{settings.MEDIA_URL}{self.path}"
+    
+    @property
+    def full_path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.path)
+
+class CatalogStat(models.Model):
+    """Число записей PhotoMetadata с данным значением признака (см. stats.py)."""
+
+    DIMENSION_CHOICES = [
+        ('format', 'Формат'),
+        ('camera_make', 'Производитель камеры'),
+        ('camera_model', 'Модель камеры'),
+        ('iso', 'ISO'),
+        ('resolution', 'Разрешение'),
+        ('capture_month', 'Месяц съёмки'),
+    ]
+    
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES, verbose_name="Признак")
+    value = models.CharField(max_length=255, blank=True, verbose_name="Значение")
+    count = models.BigIntegerField(default=0, verbose_name="Количество записей")
+    
+    class Meta:
+        verbose_name = "Статистика каталога"
+        verbose_name_plural = "Статистика каталога"
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='catalog_stat_dimension_value_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.dimension}={self.value}: {self.count}"
+
+class NearDuplicate(models.Model):
+    """Запись из группы похожих записей — одного снимка в разных размерах или форматах (см. neardup.py)."""
+
+    photo = models.OneToOneField(PhotoMetadata, on_delete=models.CASCADE, related_name='near_duplicate',
+                                 verbose_name="Запись")
+    # Группа обозначается записью с наименьшим id
+    cluster = models.ForeignKey(PhotoMetadata, on_delete=models.CASCADE, related_name='near_duplicate_members',
+                                verbose_name="Группа")
+    score = models.FloatField(verbose_name="Сходство")
+    
+    class Meta:
+        verbose_name = "Похожая запись"
+        verbose_name_plural = "Похожие записи"
+    
+    def __str__(self):
+        return f"{self.photo_id} в группе {self.cluster_id} ({self.score:.2f})"
+
+class DuplicateScan(models.Model):
+    """Проход поиска похожих записей; инкрементальный проход начинается с last_photo_id."""
+
+    finished_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата проверки")
+    incremental = models.BooleanField(default=False, verbose_name="Только новые записи")
+    last_photo_id = models.PositiveBigIntegerField(default=0, verbose_name="Проверены записи до id")
+    checked_count = models.PositiveIntegerField(default=0, verbose_name="Проверено записей")
+    pair_count = models.PositiveIntegerField(default=0, verbose_name="Найдено пар")
+    cluster_count = models.PositiveIntegerField(default=0, verbose_name="Групп после проверки")
+    
+    class Meta:
+        verbose_name = "Проверка на похожие записи"
+        verbose_name_plural = "Проверки на похожие записи"
+    
+    def __str__(self):
+        return f"{self.finished_date:%d.%m.%Y %H:%M}: {self.pair_count} пар"
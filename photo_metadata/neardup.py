@@ -0,0 +1,264 @@
+"""Поиск похожих записей: один снимок, сохранённый в разных размерах или форматах.
+
+unique_together ловит только точное совпадение ключа записи. Здесь
+кандидаты выбираются блоками: база сортирует записи по (производитель,
+модель, дата съёмки), и за один проход каждая запись сравнивается только
+с предыдущими записями той же камеры, снятыми не раньше чем за окно
+PHOTO_NEAR_DUPLICATE_WINDOW секунд, с тем же соотношением сторон. В памяти
+держится только текущее окно, а число сравнений растёт линейно, а не
+квадратично. Пары кандидатов оцениваются по сходству метаданных
+(similarity()), и пары выше порога объединяются в группы.
+
+Записи без даты съёмки не сравниваются. Группы хранятся в NearDuplicate
+и не пересчитываются при правке записей — после изменения метаданных
+нужен полный проход команды find_near_duplicates.
+"""
+import os
+from collections import deque
+from datetime import timedelta
+from difflib import SequenceMatcher
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+
+from .geo import distance_km
+from .models import DuplicateScan, NearDuplicate, PhotoMetadata
+from .tags import parse_tags
+
+DEFAULT_WINDOW = 5
+DEFAULT_ASPECT_TOLERANCE = 0.01
+DEFAULT_THRESHOLD = 0.75
+
+# Расстояние между местами съёмки, на котором их сходство падает до нуля, км
+LOCATION_SCALE_KM = 1.0
+
+# Веса признаков в similarity(); признак учитывается, только если известен у обеих записей
+WEIGHTS = {'capture_date': 2, 'filename': 2, 'exposure': 1, 'location': 1, 'tags': 1}
+EXPOSURE_FIELDS = ('exposure_time', 'aperture', 'iso', 'focal_length')
+
+FIELDS = (
+    'id', 'filename', 'width', 'height', 'camera_make', 'camera_model', 'capture_date',
+    'latitude', 'longitude', 'tags',
+) + EXPOSURE_FIELDS
+SORT_ORDER = ('camera_make', 'camera_model', 'capture_date', 'id')
+
+# Сколько блоков камеры выбирается одним запросом в инкрементальном режиме
+BLOCKS_PER_QUERY = 100
+
+
+def get_options():
+    """(окно по дате съёмки, допуск соотношения сторон, порог сходства) из настроек."""
+    return (
+        timedelta(seconds=getattr(settings, 'PHOTO_NEAR_DUPLICATE_WINDOW', DEFAULT_WINDOW)),
+        getattr(settings, 'PHOTO_NEAR_DUPLICATE_ASPECT_TOLERANCE', DEFAULT_ASPECT_TOLERANCE),
+        getattr(settings, 'PHOTO_NEAR_DUPLICATE_THRESHOLD', DEFAULT_THRESHOLD),
+    )
+
+
+def aspect_ratio(width, height):
+    # Повёрнутый снимок остаётся тем же: сравнивается отношение большей стороны к меньшей
+    return max(width, height) / min(width, height)
+
+
+def _known(value):
+    return value is not None and value != ''
+
+
+def similarity(a, b, window):
+    """Сходство метаданных двух записей от 0 до 1 — взвешенное среднее по признакам.
+
+    a и b — словари с полями FIELDS; window — окно по дате съёмки.
+    """
+    parts = []
+    seconds = window.total_seconds()
+    gap = abs((a['capture_date'] - b['capture_date']).total_seconds())
+    parts.append((WEIGHTS['capture_date'], max(0.0, 1 - gap / seconds) if seconds else 1.0))
+
+    stems = [os.path.splitext(record['filename'])[0].lower() for record in (a, b)]
+    parts.append((WEIGHTS['filename'], SequenceMatcher(None, *stems).ratio()))
+
+    for field in EXPOSURE_FIELDS:
+        if _known(a[field]) and _known(b[field]):
+            parts.append((WEIGHTS['exposure'], float(a[field] == b[field])))
+
+    if all(_known(record[field]) for record in (a, b) for field in ('latitude', 'longitude')):
+        distance = distance_km(a['latitude'], a['longitude'], b['latitude'], b['longitude'])
+        parts.append((WEIGHTS['location'], max(0.0, 1 - distance / LOCATION_SCALE_KM)))
+
+    tags = [set(parse_tags(record['tags'])) for record in (a, b)]
+    if tags[0] and tags[1]:
+        parts.append((WEIGHTS['tags'], len(tags[0] & tags[1]) / len(tags[0] | tags[1])))
+
+    return sum(weight * value for weight, value in parts) / sum(weight for weight, _ in parts)
+
+
+def candidate_pairs(rows, window, tolerance):
+    """Пары записей одной камеры, снятые в пределах окна, с тем же соотношением сторон.
+
+    rows должны быть отсортированы по SORT_ORDER.
+    """
+    active = deque()
+    for row in rows:
+        block = (row['camera_make'], row['camera_model'])
+        while active and (active[0][0] != block or row['capture_date'] - active[0][1]['capture_date'] > window):
+            active.popleft()
+        ratio = aspect_ratio(row['width'], row['height'])
+        for _, other, other_ratio in active:
+            if abs(ratio - other_ratio) <= tolerance * ratio:
+                yield other, row
+        active.append((block, row, ratio))
+
+
+def find_pairs(rows, window, tolerance, threshold, only=None):
+    """Пары (id, id, сходство) не ниже порога; only — учитывать только пары с этими записями."""
+    for a, b in candidate_pairs(rows, window, tolerance):
+        if only is not None and a['id'] not in only and b['id'] not in only:
+            continue
+        score = similarity(a, b, window)
+        if score >= threshold:
+            yield a['id'], b['id'], score
+
+
+class _Clusters:
+    """Объединение записей в группы (union-find); корень группы — наименьший id."""
+
+    def __init__(self):
+        self.parent = {}
+        self.score = {}
+
+    def find(self, pk):
+        self.parent.setdefault(pk, pk)
+        while self.parent[pk] != pk:
+            self.parent[pk] = self.parent[self.parent[pk]]
+            pk = self.parent[pk]
+        return pk
+
+    def _union(self, a, b):
+        first, second = self.find(a), self.find(b)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+    def _keep_score(self, pk, score):
+        self.score[pk] = max(self.score.get(pk, 0.0), score)
+
+    def add(self, a, b, score):
+        """Пара похожих записей."""
+        self._union(a, b)
+        self._keep_score(a, score)
+        self._keep_score(b, score)
+
+    def join(self, pk, cluster_id, score):
+        """Запись из уже сохранённой группы."""
+        self._union(pk, cluster_id)
+        self._keep_score(pk, score)
+
+    def rows(self):
+        return [NearDuplicate(photo_id=pk, cluster_id=self.find(pk), score=score) for pk, score in self.score.items()]
+
+
+def _photos():
+    return PhotoMetadata.objects.filter(capture_date__isnull=False)
+
+
+def _neighbour_rows(new_records, window):
+    """Записи тех же камер, что и новые, в диапазоне их дат съёмки с запасом на окно."""
+    blocks = list(
+        new_records.order_by().values('camera_make', 'camera_model')
+        .annotate(start=Min('capture_date'), end=Max('capture_date'))
+    )
+    for index in range(0, len(blocks), BLOCKS_PER_QUERY):
+        condition = reduce(or_, (
+            Q(camera_make=block['camera_make'], camera_model=block['camera_model'],
+              capture_date__range=(block['start'] - window, block['end'] + window))
+            for block in blocks[index:index + BLOCKS_PER_QUERY]
+        ))
+        yield from _photos().filter(condition).order_by(*SORT_ORDER).values(*FIELDS).iterator(chunk_size=2000)
+
+
+def scan(incremental=False, window=None, tolerance=None, threshold=None):
+    """Ищет похожие записи и сохраняет группы; возвращает созданный DuplicateScan.
+
+    В инкрементальном режиме с остальным каталогом сравниваются только
+    записи, добавленные после прошлой проверки, и найденные пары
+    присоединяются к уже сохранённым группам. Без прошлой проверки
+    выполняется полный проход.
+    """
+    default_window, default_tolerance, default_threshold = get_options()
+    window = default_window if window is None else window
+    tolerance = default_tolerance if tolerance is None else tolerance
+    threshold = default_threshold if threshold is None else threshold
+
+    previous = DuplicateScan.objects.order_by('-id').first()
+    incremental = incremental and previous is not None
+    # Записи, добавленные во время прохода, проверит следующий
+    last_photo_id = PhotoMetadata.objects.aggregate(last=Max('id'))['last'] or 0
+
+    if incremental:
+        new_records = _photos().filter(id__gt=previous.last_photo_id, id__lte=last_photo_id)
+        only = set(new_records.values_list('id', flat=True))
+        rows = _neighbour_rows(new_records, window) if only else []
+        checked = len(only)
+    else:
+        only = None
+        rows = _photos().filter(id__lte=last_photo_id).order_by(*SORT_ORDER).values(*FIELDS).iterator(chunk_size=2000)
+        checked = _photos().filter(id__lte=last_photo_id).count()
+
+    clusters = _Clusters()
+    pair_count = 0
+    for a, b, score in find_pairs(rows, window, tolerance, threshold, only):
+        clusters.add(a, b, score)
+        pair_count += 1
+
+    with transaction.atomic():
+        if incremental:
+            # Группы, к которым присоединяются новые записи, сохраняются заново целиком
+            existing = NearDuplicate.objects.filter(
+                cluster__in=NearDuplicate.objects.filter(photo__in=list(clusters.score)).values('cluster')
+            )
+            for photo_id, cluster_id, score in existing.values_list('photo_id', 'cluster_id', 'score'):
+                clusters.join(photo_id, cluster_id, score)
+            existing.delete()
+        else:
+            NearDuplicate.objects.all().delete()
+        NearDuplicate.objects.bulk_create(clusters.rows(), batch_size=1000)
+
+        return DuplicateScan.objects.create(
+            incremental=incremental,
+            last_photo_id=last_photo_id,
+            checked_count=checked,
+            pair_count=pair_count,
+            cluster_count=_groups().count(),
+        )
+
+
+def _groups():
+    return NearDuplicate.objects.values('cluster').annotate(size=Count('id')).filter(size__gte=2)
+
+
+def cluster_page(offset, limit):
+    """Группы с offset, крупные первыми: список {'id', 'size', 'members'}.
+
+    Первой в members идёт запись, обозначающая группу, остальные — по убыванию
+    разрешения. После удаления записей группа может сократиться до одной
+    записи — такие группы пропускаются.
+    """
+    groups = list(_groups().order_by('-size', 'cluster')[offset:offset + limit])
+    members = {group['cluster']: [] for group in groups}
+    rows = NearDuplicate.objects.filter(cluster__in=list(members)).select_related('photo')
+    for row in rows:
+        members[row.cluster_id].append(row)
+    for cluster_id, items in members.items():
+        items.sort(key=lambda row: (row.photo_id != cluster_id, -row.photo.width * row.photo.height, row.photo_id))
+    return [{'id': group['cluster'], 'size': group['size'], 'members': members[group['cluster']]} for group in groups]
+
+
+def similar_records(photo):
+    """Другие записи из группы, в которую входит photo, с их сходством."""
+    clusters = NearDuplicate.objects.filter(photo=photo).values('cluster')
+    return (
+        NearDuplicate.objects.filter(cluster__in=clusters).exclude(photo=photo)
+        .select_related('photo').order_by('-score', 'photo_id')
+    )
@@ -0,0 +1,185 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db import connection, models
+
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_page_size(request):
+    default = getattr(settings, 'PHOTO_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    max_size = getattr(settings, 'PHOTO_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return min(max(page_size, 1), max_size)
+
+
+def estimate_count(queryset):
+    """Быстрая оценка количества строк.
+
+    Для запроса без фильтров берётся статистика планировщика
+    (pg_class.reltuples в PostgreSQL, sqlite_stat1 после ANALYZE в SQLite),
+    иначе выполняется обычный COUNT(*).
+    """
+    if not queryset.query.where:
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+                row = cursor.fetchone()
+                if row and row[0] > 0:
+                    return row[0]
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+                if cursor.fetchone():
+                    cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx IS NULL", [table])
+                    row = cursor.fetchone()
+                    if row:
+                        return int(row[0].split()[0])
+    return queryset.count()
+
+
+def encode_offset_cursor(offset):
+    payload = json.dumps({'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_offset_cursor(cursor):
+    """Курсор для выдачи, упорядоченной по релевантности, где ключа для keyset нет."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset = json.loads(base64.urlsafe_b64decode(padded.encode()))['o']
+    except Exception:
+        raise InvalidCursor(cursor)
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursor(cursor)
+    return offset
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, prev_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Постраничный вывод по ключу (keyset/cursor pagination).
+
+    Вместо OFFSET следующая страница выбирается условием
+    "строго после последней записи" по полям ordering, поэтому время
+    ответа не зависит от номера страницы. Последнее поле ordering должно
+    быть уникальным (обычно id).
+    """
+
+    def __init__(self, queryset, ordering=('-created_date', '-id'), page_size=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-'))
+            for name in ordering
+        ]
+        self.page_size = page_size
+
+    def page(self, cursor=None):
+        queryset, values, backwards = self._page_query(cursor)
+        return self._make_page(list(queryset), values, backwards)
+
+    async def apage(self, cursor=None):
+        """То же, что page(), через асинхронный ORM."""
+        queryset, values, backwards = self._page_query(cursor)
+        return self._make_page([item async for item in queryset], values, backwards)
+
+    def _page_query(self, cursor):
+        if cursor:
+            values, direction = self.decode_cursor(cursor)
+        else:
+            values, direction = None, 'next'
+
+        backwards = direction == 'prev'
+        queryset = self.queryset.order_by(*self._order_by(reverse=backwards))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse=backwards))
+        return queryset[:self.page_size + 1], values, backwards
+
+    def _make_page(self, items, values, backwards):
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+
+        if backwards:
+            items.reverse()
+            next_cursor = self._cursor(items[-1], 'next') if items else None
+            prev_cursor = self._cursor(items[0], 'prev') if items and has_more else None
+        else:
+            next_cursor = self._cursor(items[-1], 'next') if items and has_more else None
+            prev_cursor = self._cursor(items[0], 'prev') if items and values is not None else None
+
+        return KeysetPage(items, next_cursor, prev_cursor)
+
+    def _order_by(self, reverse=False):
+        return [
+            f"{'-' if descending != reverse else ''}{name}"
+            for name, descending in self.ordering
+        ]
+
+    def _after(self, values, reverse=False):
+        # Для возрастающего порядка: (a, b) после (x, y) <=> a > x OR (a = x AND b > y)
+        condition = None
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = models.Q(**equal, **{f'{name}__{lookup}': value})
+            condition = step if condition is None else condition | step
+            equal[name] = value
+        return condition
+
+    def _value(self, item, name):
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def _cursor(self, item, direction):
+        values = []
+        for name, _ in self.ordering:
+            value = self._value(item, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            raw_values, direction = payload['v'], payload['d']
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            values = [
+                self.queryset.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, raw_values)
+            ]
+        except InvalidCursor:
+            raise
+        except Exception:
+            raise InvalidCursor(cursor)
+        return values, direction
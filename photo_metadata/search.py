@@ -0,0 +1,217 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+from .models import PhotoMetadata
+from .pagination import encode_offset_cursor, decode_offset_cursor
+
+SEARCH_FIELDS = ('filename', 'camera_make', 'camera_model', 'description', 'tags')
+
+SQLITE_FTS_TABLE = 'photo_metadata_photometadata_fts'
+# Веса полей для bm25 в порядке SEARCH_FIELDS
+SQLITE_FTS_WEIGHTS = (10.0, 5.0, 5.0, 1.0, 3.0)
+
+POSTGRES_SEARCH_INDEX = 'photo_metadata_photometadata_search_idx'
+POSTGRES_SEARCH_VECTOR = "to_tsvector('simple', {})".format(
+    " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+)
+
+
+def tokenize(query):
+    return re.findall(r'[^\W_]+', query.lower())
+
+
+def restrict_to(queryset, column):
+    """SQL-условие "column входит в queryset", если queryset что-то фильтрует."""
+    if queryset is None or not queryset.query.where:
+        return '', []
+    sql, params = queryset.order_by().values('id').query.sql_with_params()
+    return f" AND {column} IN ({sql})", list(params)
+
+
+class LikeSearchBackend:
+    """Поиск через LIKE '%q%' — используется, если полнотекстовый индекс недоступен."""
+
+    def filter(self, queryset, query):
+        return queryset.filter(
+            models.Q(filename__icontains=query) |
+            models.Q(camera_make__icontains=query) |
+            models.Q(camera_model__icontains=query) |
+            models.Q(description__icontains=query) |
+            models.Q(tags__icontains=query)
+        )
+
+    def ranked_ids(self, query, limit, offset=0, queryset=None):
+        if queryset is None:
+            queryset = PhotoMetadata.objects.all()
+        queryset = self.filter(queryset, query).order_by('-created_date', '-id')
+        return list(queryset.values_list('id', flat=True)[offset:offset + limit])
+
+    def index(self, instances):
+        pass
+
+    def remove(self, ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSBackend(LikeSearchBackend):
+    """Поиск по виртуальной таблице FTS5, rowid которой совпадает с id записи."""
+
+    def match_expression(self, query):
+        tokens = tokenize(query)
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s", [match]
+        ))
+
+    def ranked_ids(self, query, limit, offset=0, queryset=None):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in SQLITE_FTS_WEIGHTS)
+        restriction, params = restrict_to(queryset, 'rowid')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s{restriction} "
+                f"ORDER BY bm25({SQLITE_FTS_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                [match] + params + [limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, instances):
+        rows = [
+            [instance.pk] + [getattr(instance, field) or '' for field in SEARCH_FIELDS]
+            for instance in instances
+        ]
+        if not rows:
+            return
+        columns = ', '.join(SEARCH_FIELDS)
+        placeholders = ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s", [[row[0]] for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, {columns}) VALUES ({placeholders})", rows
+            )
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {SQLITE_FTS_TABLE} WHERE rowid = %s", [[pk] for pk in ids])
+
+    def rebuild(self):
+        columns = ', '.join(SEARCH_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SQLITE_FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SQLITE_FTS_TABLE} (rowid, {columns}) "
+                f"SELECT id, {columns} FROM {PhotoMetadata._meta.db_table}"
+            )
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE} ({SQLITE_FTS_TABLE}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """Поиск по GIN-индексу на выражении to_tsvector(...).
+
+    Индекс построен на самом выражении, поэтому PostgreSQL обновляет его
+    сам и синхронизация из сигналов не нужна.
+    """
+
+    def tsquery(self, query):
+        return ' & '.join(f'{token}:*' for token in tokenize(query))
+
+    def filter(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT id FROM {PhotoMetadata._meta.db_table} "
+            f"WHERE {POSTGRES_SEARCH_VECTOR} @@ to_tsquery('simple', %s)", [tsquery]
+        ))
+
+    def ranked_ids(self, query, limit, offset=0, queryset=None):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return []
+        restriction, params = restrict_to(queryset, 'id')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM {PhotoMetadata._meta.db_table} "
+                f"WHERE {POSTGRES_SEARCH_VECTOR} @@ to_tsquery('simple', %s){restriction} "
+                f"ORDER BY ts_rank({POSTGRES_SEARCH_VECTOR}, to_tsquery('simple', %s)) DESC, id "
+                f"LIMIT %s OFFSET %s",
+                [tsquery] + params + [tsquery, limit, offset]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_fts_available = {}
+
+
+def sqlite_fts_available():
+    """Есть ли в базе таблица FTS5; ответ запоминается для каждого файла базы."""
+    database = connection.settings_dict['NAME']
+    if database not in _fts_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [SQLITE_FTS_TABLE])
+            _fts_available[database] = cursor.fetchone() is not None
+    return _fts_available[database]
+
+
+def reset_fts_available(**kwargs):
+    # После migrate таблица FTS могла появиться или исчезнуть
+    _fts_available.clear()
+
+
+def get_backend():
+    if connection.vendor == 'sqlite' and sqlite_fts_available():
+        return SQLiteFTSBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return LikeSearchBackend()
+
+
+async def aget_backend():
+    # При первом вызове get_backend() проверяет наличие таблицы FTS запросом к базе
+    return await sync_to_async(get_backend)()
+
+
+def ranked_page(queryset, query, cursor, page_size):
+    """Страница результатов поиска по релевантности: (строки, next_cursor, prev_cursor).
+
+    queryset — результат .values(...) с полем id; у выдачи по релевантности
+    нет ключа для keyset, поэтому курсор хранит смещение.
+    """
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    ids = get_backend().ranked_ids(query, page_size + 1, offset, queryset=queryset)
+    rows = list(queryset.filter(id__in=ids[:page_size]))
+    return _ranked_result(rows, ids, offset, page_size)
+
+
+async def aranked_page(queryset, query, cursor, page_size):
+    """То же, что ranked_page(), для асинхронных представлений.
+
+    ranked_ids выполняет сырой SQL, у которого нет асинхронного варианта,
+    поэтому он вызывается через sync_to_async.
+    """
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    backend = await aget_backend()
+    ids = await sync_to_async(backend.ranked_ids)(query, page_size + 1, offset, queryset=queryset)
+    rows = [row async for row in queryset.filter(id__in=ids[:page_size])]
+    return _ranked_result(rows, ids, offset, page_size)
+
+
+def _ranked_result(rows, ids, offset, page_size):
+    rows = {row['id']: row for row in rows}
+    page_rows = [rows[pk] for pk in ids[:page_size] if pk in rows]
+    next_cursor = encode_offset_cursor(offset + page_size) if len(ids) > page_size else None
+    prev_cursor = encode_offset_cursor(max(offset - page_size, 0)) if offset else None
+    return page_rows, next_cursor, prev_cursor
@@ -0,0 +1,122 @@
+"""Преобразование PhotoMetadata в словари и JSON.
+
+Единый формат записи для API, страниц просмотра, поиска и выгрузки:
+Decimal и даты передаются строками (без потери точности), поля со
+значением None опускаются.
+
+Для списков записи читаются кортежами через values_list() — без
+создания объектов модели, а преобразование нужно только полям
+Decimal и дат, поэтому остальные значения копируются как есть.
+JSON кодируется orjson, если он установлен, иначе стандартным json.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import models
+
+from .models import PhotoMetadata
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RECORD_FIELDS = [
+    'id', 'filename', 'format', 'file_size', 'width', 'height',
+    'camera_make', 'camera_model', 'exposure_time', 'aperture', 'iso',
+    'focal_length', 'latitude', 'longitude', 'capture_date',
+    'description', 'tags', 'created_date',
+]
+# Поля, которые задаёт клиент; id и created_date назначает база
+EDITABLE_FIELDS = [name for name in RECORD_FIELDS if name not in ('id', 'created_date')]
+
+CHUNK_SIZE = 2000
+
+JSON_ENCODER = 'orjson' if orjson is not None else 'json'
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _converter(field):
+    if isinstance(field, models.DecimalField):
+        return str
+    if isinstance(field, (models.DateTimeField, models.DateField)):
+        return _isoformat
+    return None
+
+
+# Преобразование для каждого поля; None — значение подходит для JSON как есть
+CONVERTERS = {name: _converter(PhotoMetadata._meta.get_field(name)) for name in RECORD_FIELDS}
+
+
+def serialize_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def serialize_rows(rows, fields=None):
+    """Словари из кортежей values_list(*fields), по одному на строку."""
+    fields = fields or RECORD_FIELDS
+    converted = [
+        (position, name, CONVERTERS[name])
+        for position, name in enumerate(fields)
+        if CONVERTERS[name] is not None
+    ]
+    for row in rows:
+        record = dict(zip(fields, row))
+        for position, name, convert in converted:
+            value = row[position]
+            if value is not None:
+                record[name] = convert(value)
+        if None in row:
+            record = {name: value for name, value in record.items() if value is not None}
+        yield record
+
+
+def iter_serialized(queryset, fields=None, chunk_size=CHUNK_SIZE):
+    """Потоково сериализует queryset, не создавая объектов модели."""
+    fields = fields or RECORD_FIELDS
+    return serialize_rows(queryset.values_list(*fields).iterator(chunk_size=chunk_size), fields)
+
+
+def serialize_queryset(queryset, fields=None):
+    fields = fields or RECORD_FIELDS
+    return list(serialize_rows(queryset.values_list(*fields), fields))
+
+
+def serialize_record(record, fields=None):
+    """Словарь полей записи; record — объект модели или словарь из .values()."""
+    fields = fields or RECORD_FIELDS
+    if isinstance(record, dict):
+        row = tuple(record.get(name) for name in fields)
+    else:
+        row = tuple(getattr(record, name) for name in fields)
+    return next(serialize_rows([row], fields))
+
+
+def dumps(data):
+    """JSON в байтах UTF-8."""
+    if orjson is not None:
+        return orjson.dumps(data, default=serialize_value)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=serialize_value).encode('utf-8')
+
+
+def parse_fields(value):
+    """Разбирает параметр ?fields=a,b,c. Пустое значение — все поля."""
+    if not value:
+        return list(RECORD_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in RECORD_FIELDS]
+    if unknown:
+        raise InvalidFields(f"Неизвестные поля: {', '.join(unknown)}")
+    return fields
@@ -0,0 +1,164 @@
+"""Отдача сохранённых JSON файлов без чтения их в память.
+
+Файл целиком отдаётся через FileResponse: WSGI-сервер (gunicorn)
+передаёт его через sendfile, минуя Python. Поддерживаются условные
+запросы (ETag/Last-Modified → 304) и запрос одного диапазона байт
+(Range → 206), чтобы клиент мог докачивать и читать большой файл кусками.
+"""
+import io
+import mimetypes
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import storage
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range для одного диапазона: (начало, конец) включительно.
+
+    Возвращает None, если заголовка нет или он не поддерживается (несколько
+    диапазонов, другие единицы) — тогда отдаётся весь файл.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N — последние N байт
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+class _RangeReader:
+    """Файловый объект, который читает не больше length байт с текущей позиции.
+
+    fileno() отдаёт дескриптор исходного файла: gunicorn тогда передаёт
+    диапазон через sendfile (длину берёт из Content-Length), а серверы
+    без sendfile читают через read() и не выходят за границу диапазона.
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def _range_allowed(request, etag, last_modified):
+    # If-Range: диапазон отдаётся, только если файл не изменился
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(last_modified) <= if_range_date
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '')
+
+
+def _open_body(stored_file, as_attachment, accepts_gzip):
+    """Выбирает представление файла: (поток, размер или None, тип, Content-Encoding, имя)."""
+    if stored_file.is_segment_record:
+        # Запись из сегмента невелика — распаковываем её целиком
+        data = storage.read_segment_record(stored_file)
+        return io.BytesIO(data), len(data), 'application/json', None, stored_file.name
+
+    full_path = stored_file.full_path
+    compression = storage.detect_compression(full_path)
+    if as_attachment or compression is None:
+        # Файл отдаётся как есть, байт в байт
+        if compression:
+            content_type = f'application/{compression}'
+        else:
+            content_type = mimetypes.guess_type(stored_file.name)[0] or 'application/octet-stream'
+        return open(full_path, 'rb'), os.path.getsize(full_path), content_type, None, stored_file.name
+
+    name = stored_file.name
+    suffix = storage.COMPRESSION_SUFFIXES[compression]
+    if name.endswith(suffix):
+        name = name[:-len(suffix)]
+    if compression == 'gzip' and accepts_gzip:
+        # Клиент сам распакует gzip — отдаём сжатые байты без перекодирования
+        return open(full_path, 'rb'), os.path.getsize(full_path), 'application/json', 'gzip', name
+    # Распаковываем потоком: длина заранее неизвестна, диапазоны не поддерживаются
+    return storage.open_binary(full_path), None, 'application/json', None, name
+
+
+def serve_stored_file(request, stored_file, as_attachment=False):
+    """HTTP-ответ с содержимым файла из индекса StoredJSONFile."""
+    last_modified = stored_file.modified.timestamp()
+    accepts_gzip = _accepts_gzip(request)
+    # Сжатый файл отдаётся в двух представлениях — у каждого свой ETag
+    variant = '' if as_attachment or stored_file.is_segment_record else ('-gzip' if accepts_gzip else '-identity')
+    etag = f'"{stored_file.id}-{stored_file.size}-{int(last_modified)}{variant}"'
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if conditional is not None:
+        return conditional
+
+    body, size, content_type, encoding, filename = _open_body(stored_file, as_attachment, accepts_gzip)
+
+    if size is None:
+        response = StreamingHttpResponse(iter(lambda: body.read(STREAM_CHUNK_SIZE), b''), content_type=content_type)
+        response._resource_closers.append(body.close)
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            body.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range and _range_allowed(request, etag, last_modified):
+            start, end = byte_range
+            body.seek(start)
+            response = FileResponse(_RangeReader(body, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(body, content_type=content_type)
+            response['Content-Length'] = size
+        response['Accept-Ranges'] = 'bytes'
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    disposition = 'attachment' if as_attachment else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    return response
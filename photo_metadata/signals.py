@@ -0,0 +1,116 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import cache, search, stats, tags
+from .models import PhotoMetadata
+
+# bulk_create не отправляет post_save, поэтому импорт сообщает о новых
+# записях этим сигналом (аргумент instances — список сохранённых объектов)
+photos_bulk_created = Signal()
+# То же для bulk_update (importer.bulk_update): instances — изменённые объекты,
+# previous — прежние значения изменённых полей {id: {поле: значение}}
+photos_bulk_updated = Signal()
+
+post_migrate.connect(search.reset_fts_available, dispatch_uid='photo_metadata_reset_fts_available')
+
+
+@receiver(post_save, sender=PhotoMetadata)
+def index_saved_photo(sender, instance, **kwargs):
+    search.get_backend().index([instance])
+
+
+@receiver(post_save, sender=PhotoMetadata)
+def sync_saved_photo_tags(sender, instance, created, **kwargs):
+    if created and not instance.tags:
+        return
+    tags.sync_tags([instance], created=created)
+
+
+@receiver(post_delete, sender=PhotoMetadata)
+def unindex_deleted_photo(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(photos_bulk_created)
+@receiver(photos_bulk_updated)
+def index_bulk_created_photos(sender, instances, **kwargs):
+    search.get_backend().index(instances)
+
+
+@receiver(photos_bulk_created)
+def sync_bulk_created_photo_tags(sender, instances, **kwargs):
+    tags.sync_tags(instances, created=True)
+
+
+@receiver(photos_bulk_updated)
+def sync_bulk_updated_photo_tags(sender, instances, previous, **kwargs):
+    changed = [instance for instance in instances if 'tags' in previous[instance.pk]]
+    if changed:
+        tags.sync_tags(changed)
+
+
+@receiver(pre_save, sender=PhotoMetadata)
+def fill_raw_photo_geohash(sender, instance, raw=False, **kwargs):
+    # loaddata сохраняет записи с raw=True в обход PhotoMetadata.save()
+    if raw:
+        instance.update_geohash()
+
+
+@receiver(pre_save, sender=PhotoMetadata)
+def remember_photo_stats(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & set(stats.STAT_FIELDS):
+        return
+    # Значения до изменения: по ним из счётчиков вычитается прежний вклад записи
+    before = PhotoMetadata.objects.filter(pk=instance.pk).values(*stats.STAT_FIELDS).first()
+    if before is not None:
+        instance._stats_before = stats.stat_keys(before)
+
+
+@receiver(post_save, sender=PhotoMetadata)
+def update_saved_photo_stats(sender, instance, created, **kwargs):
+    before = instance.__dict__.pop('_stats_before', None)
+    if created:
+        stats.apply(Counter(stats.stat_keys(instance)))
+    elif before is not None:
+        deltas = Counter(stats.stat_keys(instance))
+        deltas.subtract(before)
+        stats.apply(deltas)
+
+
+@receiver(post_delete, sender=PhotoMetadata)
+def update_deleted_photo_stats(sender, instance, **kwargs):
+    deltas = Counter()
+    deltas.subtract(stats.stat_keys(instance))
+    stats.apply(deltas)
+
+
+@receiver(photos_bulk_created)
+def update_bulk_created_photo_stats(sender, instances, **kwargs):
+    stats.apply(stats.count_records(instances))
+
+
+@receiver(photos_bulk_updated)
+def update_bulk_updated_photo_stats(sender, instances, previous, **kwargs):
+    deltas = Counter()
+    for instance in instances:
+        changes = previous[instance.pk]
+        if not changes.keys() & set(stats.STAT_FIELDS):
+            continue
+        before = {name: changes.get(name, getattr(instance, name)) for name in stats.STAT_FIELDS}
+        deltas.update(stats.stat_keys(instance))
+        deltas.subtract(stats.stat_keys(before))
+    stats.apply(deltas)
+
+
+@receiver(post_save, sender=PhotoMetadata)
+@receiver(post_delete, sender=PhotoMetadata)
+@receiver(photos_bulk_created)
+@receiver(photos_bulk_updated)
+def invalidate_photo_cache(sender, raw=False, **kwargs):
+    # loaddata сохраняет записи с raw=True — кэш для них не сбрасывается
+    if not raw:
+        cache.invalidate()
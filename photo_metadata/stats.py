@@ -0,0 +1,183 @@
+"""Статистика каталога: число записей по формату, камере, ISO, разрешению и месяцу съёмки.
+
+Счётчики хранятся в таблице CatalogStat, по строке на пару
+(признак, значение), и обновляются на ходу сигналами (см. signals.py):
+при сохранении, удалении и массовом импорте записей. Поэтому страница
+статистики читает несколько сотен строк независимо от размера каталога.
+Общего счётчика нет: у каждой записи ровно один формат, поэтому всего
+записей — сумма счётчиков по форматам. Иначе одну строку 'total'
+обновляла бы каждая транзакция записи, и все они ждали бы друг друга.
+Изменения через QuerySet.update() сигналов не отправляют — после них
+счётчики пересчитываются командой rebuild_stats.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, ExpressionWrapper, F, Value, When
+from django.db.models.functions import TruncMonth
+
+from .models import CatalogStat, PhotoMetadata
+
+# Поля записи, от которых зависят счётчики
+STAT_FIELDS = ('format', 'camera_make', 'camera_model', 'iso', 'width', 'height', 'capture_date')
+
+# Верхние границы групп ISO (включительно); всё, что выше, — последняя группа
+ISO_BUCKETS = [(100, '≤ 100'), (400, '101–400'), (1600, '401–1600'), (6400, '1601–6400')]
+ISO_TOP_BUCKET = '> 6400'
+
+# Классы разрешения по числу пикселей (граница не включается)
+RESOLUTION_CLASSES = [
+    (2_000_000, '< 2 Мп'), (8_000_000, '2–8 Мп'), (16_000_000, '8–16 Мп'), (24_000_000, '16–24 Мп'),
+]
+RESOLUTION_TOP_CLASS = '≥ 24 Мп'
+
+# Порядок групп на странице; остальные признаки — по убыванию количества
+BUCKET_ORDER = {
+    'iso': [label for _, label in ISO_BUCKETS] + [ISO_TOP_BUCKET],
+    'resolution': [label for _, label in RESOLUTION_CLASSES] + [RESOLUTION_TOP_CLASS],
+}
+
+
+def iso_bucket(iso):
+    if iso is None:
+        return ''
+    for bound, label in ISO_BUCKETS:
+        if iso <= bound:
+            return label
+    return ISO_TOP_BUCKET
+
+
+def resolution_class(width, height):
+    pixels = width * height
+    for bound, label in RESOLUTION_CLASSES:
+        if pixels < bound:
+            return label
+    return RESOLUTION_TOP_CLASS
+
+
+def camera_label(make, model):
+    return f'{make} {model}'.strip()
+
+
+def stat_keys(record):
+    """Пары (признак, значение), в которых учитывается запись.
+
+    record — объект модели или словарь с полями STAT_FIELDS.
+    """
+    if not isinstance(record, dict):
+        record = {name: getattr(record, name) for name in STAT_FIELDS}
+    capture_date = record['capture_date']
+    return [
+        ('format', record['format']),
+        ('camera_make', record['camera_make']),
+        ('camera_model', camera_label(record['camera_make'], record['camera_model'])),
+        ('iso', iso_bucket(record['iso'])),
+        ('resolution', resolution_class(record['width'], record['height'])),
+        ('capture_month', capture_date.strftime('%Y-%m') if capture_date else ''),
+    ]
+
+
+def count_records(records):
+    deltas = Counter()
+    for record in records:
+        deltas.update(stat_keys(record))
+    return deltas
+
+
+def apply(deltas):
+    """Прибавляет к счётчикам изменения {(признак, значение): разница}.
+
+    Три запроса на вызов, сколько бы записей ни было учтено в deltas:
+    чтение строк, создание недостающих и одно UPDATE с CASE по id.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    dimensions = {dimension for dimension, _ in deltas}
+    values = {value for _, value in deltas}
+
+    def load_ids():
+        rows = CatalogStat.objects.filter(dimension__in=dimensions, value__in=values)
+        return {(dimension, value): pk for pk, dimension, value in rows.values_list('id', 'dimension', 'value')}
+
+    with transaction.atomic():
+        ids = load_ids()
+        missing = [key for key in deltas if key not in ids]
+        if missing:
+            CatalogStat.objects.bulk_create(
+                [CatalogStat(dimension=dimension, value=value) for dimension, value in missing],
+                ignore_conflicts=True,
+            )
+            ids = load_ids()
+        CatalogStat.objects.filter(id__in=[ids[key] for key in deltas]).update(
+            count=F('count') + Case(
+                *[When(id=ids[key], then=Value(delta)) for key, delta in deltas.items()],
+                output_field=BigIntegerField(),
+            )
+        )
+
+
+def rebuild(photo_model=PhotoMetadata, stat_model=CatalogStat):
+    """Пересчитывает все счётчики агрегатными запросами к PhotoMetadata.
+
+    Записи, сохранённые во время пересчёта, могут быть учтены неверно,
+    поэтому команду rebuild_stats лучше запускать, когда импорт не идёт.
+    Модели передаются параметрами для вызова из миграции.
+    """
+    photos = photo_model.objects.order_by()
+    counts = Counter()
+
+    for dimension in ('format', 'camera_make'):
+        for row in photos.values(dimension).annotate(count=Count('id')):
+            counts[(dimension, row[dimension])] += row['count']
+
+    for row in photos.values('camera_make', 'camera_model').annotate(count=Count('id')):
+        counts[('camera_model', camera_label(row['camera_make'], row['camera_model']))] += row['count']
+
+    iso = Case(
+        When(iso__isnull=True, then=Value('')),
+        *[When(iso__lte=bound, then=Value(label)) for bound, label in ISO_BUCKETS],
+        default=Value(ISO_TOP_BUCKET),
+    )
+    for row in photos.annotate(bucket=iso).values('bucket').annotate(count=Count('id')):
+        counts[('iso', row['bucket'])] += row['count']
+
+    pixels = ExpressionWrapper(F('width') * F('height'), output_field=BigIntegerField())
+    resolution = Case(
+        *[When(pixels__lt=bound, then=Value(label)) for bound, label in RESOLUTION_CLASSES],
+        default=Value(RESOLUTION_TOP_CLASS),
+    )
+    rows = photos.annotate(pixels=pixels, bucket=resolution).values('bucket').annotate(count=Count('id'))
+    for row in rows:
+        counts[('resolution', row['bucket'])] += row['count']
+
+    for row in photos.annotate(month=TruncMonth('capture_date')).values('month').annotate(count=Count('id')):
+        counts[('capture_month', row['month'].strftime('%Y-%m') if row['month'] else '')] += row['count']
+
+    with transaction.atomic():
+        stat_model.objects.all().delete()
+        stat_model.objects.bulk_create([
+            stat_model(dimension=dimension, value=value, count=count)
+            for (dimension, value), count in counts.items()
+            if count
+        ])
+    return counts
+
+
+def summary():
+    """Счётчики по признакам: {'total': N, 'format': [{'value', 'count'}, ...], ...}."""
+    result = {dimension: [] for dimension, _ in CatalogStat.DIMENSION_CHOICES}
+    for dimension, value, count in CatalogStat.objects.filter(count__gt=0).values_list('dimension', 'value', 'count'):
+        if dimension in result:
+            result[dimension].append({'value': value, 'count': count})
+    total = sum(item['count'] for item in result['format'])
+
+    for dimension, items in result.items():
+        if dimension in BUCKET_ORDER:
+            order = BUCKET_ORDER[dimension]
+            items.sort(key=lambda item: order.index(item['value']) if item['value'] in order else len(order))
+        elif dimension == 'capture_month':
+            items.sort(key=lambda item: item['value'] or '9999')
+        else:
+            items.sort(key=lambda item: (-item['count'], item['value']))
+    return {'total': total, **result}
@@ -0,0 +1,232 @@
+"""Хранилища JSON файлов, созданных через форму.
+
+Бэкенд выбирается настройкой PHOTO_JSON_STORAGE:
+
+* 'flat' — каждый файл отдельно в общем каталоге json_files (прежняя раскладка);
+* 'sharded' — каждый файл отдельно, но в подкаталогах по хэшу имени
+  (json_files/3f/a2/<имя>), чтобы в одном каталоге не копились миллионы файлов;
+* 'segments' — записи дописываются в общие файлы-сегменты
+  json_files/segments/segment-NNNNNN.jsonl, а смещение записи внутри
+  сегмента хранится в StoredJSONFile.offset.
+
+PHOTO_JSON_COMPRESSION включает сжатие: 'gzip' или 'zstd' (нужен пакет
+zstandard). В режиме сегментов каждая запись сжимается отдельным
+фреймом, поэтому сегмент целиком остаётся обычным .jsonl.gz/.jsonl.zst.
+
+Читаются файлы независимо от текущей настройки: сжатие определяется по
+сигнатуре, а записи из сегментов — по смещению в индексе.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import file_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows — остаётся только блокировка внутри процесса
+    fcntl = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+COMPRESSION_SUFFIXES = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+SEGMENTS_DIR = f'{file_index.JSON_FILES_DIR}/{file_index.SEGMENTS_SUBDIR}'
+
+DEFAULT_SHARD_DEPTH = 2
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImproperlyConfigured("Для сжатия zstd установите пакет zstandard")
+
+
+def compress(data, compression):
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.compress(data, mtime=0)
+    if compression == 'zstd':
+        _require_zstandard()
+        return zstandard.ZstdCompressor().compress(data)
+    raise ImproperlyConfigured(f"Неизвестный вид сжатия: {compression}")
+
+
+def decompress(data):
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    if data[:4] == ZSTD_MAGIC:
+        _require_zstandard()
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def detect_compression(file_path):
+    with open(file_path, 'rb') as f:
+        magic = f.read(4)
+    if magic[:2] == GZIP_MAGIC:
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+def open_binary(file_path):
+    """Открывает файл на чтение в байтах, распаковывая gzip и zstd на лету."""
+    compression = detect_compression(file_path)
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if compression == 'zstd':
+        _require_zstandard()
+        # read_across_frames: сегмент состоит из множества фреймов подряд
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True)
+    return open(file_path, 'rb')
+
+
+def open_text(file_path):
+    """Открывает файл на чтение как текст, распаковывая gzip и zstd на лету."""
+    return io.TextIOWrapper(open_binary(file_path), encoding='utf-8', newline='')
+
+
+def read_segment_record(stored_file):
+    """Возвращает распакованные байты записи из сегмента."""
+    with open(stored_file.full_path, 'rb') as f:
+        f.seek(stored_file.offset)
+        data = f.read(stored_file.size)
+    return decompress(data)
+
+
+def open_stored_file(stored_file):
+    """Открывает файл из индекса StoredJSONFile как текст."""
+    if stored_file.offset is None:
+        return open_text(stored_file.full_path)
+    return io.StringIO(read_segment_record(stored_file).decode('utf-8'), newline='')
+
+
+def shard_path(directory, filename, depth=DEFAULT_SHARD_DEPTH):
+    # Имена и так случайные (uuid), но хэш даёт равномерное
+    # распределение и для произвольных имён
+    digest = hashlib.md5(filename.encode('utf-8')).hexdigest()
+    shards = [digest[level * 2:level * 2 + 2] for level in range(depth)]
+    return '/'.join([directory, *shards, filename])
+
+
+def _record_count(data):
+    return len(data) if isinstance(data, list) else 1
+
+
+class FlatStorage:
+    """Один файл на каждое сохранение в общем каталоге json_files."""
+
+    def __init__(self, compression=None):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ImproperlyConfigured(f"Неизвестный вид сжатия: {compression}")
+        if compression == 'zstd':
+            _require_zstandard()
+        self.compression = compression
+
+    def relative_path(self, filename):
+        return f'{file_index.JSON_FILES_DIR}/{filename}'
+
+    def save(self, data, filename):
+        content = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        relative_path = self.relative_path(filename + COMPRESSION_SUFFIXES[self.compression])
+        file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        with open(file_path, 'wb') as f:
+            f.write(compress(content, self.compression))
+
+        return file_index.register_file(relative_path, record_count=_record_count(data))
+
+
+class ShardedStorage(FlatStorage):
+    """Один файл на каждое сохранение в подкаталогах по хэшу имени."""
+
+    def __init__(self, compression=None, depth=DEFAULT_SHARD_DEPTH):
+        super().__init__(compression)
+        self.depth = depth
+
+    def relative_path(self, filename):
+        return shard_path(file_index.JSON_FILES_DIR, filename, self.depth)
+
+
+class SegmentStorage(FlatStorage):
+    """Дописывает записи в общие файлы-сегменты.
+
+    Каждая запись — одна строка JSON Lines (отдельный фрейм при сжатии).
+    Новый сегмент начинается, когда текущий превысит segment_size.
+    Запись в сегмент сериализуется блокировкой, общей для потоков
+    процесса и (через flock) для разных процессов.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, compression=None, segment_size=DEFAULT_SEGMENT_SIZE):
+        super().__init__(compression)
+        self.segment_size = segment_size
+
+    def _segment_name(self, number):
+        return f'segment-{number:06d}.jsonl{COMPRESSION_SUFFIXES[self.compression]}'
+
+    def _current_segment(self, directory, size):
+        segments = sorted(name for name in os.listdir(directory) if name.startswith('segment-'))
+        if not segments:
+            return self._segment_name(1)
+        last = segments[-1]
+        number = int(last.split('.')[0].split('-')[1])
+        if last != self._segment_name(number):
+            # Сегмент записан с другим сжатием — его продолжать нельзя
+            return self._segment_name(number + 1)
+        last_size = os.path.getsize(os.path.join(directory, last))
+        if last_size and last_size + size > self.segment_size:
+            return self._segment_name(number + 1)
+        return last
+
+    def save(self, data, filename):
+        line = json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+        content = compress(line.encode('utf-8'), self.compression)
+        directory = os.path.join(settings.MEDIA_ROOT, SEGMENTS_DIR)
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock, open(os.path.join(directory, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            segment = self._current_segment(directory, len(content))
+            with open(os.path.join(directory, segment), 'ab') as f:
+                offset = f.tell()
+                f.write(content)
+
+        return file_index.register_segment_record(
+            filename, f'{SEGMENTS_DIR}/{segment}', offset, len(content),
+            record_count=_record_count(data),
+        )
+
+
+def get_storage():
+    backend = getattr(settings, 'PHOTO_JSON_STORAGE', 'flat')
+    compression = getattr(settings, 'PHOTO_JSON_COMPRESSION', None)
+    if backend == 'flat':
+        return FlatStorage(compression)
+    if backend == 'sharded':
+        return ShardedStorage(compression, getattr(settings, 'PHOTO_JSON_SHARD_DEPTH', DEFAULT_SHARD_DEPTH))
+    if backend == 'segments':
+        return SegmentStorage(compression, getattr(settings, 'PHOTO_JSON_SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE))
+    raise ImproperlyConfigured(f"Неизвестное хранилище JSON файлов: {backend}")
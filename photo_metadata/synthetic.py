@@ -0,0 +1,105 @@
+"""Генерация синтетического каталога для нагрузочных тестов и бенчмарков."""
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.db.models import Max
+
+from .importer import PhotoMetadataImporter
+from .models import PhotoMetadata
+
+CAMERAS = [
+    ('Canon', ['EOS 5D Mark IV', 'EOS R5', 'EOS 90D', 'EOS 2000D']),
+    ('Nikon', ['D850', 'Z6 II', 'D3500']),
+    ('Sony', ['A7 III', 'A7R IV', 'RX100 VII']),
+    ('Apple', ['iPhone 13', 'iPhone 14 Pro', 'iPhone 15']),
+    ('Samsung', ['Galaxy S22', 'Galaxy S23 Ultra']),
+    ('Fujifilm', ['X-T4', 'X100V']),
+    ('', ['']),
+]
+# Распределение производителей: телефоны и Canon встречаются чаще всего
+CAMERA_WEIGHTS = [25, 15, 15, 25, 10, 5, 5]
+
+FORMATS = ['JPEG', 'PNG', 'TIFF', 'GIF', 'BMP']
+FORMAT_WEIGHTS = [80, 12, 5, 2, 1]
+
+RESOLUTIONS = [(1920, 1080), (3840, 2160), (4032, 3024), (6000, 4000), (8256, 5504), (1280, 720), (800, 600)]
+RESOLUTION_WEIGHTS = [20, 15, 30, 20, 5, 7, 3]
+
+TAGS = [
+    'пейзаж', 'природа', 'лето', 'зима', 'город', 'портрет', 'семья', 'море', 'горы', 'закат',
+    'архитектура', 'еда', 'путешествия', 'животные', 'ночь', 'улица', 'спорт', 'цветы', 'осень', 'весна',
+]
+# Частоты тегов по закону Ципфа
+TAG_WEIGHTS = [1 / rank for rank in range(1, len(TAGS) + 1)]
+
+APERTURES = ['1.4', '1.8', '2.0', '2.8', '4.0', '5.6', '8.0', '11.0', '16.0']
+ISO_VALUES = [100, 200, 400, 800, 1600, 3200, 6400]
+EXPOSURES = ['1/4000', '1/1000', '1/250', '1/125', '1/60', '1/30', '1/2', '2']
+
+# Места съёмки: (широта, долгота) крупных городов, вокруг которых рассеиваются фото
+PLACES = [(55.7558, 37.6173), (59.9343, 30.3351), (48.8566, 2.3522), (40.7128, -74.0060), (35.6762, 139.6503)]
+
+START_DATE = datetime(2015, 1, 1)
+
+
+def generate_records(count, seed=0, prefix='synthetic'):
+    """Возвращает генератор словарей в формате, который принимает импорт."""
+    rng = random.Random(seed)
+    for number in range(count):
+        make, models = rng.choices(CAMERAS, CAMERA_WEIGHTS)[0]
+        width, height = rng.choices(RESOLUTIONS, RESOLUTION_WEIGHTS)[0]
+        if rng.random() < 0.3:
+            width, height = height, width
+        photo_format = rng.choices(FORMATS, FORMAT_WEIGHTS)[0]
+
+        record = {
+            'filename': f'{prefix}_{seed}_{number:08d}.{photo_format.lower()}',
+            'format': photo_format,
+            'file_size': width * height * rng.randint(1, 6) // 4,
+            'width': width,
+            'height': height,
+            'camera_make': make,
+            'camera_model': rng.choice(models),
+            'tags': ', '.join(set(rng.choices(TAGS, TAG_WEIGHTS, k=rng.randint(0, 4)))),
+            'description': '',
+        }
+        if make:
+            record.update({
+                'exposure_time': rng.choice(EXPOSURES),
+                'aperture': rng.choice(APERTURES),
+                'iso': rng.choice(ISO_VALUES),
+                'focal_length': f'{rng.randint(14, 200)}.0',
+                'capture_date': (START_DATE + timedelta(seconds=rng.randint(0, 10 * 365 * 86400))).isoformat(),
+            })
+        if rng.random() < 0.6:
+            latitude, longitude = rng.choice(PLACES)
+            record['latitude'] = f'{latitude + rng.uniform(-0.5, 0.5):.6f}'
+            record['longitude'] = f'{longitude + rng.uniform(-0.5, 0.5):.6f}'
+        if rng.random() < 0.2:
+            record['description'] = f'Снимок {number} из серии {rng.choice(TAGS)}'
+        yield record
+
+
+def seed_catalog(count, seed=0, batch_size=None, prefix='synthetic'):
+    importer = PhotoMetadataImporter(batch_size=batch_size)
+    return importer.run(generate_records(count, seed=seed, prefix=prefix))
+
+
+@contextmanager
+def temporary_catalog(count, seed=0, batch_size=None, prefix='benchmark'):
+    """Добавляет count синтетических записей на время блока и удаляет их при выходе.
+
+    Для бенчмарков, которые обращаются к базе из нескольких потоков или
+    процессов: откат транзакции их записи от других соединений бы скрыл.
+    Удаляются только записи, добавленные здесь, даже если блок завершился
+    ошибкой.
+    """
+    last_id = PhotoMetadata.objects.aggregate(last=Max('id'))['last'] or 0
+    try:
+        if count > 0:
+            seed_catalog(count, seed=seed, batch_size=batch_size, prefix=prefix)
+        yield
+    finally:
+        if count > 0:
+            PhotoMetadata.objects.filter(id__gt=last_id, filename__startswith=f'{prefix}_{seed}_').delete()
@@ -0,0 +1,64 @@
+import re
+
+from django.db.models import Count
+
+from .models import PhotoMetadata, Tag
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def normalize_tag(name):
+    return re.sub(r'\s+', ' ', name).strip().lower()[:TAG_MAX_LENGTH]
+
+
+def parse_tags(value):
+    """Разбирает строку "пейзаж, природа, лето" в список нормализованных тегов."""
+    names = (normalize_tag(name) for name in (value or '').split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def get_tag_ids(names):
+    """Возвращает {имя: id}, создавая недостающие теги одним bulk_create."""
+    if not names:
+        return {}
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in tag_ids]
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        tag_ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+    return tag_ids
+
+
+def sync_tags(photos, created=False):
+    """Приводит связи фото-тег в соответствие строковому полю tags."""
+    photo_tags = {photo.pk: parse_tags(photo.tags) for photo in photos}
+    tag_ids = get_tag_ids(set().union(*photo_tags.values()))
+
+    PhotoTag = PhotoMetadata.tag_set.through
+    if not created:
+        PhotoTag.objects.filter(photometadata_id__in=list(photo_tags)).delete()
+    PhotoTag.objects.bulk_create(
+        [
+            PhotoTag(photometadata_id=photo_id, tag_id=tag_ids[name])
+            for photo_id, names in photo_tags.items()
+            for name in names
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def filter_by_tags(queryset, tags):
+    for tag in tags:
+        queryset = queryset.filter(tag_set__name=normalize_tag(tag))
+    return queryset
+
+
+def tag_facets(queryset, limit=20):
+    """Самые частые теги среди записей queryset — одним агрегирующим запросом."""
+    return list(
+        Tag.objects
+        .filter(photos__in=queryset.order_by().values('id'))
+        .annotate(count=Count('photos'))
+        .order_by('-count', 'name')
+        .values('name', 'count')[:limit]
+    )
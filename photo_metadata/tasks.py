@@ -0,0 +1,163 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import file_index
+from .importer import PhotoMetadataImporter
+from .models import ImportedFile
+from .utils import JSONFileProcessor
+
+logger = logging.getLogger(__name__)
+
+# Импорт в очереди или в работе, не обновлявшийся столько секунд, считается
+# зависшим: пул потоков живёт в процессе, и после перезапуска его задачи теряются
+DEFAULT_STALE_AFTER = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PHOTO_IMPORT_WORKERS', 2),
+                thread_name_prefix='photo-import',
+            )
+        return _executor
+
+
+def enqueue_import(imported_file_id):
+    """Ставит импорт файла в очередь локального пула потоков.
+
+    При PHOTO_IMPORT_ASYNC = False импорт выполняется сразу, в текущем потоке.
+    """
+    if getattr(settings, 'PHOTO_IMPORT_ASYNC', True):
+        get_executor().submit(run_import, imported_file_id)
+    else:
+        run_import(imported_file_id)
+
+
+def stale_filter(stale_after=None):
+    """Условие для импортов в очереди или в работе, которые давно не обновлялись."""
+    if stale_after is None:
+        stale_after = getattr(settings, 'PHOTO_IMPORT_STALE_AFTER', DEFAULT_STALE_AFTER)
+    return Q(
+        status__in=[ImportedFile.STATUS_PENDING, ImportedFile.STATUS_PROCESSING],
+        updated_date__lt=timezone.now() - timedelta(seconds=stale_after),
+    )
+
+
+def can_retry(imported_file):
+    """Упавший (но валидный) или зависший импорт можно запустить заново."""
+    return ImportedFile.objects.filter(
+        Q(status=ImportedFile.STATUS_FAILED, is_valid=True) | stale_filter(),
+        pk=imported_file.pk,
+    ).exists()
+
+
+def reset_import(imported_file_id, stale_after=None):
+    """Возвращает упавший или зависший импорт в очередь со сброшенными счётчиками.
+
+    Запустить его после этого нужно через enqueue_import или run_import.
+    Записи, добавленные прошлой попыткой, при повторе посчитаются дубликатами.
+    Возвращает False, если импорт идёт, завершён или тот же файл уже
+    загружен заново.
+    """
+    try:
+        return bool(ImportedFile.objects.filter(
+            Q(status=ImportedFile.STATUS_FAILED, is_valid=True) | stale_filter(stale_after),
+            pk=imported_file_id,
+        ).update(
+            status=ImportedFile.STATUS_PENDING,
+            processed_count=0,
+            added_count=0,
+            duplicate_count=0,
+            invalid_count=0,
+            error_message='',
+            updated_date=timezone.now(),
+        ))
+    except IntegrityError:
+        # Упавший файл загружен повторно и уже импортируется (imported_file_sha256_uniq)
+        return False
+
+
+def fail_stale_imports(stale_after=None):
+    """Помечает зависшие импорты ошибкой; их можно запустить заново из формы загрузки."""
+    return ImportedFile.objects.filter(stale_filter(stale_after)).update(
+        status=ImportedFile.STATUS_FAILED,
+        error_message='Импорт прерван: процесс, который его выполнял, остановлен',
+        updated_date=timezone.now(),
+    )
+
+
+def _heartbeat(imported_file_id):
+    # Проверка большого файла идёт долго, а до её конца счётчики не меняются:
+    # без отметки времени живой импорт сочли бы зависшим и запустили второй раз
+    ImportedFile.objects.filter(pk=imported_file_id, status=ImportedFile.STATUS_PROCESSING).update(
+        updated_date=timezone.now(),
+    )
+
+
+def _save_progress(imported_file_id, stats, **extra):
+    ImportedFile.objects.filter(pk=imported_file_id).update(
+        processed_count=stats.processed,
+        added_count=stats.added,
+        duplicate_count=stats.duplicates,
+        invalid_count=stats.invalid,
+        updated_date=timezone.now(),
+        **extra
+    )
+
+
+def run_import(imported_file_id):
+    close_old_connections()
+    try:
+        # Импорт берёт тот, кто первым переведёт его из очереди в работу:
+        # повторно поставленный в очередь импорт не выполнится дважды
+        claimed = ImportedFile.objects.filter(pk=imported_file_id, status=ImportedFile.STATUS_PENDING).update(
+            status=ImportedFile.STATUS_PROCESSING, updated_date=timezone.now(),
+        )
+        if not claimed:
+            return
+        imported_file = ImportedFile.objects.get(pk=imported_file_id)
+        file_path = imported_file.file.path
+
+        file_index.register_file(imported_file.file.name)
+        
+        is_valid, message = JSONFileProcessor.validate_json_file(
+            file_path, on_progress=lambda count: _heartbeat(imported_file_id)
+        )
+        if not is_valid:
+            file_index.unregister_file(imported_file.file.name)
+            imported_file.file.delete(save=False)
+            ImportedFile.objects.filter(pk=imported_file_id).update(
+                is_valid=False,
+                status=ImportedFile.STATUS_FAILED,
+                error_message=message,
+                updated_date=timezone.now(),
+            )
+            return
+
+        importer = PhotoMetadataImporter(
+            on_progress=lambda stats: _save_progress(imported_file_id, stats)
+        )
+        stats = importer.run(JSONFileProcessor.iter_records(file_path))
+        _save_progress(imported_file_id, stats, status=ImportedFile.STATUS_DONE)
+        file_index.register_file(imported_file.file.name, record_count=stats.processed)
+    except Exception as e:
+        logger.exception("Ошибка импорта файла %s", imported_file_id)
+        ImportedFile.objects.filter(pk=imported_file_id).update(
+            status=ImportedFile.STATUS_FAILED,
+            error_message=str(e),
+            updated_date=timezone.now(),
+        )
+    finally:
+        close_old_connections()
@@ -1,3 +1,994 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+
+from . import cache as photo_cache
+from . import columnar, db, file_index, geo, metrics, neardup, search, stats, storage, tasks, writes
+from .importer import PhotoMetadataImporter
+from .management.commands import benchmark_snapshot
+from .models import CatalogStat, ImportedFile, NearDuplicate, PhotoMetadata, StoredJSONFile
+from .pagination import InvalidCursor, KeysetPaginator
+from .synthetic import seed_catalog
+from .utils import JSONFileProcessor
+
+
+API_TOKEN = 'test-token'
+
+
+def make_record(filename, **fields):
+    record = {'filename': filename, 'format': 'JPEG', 'file_size': 1024, 'width': 640, 'height': 480}
+    record.update(fields)
+    return record
+
+
+class ImporterTests(TestCase):
+    def test_imports_valid_records(self):
+        stats = PhotoMetadataImporter().run([make_record('a.jpg'), make_record('b.jpg', aperture=2.8)])
+
+        self.assertEqual((stats.added, stats.duplicates, stats.invalid), (2, 0, 0))
+        self.assertEqual(str(PhotoMetadata.objects.get(filename='b.jpg').aperture), '2.8')
+
+    def test_counts_duplicates_in_file_and_in_database(self):
+        PhotoMetadata.objects.create(**make_record('existing.jpg'))
+
+        stats = PhotoMetadataImporter().run([
+            make_record('new.jpg'),
+            make_record('new.jpg'),
+            # Имя файла уникально: запись с другими размерами — тоже дубликат
+            make_record('existing.jpg', width=100),
+        ])
+
+        self.assertEqual((stats.added, stats.duplicates, stats.invalid), (1, 2, 0))
+        self.assertEqual(PhotoMetadata.objects.count(), 2)
+        self.assertEqual(PhotoMetadata.objects.get(filename='existing.jpg').width, 640)
+
+    def test_counts_invalid_records(self):
+        stats = PhotoMetadataImporter().run([
+            {'filename': 'no-size.jpg', 'format': 'JPEG'},
+            make_record('unknown-key.jpg', colour='red'),
+            make_record('bad-format.jpg', format='WEBP'),
+            make_record('zero-width.jpg', width=0),
+            'not an object',
+        ])
+
+        self.assertEqual((stats.added, stats.duplicates, stats.invalid), (0, 0, 5))
+        self.assertFalse(PhotoMetadata.objects.exists())
+
+    def test_ignores_generated_fields(self):
+        PhotoMetadataImporter().run([make_record('a.jpg', id=999, geohash='zzz', latitude=55.75, longitude=37.62)])
+
+        photo = PhotoMetadata.objects.get(filename='a.jpg')
+        self.assertNotEqual(photo.id, 999)
+        self.assertTrue(photo.geohash.startswith('ucfv'))
+
+    def test_falls_back_to_one_by_one_on_integrity_error(self):
+        # Параллельный импорт успел вставить запись между проверкой и bulk_create
+        PhotoMetadata.objects.create(**make_record('taken.jpg'))
+        with mock.patch.object(PhotoMetadataImporter, '_write', side_effect=IntegrityError):
+            stats = PhotoMetadataImporter().run([make_record('taken.jpg'), make_record('free.jpg')])
+
+        self.assertEqual((stats.added, stats.duplicates), (1, 1))
+        self.assertTrue(PhotoMetadata.objects.filter(filename='free.jpg').exists())
+
+    def test_reports_progress_per_batch(self):
+        progress = []
+        importer = PhotoMetadataImporter(batch_size=2, on_progress=lambda stats: progress.append(stats.processed))
+
+        importer.run([make_record(f'{number}.jpg') for number in range(5)])
+
+        self.assertEqual(progress, [2, 4, 5])
+
+    def test_dry_run_does_not_write(self):
+        stats = PhotoMetadataImporter(dry_run=True).run([make_record('a.jpg')])
+
+        self.assertEqual(stats.added, 1)
+        self.assertFalse(PhotoMetadata.objects.exists())
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        PhotoMetadataImporter().run([make_record(f'{number}.jpg') for number in range(7)])
+        # Одинаковая дата у нескольких записей: порядок между ними задаёт id
+        ids = list(PhotoMetadata.objects.order_by('id').values_list('id', flat=True))
+        PhotoMetadata.objects.filter(id__in=ids[:4]).update(created_date=datetime(2024, 1, 1))
+        PhotoMetadata.objects.filter(id__in=ids[4:]).update(created_date=datetime(2024, 1, 2))
+        cls.expected = list(PhotoMetadata.objects.order_by('-created_date', '-id').values_list('id', flat=True))
+
+    def walk_forward(self, paginator):
+        pages = []
+        page = paginator.page()
+        pages.append([photo.id for photo in page])
+        while page.has_next:
+            page = paginator.page(page.next_cursor)
+            pages.append([photo.id for photo in page])
+        return pages, page
+
+    def test_next_cursors_visit_every_record_once(self):
+        pages, last = self.walk_forward(KeysetPaginator(PhotoMetadata.objects.all(), page_size=3))
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertIsNone(last.next_cursor)
+
+    def test_prev_cursors_return_previous_pages(self):
+        paginator = KeysetPaginator(PhotoMetadata.objects.all(), page_size=3)
+        pages, page = self.walk_forward(paginator)
+
+        backwards = []
+        while page.has_previous:
+            page = paginator.page(page.prev_cursor)
+            backwards.append([photo.id for photo in page])
+
+        self.assertEqual(backwards, pages[-2::-1])
+        self.assertFalse(page.has_previous)
+
+    def test_new_record_does_not_shift_next_page(self):
+        paginator = KeysetPaginator(PhotoMetadata.objects.all(), page_size=3)
+        first = paginator.page()
+        PhotoMetadata.objects.create(**make_record('newest.jpg'))
+
+        second = paginator.page(first.next_cursor)
+
+        self.assertEqual([photo.id for photo in second], self.expected[3:6])
+
+    def test_values_queryset(self):
+        paginator = KeysetPaginator(PhotoMetadata.objects.values('id', 'created_date'), page_size=4)
+
+        second = paginator.page(paginator.page().next_cursor)
+
+        self.assertEqual([row['id'] for row in second], self.expected[4:])
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(PhotoMetadata.objects.all())
+        for cursor in ('garbage', 'eyJ2IjpbMV0sImQiOiJuZXh0In0', 'eyJ2IjpbMSwyXSwiZCI6InVwIn0'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_api_list_follows_cursor(self):
+        response = self.client.get('/api/v1/photos/', {'page_size': 5, 'fields': 'id'})
+        data = response.json()
+        next_page = self.client.get('/api/v1/photos/', {'page_size': 5, 'fields': 'id', 'cursor': data['next_cursor']})
+
+        ids = [row['id'] for row in data['results'] + next_page.json()['results']]
+        self.assertEqual(ids, self.expected)
+        self.assertIsNone(next_page.json()['next_cursor'])
+        self.assertEqual(self.client.get('/api/v1/photos/', {'cursor': 'garbage'}).status_code, 400)
+
+
+class SearchTests(TestCase):
+    # Целые слова и начала слов: на них индекс и LIKE '%q%' должны совпадать
+    QUERIES = ['canon', 'Nikon', 'eos', 'sunset', 'beach', 'lake', 'img', 'missing']
+
+    def setUp(self):
+        PhotoMetadataImporter().run([
+            make_record('img_001.jpg', camera_make='Canon', camera_model='EOS R5', description='Sunset over the beach'),
+            make_record('img_002.jpg', camera_make='Nikon', camera_model='Z6', tags='beach, sea'),
+            make_record('dsc_003.jpg', camera_make='Canon', camera_model='EOS 5D', description='Mountain lake'),
+        ])
+        PhotoMetadata.objects.create(**make_record('mountain.jpg', camera_make='Sony', description='Lake at dawn'))
+
+    def found_ids(self, backend, query):
+        return set(backend.filter(PhotoMetadata.objects.all(), query).values_list('id', flat=True))
+
+    def assert_matches_icontains(self):
+        backend = search.get_backend()
+        for query in self.QUERIES:
+            with self.subTest(query=query):
+                expected = self.found_ids(search.LikeSearchBackend(), query)
+                self.assertEqual(self.found_ids(backend, query), expected)
+                self.assertEqual(set(backend.ranked_ids(query, limit=10)), expected)
+
+    def test_index_matches_icontains(self):
+        self.assert_matches_icontains()
+
+    def test_index_follows_update_and_delete(self):
+        photo = PhotoMetadata.objects.get(filename='img_002.jpg')
+        photo.camera_make = 'Canon'
+        photo.save()
+        PhotoMetadata.objects.get(filename='dsc_003.jpg').delete()
+
+        self.assert_matches_icontains()
+        self.assertIn(photo.id, self.found_ids(search.get_backend(), 'canon'))
+
+    def test_multiword_query_needs_every_word(self):
+        found = self.found_ids(search.get_backend(), 'canon lake')
+
+        self.assertEqual(found, {PhotoMetadata.objects.get(filename='dsc_003.jpg').id})
+
+    def test_uses_fts_index_on_sqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 проверяется только на SQLite')
+        self.assertIsInstance(search.get_backend(), search.SQLiteFTSBackend)
+
+    def test_migration_without_fts5_falls_back_to_like(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 проверяется только на SQLite')
+        migration = importlib.import_module('photo_metadata.migrations.0003_search_index')
+        self.addCleanup(search.reset_fts_available)
+        with connection.cursor() as cursor:
+            schema_editor = SimpleNamespace(connection=connection, execute=cursor.execute)
+            migration.drop_search_index(None, schema_editor)
+            with mock.patch.object(migration, 'sqlite_has_fts5', return_value=False):
+                migration.create_search_index(None, schema_editor)
+        search.reset_fts_available()
+
+        self.assertIsInstance(search.get_backend(), search.LikeSearchBackend)
+        self.assert_matches_icontains()
+
+
+class MediaRootMixin:
+    """Отдельный MEDIA_ROOT во временном каталоге на каждый тест."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class StorageTests(MediaRootMixin, TestCase):
+    DATA = [
+        make_record('a.jpg', camera_make='Canon', iso=400),
+        make_record('снимок.jpg', description='Закат'),
+    ]
+
+    def read_back(self, stored_file):
+        with storage.open_stored_file(StoredJSONFile.objects.get(pk=stored_file.pk)) as f:
+            return list(JSONFileProcessor.iter_stream_records(f, stored_file.name))
+
+    def compressions(self):
+        return [None, 'gzip'] + (['zstd'] if storage.zstandard is not None else [])
+
+    def test_round_trip(self):
+        for backend in ('flat', 'sharded', 'segments'):
+            for compression in self.compressions():
+                with self.subTest(backend=backend, compression=compression), \
+                        override_settings(PHOTO_JSON_STORAGE=backend, PHOTO_JSON_COMPRESSION=compression):
+                    name = f'{backend}-{compression}.json'
+                    stored_file = storage.get_storage().save(self.DATA, name)
+
+                    self.assertEqual(self.read_back(stored_file), self.DATA)
+                    self.assertEqual(stored_file.record_count, 2)
+                    if compression:
+                        self.assertEqual(storage.detect_compression(stored_file.full_path), compression)
+
+    def test_sharded_layout(self):
+        stored_file = storage.ShardedStorage(depth=2).save(self.DATA, 'photos.json')
+
+        self.assertRegex(stored_file.path, r'^json_files/[0-9a-f]{2}/[0-9a-f]{2}/photos\.json$')
+        self.assertEqual(file_index.reconcile(), (0, 0, 0))
+
+    def test_segments_share_files_and_roll_over(self):
+        backend = storage.SegmentStorage(segment_size=500)
+        stored_files = [backend.save(self.DATA, f'{number}.json') for number in range(4)]
+
+        segments = {stored_file.path for stored_file in stored_files}
+        self.assertGreater(len(segments), 1)
+        self.assertLess(len(segments), 4)
+        for stored_file in stored_files:
+            self.assertEqual(self.read_back(stored_file), self.DATA)
+        # Сверка с диском не удаляет записи из существующих сегментов
+        self.assertEqual(file_index.reconcile(), (0, 0, 0))
+        self.assertEqual(StoredJSONFile.objects.count(), 4)
+
+    def test_reads_files_saved_with_other_settings(self):
+        with override_settings(PHOTO_JSON_STORAGE='segments', PHOTO_JSON_COMPRESSION='gzip'):
+            segment_file = storage.get_storage().save(self.DATA, 'old.json')
+        with override_settings(PHOTO_JSON_STORAGE='flat', PHOTO_JSON_COMPRESSION=None):
+            flat_file = storage.get_storage().save(self.DATA, 'new.json')
+
+        self.assertEqual(self.read_back(segment_file), self.DATA)
+        self.assertEqual(self.read_back(flat_file), self.DATA)
+
+
+class ServingTests(MediaRootMixin, TestCase):
+    DATA = [make_record(f'{number}.jpg') for number in range(20)]
+
+    def setUp(self):
+        super().setUp()
+        self.stored_file = storage.FlatStorage().save(self.DATA, 'photos.json')
+        with open(self.stored_file.full_path, 'rb') as f:
+            self.content = f.read()
+        self.url = f'/files/{self.stored_file.name}/raw/'
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'])
+
+    def test_byte_ranges(self):
+        size = len(self.content)
+        for header, start, end in [
+            ('bytes=0-9', 0, 9),
+            ('bytes=100-', 100, size - 1),
+            ('bytes=-16', size - 16, size - 1),
+            (f'bytes=10-{size * 2}', 10, size - 1),
+        ]:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(self.body(response), self.content[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_unsupported_range_returns_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,5-6')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # If-Range с чужим ETag: файл изменился, диапазон не отдаётся
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_gzip_file(self):
+        stored_file = storage.FlatStorage('gzip').save(self.DATA, 'packed.json')
+        url = f'/files/{stored_file.name}/raw/'
+
+        encoded = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        plain = self.client.get(url)
+
+        self.assertEqual(encoded['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(self.body(encoded)), self.content)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(self.body(plain), self.content)
+        self.assertNotEqual(encoded['ETag'], plain['ETag'])
+
+    def test_segment_record_range(self):
+        stored_file = storage.SegmentStorage().save(self.DATA, 'segment.json')
+        record = storage.read_segment_record(stored_file)
+
+        response = self.client.get(f'/files/{stored_file.name}/raw/', HTTP_RANGE='bytes=1-20')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), record[1:21])
+
+
+@override_settings(PHOTO_API_TOKENS=[API_TOKEN])
+class ApiBatchTests(TestCase):
+    url = '/api/v1/photos/batch/'
+
+    def setUp(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {API_TOKEN}')
+        self.photo = PhotoMetadata.objects.create(**make_record('existing.jpg', tags='old'))
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_applies_all_operations(self):
+        other = PhotoMetadata.objects.create(**make_record('other.jpg'))
+
+        response = self.post({
+            'create': [make_record('new.jpg', tags='Sea, Sky')],
+            'update': [{'id': self.photo.id, 'camera_make': 'Canon', 'tags': 'new'}],
+            'delete': [other.id],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([record['filename'] for record in data['created']], ['new.jpg'])
+        self.assertEqual(data['updated'][0]['camera_make'], 'Canon')
+        self.assertEqual(data['deleted'], [other.id])
+        self.photo.refresh_from_db()
+        self.assertEqual(list(self.photo.tag_set.values_list('name', flat=True)), ['new'])
+        self.assertFalse(PhotoMetadata.objects.filter(id=other.id).exists())
+        created = PhotoMetadata.objects.get(filename='new.jpg')
+        self.assertEqual(sorted(created.tag_set.values_list('name', flat=True)), ['sea', 'sky'])
+
+    def test_any_error_rolls_back_whole_batch(self):
+        other = PhotoMetadata.objects.create(**make_record('other.jpg'))
+
+        response = self.post({
+            'create': [make_record('new.jpg'), make_record('bad.jpg', width=0), {'filename': 'x', 'colour': 'red'}],
+            'update': [{'id': self.photo.id, 'camera_make': 'Canon'}, {'id': 999999, 'camera_make': 'Nikon'}],
+            'delete': [other.id],
+        })
+
+        self.assertEqual(response.status_code, 400)
+        details = response.json()['details']
+        self.assertEqual(set(details['create']), {'1', '2'})
+        self.assertIn('width', details['create']['1'])
+        self.assertEqual(details['create']['2'], {'colour': ['Неизвестное поле']})
+        self.assertEqual(details['update'], {'1': {'id': ['Запись не найдена']}})
+        self.assertNotIn('delete', details)
+        self.assertEqual(
+            list(PhotoMetadata.objects.order_by('id').values_list('filename', 'camera_make')),
+            [('existing.jpg', ''), ('other.jpg', '')],
+        )
+
+    def test_duplicate_filenames(self):
+        response = self.post({'create': [make_record('existing.jpg'), make_record('twin.jpg'), make_record('twin.jpg')]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['details']['create']), {'0', '2'})
+        self.assertEqual(PhotoMetadata.objects.count(), 1)
+
+    def test_deleted_filename_can_be_reused(self):
+        response = self.post({'delete': [self.photo.id], 'create': [make_record('existing.jpg', width=100)]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PhotoMetadata.objects.get().width, 100)
+
+    @override_settings(PHOTO_API_MAX_BATCH=2)
+    def test_batch_size_limit(self):
+        response = self.post({'create': [make_record(f'{number}.jpg') for number in range(3)]})
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(PhotoMetadata.objects.count(), 1)
+
+    def test_malformed_requests(self):
+        self.assertEqual(self.client.post(self.url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post({'upsert': []}).status_code, 400)
+        self.assertEqual(self.post({'create': {}}).status_code, 400)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), {'error': 'Метод не поддерживается'})
+
+    def test_single_record_endpoints(self):
+        url = f'/api/v1/photos/{self.photo.id}/'
+
+        response = self.client.patch(url, json.dumps({'iso': 800}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['iso'], 800)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_writes_require_authorization(self):
+        anonymous = Client()
+        payload = json.dumps({'create': [make_record('new.jpg')]})
+
+        response = anonymous.post(self.url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        wrong_token = Client(HTTP_AUTHORIZATION='Bearer other')
+        self.assertEqual(wrong_token.post(self.url, payload, content_type='application/json').status_code, 401)
+        self.assertEqual(anonymous.delete(f'/api/v1/photos/{self.photo.id}/').status_code, 401)
+        self.assertEqual(anonymous.get(f'/api/v1/photos/{self.photo.id}/').status_code, 200)
+
+        session = Client()
+        session.force_login(User.objects.create_user('editor'))
+        self.assertEqual(session.post(self.url, payload, content_type='application/json').status_code, 200)
+        self.assertEqual(PhotoMetadata.objects.count(), 2)
+
+    def test_form_encoded_post_is_rejected(self):
+        # Так отправляет HTML-форма с чужого сайта: сессия пользователя есть, CSRF-токена нет
+        session = Client(enforce_csrf_checks=True)
+        session.force_login(User.objects.create_user('editor'))
+        body = json.dumps({'delete': [self.photo.id]})
+
+        for content_type in ('text/plain', 'application/x-www-form-urlencoded', 'multipart/form-data; boundary=x'):
+            with self.subTest(content_type=content_type):
+                response = session.post(self.url, body, content_type=content_type)
+                self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.client.post(self.url, {'delete': self.photo.id}).status_code, 415)
+        self.assertTrue(PhotoMetadata.objects.filter(id=self.photo.id).exists())
+
+
+class GeoTests(TestCase):
+    CENTERS = [
+        # (широта, долгота, радиус км)
+        (55.75, 37.62, 50),
+        (55.75, 37.62, 500),
+        (-33.87, 151.21, 200),
+        # Через линию перемены дат и у полюса
+        (0.0, 179.9, 300),
+        (89.5, 0.0, 200),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        records = []
+        for number, (latitude, longitude, radius) in enumerate(cls.CENTERS * 40):
+            spread = radius * 2 / geo.KM_PER_DEGREE
+            records.append(make_record(
+                f'geo_{number}.jpg',
+                latitude=round(max(-90, min(90, latitude + rng.uniform(-spread, spread))), 6),
+                longitude=round((longitude + rng.uniform(-spread, spread) + 540) % 360 - 180, 6),
+            ))
+        records.append(make_record('no_location.jpg'))
+        PhotoMetadataImporter().run(records)
+        cls.points = [
+            (pk, float(lat), float(lon))
+            for pk, lat, lon in PhotoMetadata.objects.filter(latitude__isnull=False).values_list('id', 'latitude', 'longitude')
+        ]
+
+    def brute_force(self, latitude, longitude, radius):
+        found = [(geo.distance_km(latitude, longitude, lat, lon), pk) for pk, lat, lon in self.points]
+        return sorted((distance, pk) for distance, pk in found if distance <= radius)
+
+    def test_nearest_matches_brute_force(self):
+        for latitude, longitude, radius in self.CENTERS:
+            with self.subTest(latitude=latitude, longitude=longitude, radius=radius):
+                expected = self.brute_force(latitude, longitude, radius)
+                found = geo.nearest(PhotoMetadata.objects.all(), latitude, longitude, radius, limit=len(self.points))
+
+                self.assertTrue(expected)
+                self.assertEqual([pk for pk, _ in found], [pk for _, pk in expected])
+                self.assertTrue(all(distance <= radius for _, distance in found))
+
+    def test_limit_keeps_closest(self):
+        expected = self.brute_force(55.75, 37.62, 500)[:5]
+
+        found = geo.nearest(PhotoMetadata.objects.all(), 55.75, 37.62, 500, limit=5)
+
+        self.assertEqual([pk for pk, _ in found], [pk for _, pk in expected])
+
+    def test_bbox_across_date_line(self):
+        west, south, east, north = 179.0, -2.0, -179.0, 2.0
+        expected = {
+            pk for pk, lat, lon in self.points
+            if south <= lat <= north and (lon >= west or lon <= east)
+        }
+
+        found = set(geo.within_bbox(PhotoMetadata.objects.all(), west, south, east, north).values_list('id', flat=True))
+
+        self.assertTrue(expected)
+        self.assertEqual(found, expected)
+
+    def test_nearby_api(self):
+        response = self.client.get('/api/v1/photos/nearby/', {'lat': 55.75, 'lon': 37.62, 'radius_km': 50, 'page_size': 500})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([row['id'] for row in results], [pk for _, pk in self.brute_force(55.75, 37.62, 50)])
+        distances = [row['distance_km'] for row in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(self.client.get('/api/v1/photos/nearby/', {'lat': 95, 'lon': 0, 'radius_km': 1}).status_code, 400)
+
+
+class CatalogStatTests(TestCase):
+    def counters(self):
+        return {(stat.dimension, stat.value): stat.count for stat in CatalogStat.objects.filter(count__gt=0)}
+
+    def assert_counters_match_rebuild(self):
+        counters = self.counters()
+        self.assertEqual(counters, {key: count for key, count in stats.rebuild().items() if count})
+        self.assertEqual(stats.summary()['total'], PhotoMetadata.objects.count())
+
+    def test_create(self):
+        PhotoMetadata.objects.create(**make_record('a.jpg', camera_make='Canon', camera_model='EOS R5', iso=200,
+                                                   capture_date=datetime(2024, 5, 1)))
+        self.assert_counters_match_rebuild()
+
+    def test_bulk_import(self):
+        PhotoMetadataImporter().run([
+            make_record(f'{number}.jpg', format=['JPEG', 'PNG'][number % 2], iso=100 * number,
+                        width=1000 + number * 1000, height=3000)
+            for number in range(1, 80)
+        ])
+        self.assert_counters_match_rebuild()
+
+    def test_update(self):
+        photo = PhotoMetadata.objects.create(**make_record('a.jpg', camera_make='Canon'))
+        PhotoMetadata.objects.create(**make_record('b.jpg', camera_make='Canon'))
+
+        photo.format = 'PNG'
+        photo.camera_make = 'Nikon'
+        photo.iso = 12800
+        photo.save()
+        self.assert_counters_match_rebuild()
+
+        # Поле вне статистики — счётчики не меняются
+        photo.description = 'Закат'
+        photo.save(update_fields=['description'])
+        self.assert_counters_match_rebuild()
+
+    def test_delete(self):
+        photo = PhotoMetadata.objects.create(**make_record('a.jpg', capture_date=datetime(2023, 1, 1)))
+        PhotoMetadata.objects.create(**make_record('b.jpg'))
+
+        photo.delete()
+        self.assert_counters_match_rebuild()
+        self.assertFalse(CatalogStat.objects.filter(dimension='capture_month', value='2023-01', count__gt=0).exists())
+
+    def test_api_batch(self):
+        photo = PhotoMetadata.objects.create(**make_record('a.jpg'))
+        other = PhotoMetadata.objects.create(**make_record('b.jpg'))
+
+        with override_settings(PHOTO_API_TOKENS=[API_TOKEN]):
+            response = self.client.post('/api/v1/photos/batch/', json.dumps({
+                'create': [make_record('c.jpg', format='GIF')],
+                'update': [{'id': photo.id, 'format': 'TIFF', 'width': 8000, 'height': 6000}],
+                'delete': [other.id],
+            }), content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {API_TOKEN}')
+        self.assertEqual(response.status_code, 200)
+        self.assert_counters_match_rebuild()
+
+    def test_summary_total_without_hot_row(self):
+        PhotoMetadataImporter().run([make_record(f'{number}.jpg') for number in range(3)])
+
+        self.assertFalse(CatalogStat.objects.filter(dimension='total').exists())
+        self.assertEqual(stats.summary()['total'], 3)
+        self.assertEqual(stats.summary()['format'], [{'value': 'JPEG', 'count': 3}])
+
+
+class NearDuplicateTests(TestCase):
+    START = datetime(2024, 6, 1, 12, 0, 0)
+
+    def shot(self, filename, seconds=0, camera_model='EOS R5', **fields):
+        fields.setdefault('camera_make', 'Canon')
+        fields.setdefault('capture_date', self.START + timedelta(seconds=seconds))
+        return PhotoMetadata.objects.create(**make_record(filename, camera_model=camera_model, **fields))
+
+    def groups(self):
+        groups = {}
+        for photo_id, cluster_id in NearDuplicate.objects.values_list('photo_id', 'cluster_id'):
+            groups.setdefault(cluster_id, set()).add(photo_id)
+        return {cluster_id: members for cluster_id, members in groups.items() if len(members) > 1}
+
+    def test_groups_same_shot_in_other_sizes_and_formats(self):
+        original = self.shot('IMG_0001.jpg', width=4000, height=3000)
+        resized = self.shot('IMG_0001.png', seconds=1, format='PNG', width=2000, height=1500)
+        rotated = self.shot('img_0001_small.jpg', seconds=2, width=1500, height=2000)
+        self.shot('IMG_0001.jpg.other-camera', camera_model='Z6', camera_make='Nikon', width=4000, height=3000)
+        self.shot('IMG_0001_square.jpg', seconds=1, width=3000, height=3000)
+        self.shot('IMG_0001_late.jpg', seconds=60, width=4000, height=3000)
+        self.shot('IMG_0001_undated.jpg', capture_date=None, width=4000, height=3000)
+
+        result = neardup.scan()
+
+        self.assertEqual(self.groups(), {original.id: {original.id, resized.id, rotated.id}})
+        self.assertEqual(result.cluster_count, 1)
+        self.assertFalse(result.incremental)
+        self.assertEqual([row.photo_id for row in neardup.similar_records(resized)], sorted(
+            [original.id, rotated.id], key=lambda pk: -NearDuplicate.objects.get(photo_id=pk).score,
+        ))
+
+    def test_candidate_pairs_match_brute_force(self):
+        rng = random.Random(1)
+        for number in range(150):
+            width = rng.choice([4000, 2000, 3000])
+            self.shot(f'{number}.jpg', seconds=rng.randint(0, 60), camera_model=rng.choice(['A', 'B']),
+                      width=width, height=width * 3 // 4 if rng.random() < 0.8 else width)
+        window, tolerance = timedelta(seconds=5), 0.01
+        rows = list(PhotoMetadata.objects.order_by(*neardup.SORT_ORDER).values(*neardup.FIELDS))
+
+        found = {frozenset((a['id'], b['id'])) for a, b in neardup.candidate_pairs(rows, window, tolerance)}
+
+        expected = set()
+        for index, a in enumerate(rows):
+            for b in rows[index + 1:]:
+                ratio_a = neardup.aspect_ratio(a['width'], a['height'])
+                ratio_b = neardup.aspect_ratio(b['width'], b['height'])
+                if (a['camera_model'] == b['camera_model']
+                        and abs(a['capture_date'] - b['capture_date']) <= window
+                        and abs(ratio_a - ratio_b) <= tolerance * max(ratio_a, ratio_b)):
+                    expected.add(frozenset((a['id'], b['id'])))
+        self.assertTrue(expected)
+        self.assertEqual(found, expected)
+
+    def test_incremental_scan_joins_existing_groups(self):
+        first = self.shot('IMG_0002.jpg', width=4000, height=3000)
+        second = self.shot('IMG_0002.png', seconds=1, format='PNG', width=2000, height=1500)
+        lone = self.shot('DSC_0100.jpg', seconds=300, width=6000, height=4000)
+        neardup.scan()
+
+        third = self.shot('IMG_0002_web.jpg', seconds=2, width=1000, height=750)
+        pair = self.shot('DSC_0100.png', seconds=301, format='PNG', width=3000, height=2000)
+        result = neardup.scan(incremental=True)
+
+        self.assertTrue(result.incremental)
+        self.assertEqual(result.checked_count, 2)
+        self.assertEqual(self.groups(), {
+            first.id: {first.id, second.id, third.id},
+            lone.id: {lone.id, pair.id},
+        })
+        # Полный проход находит те же группы
+        neardup.scan()
+        self.assertEqual(self.groups(), {
+            first.id: {first.id, second.id, third.id},
+            lone.id: {lone.id, pair.id},
+        })
+
+
+class ColumnarSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(400, seed=23)
+        PhotoMetadata.objects.create(**make_record('no_exif.jpg', iso=None, aperture=None, capture_date=None))
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def build(self, snapshot_format):
+        path = f'{self.directory}/catalog'
+        meta = columnar.build(path, snapshot_format)
+        self.assertEqual(meta['rows'], PhotoMetadata.objects.count())
+        return columnar.load(path)
+
+    def assert_same_as_orm(self, snapshot):
+        for name, orm_query, snapshot_query in benchmark_snapshot.QUERIES:
+            with self.subTest(query=name):
+                expected, actual = orm_query(), snapshot_query(snapshot)
+                self.assertTrue(expected)
+                self.assertTrue(benchmark_snapshot.same_result(expected, actual), (expected, actual))
+
+    def test_npy_snapshot_matches_orm(self):
+        self.assert_same_as_orm(self.build('npy'))
+
+    @unittest.skipUnless(columnar.pyarrow, 'pyarrow не установлен')
+    def test_parquet_snapshot_matches_orm(self):
+        self.assert_same_as_orm(self.build('parquet'))
+
+    def test_columns_decode_to_orm_values(self):
+        snapshot = self.build('npy')
+        rows = PhotoMetadata.objects.order_by('id').values_list('id', 'format', 'iso', 'capture_date')
+        decoded = [
+            tuple(snapshot.decode(name, snapshot.column(name)[index]) for name in ('id', 'format', 'iso', 'capture_date'))
+            for index in range(len(snapshot))
+        ]
+        self.assertEqual(decoded, [
+            (pk, photo_format, None if iso is None else float(iso), capture_date)
+            for pk, photo_format, iso, capture_date in rows
+        ])
+        self.assertEqual(snapshot.count(snapshot.mask(capture_month=None)),
+                         PhotoMetadata.objects.filter(capture_date__isnull=True).count())
+
+
+@override_settings(PHOTO_WRITE_RETRIES=3, PHOTO_WRITE_RETRY_DELAY=0.01)
+class WriteRetryTests(TransactionTestCase):
+    # Повтор возможен только вне открытой транзакции, поэтому не TestCase
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        patcher = mock.patch('photo_metadata.db.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def locked_writer(self, failures, error='database is locked'):
+        attempts = []
+
+        def write(filename):
+            attempts.append(filename)
+            PhotoMetadata.objects.create(**make_record(f'{filename}-{len(attempts)}.jpg'))
+            if len(attempts) <= failures:
+                raise OperationalError(error)
+            return len(attempts)
+
+        return write, attempts
+
+    def test_retries_locked_transaction_and_rolls_back_failed_attempts(self):
+        write, attempts = self.locked_writer(failures=2)
+
+        self.assertEqual(db.atomic_with_retry(write, 'IMG'), 3)
+
+        self.assertEqual(list(PhotoMetadata.objects.values_list('filename', flat=True)), ['IMG-3.jpg'])
+        self.assertEqual(metrics.write_events(), {'lock_retry': 2})
+        delays = [call.args[0] for call in self.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0.005 <= delays[0] <= 0.015 and 0.01 <= delays[1] <= 0.03, delays)
+
+    def test_gives_up_after_configured_retries(self):
+        write, attempts = self.locked_writer(failures=10)
+
+        with override_settings(PHOTO_WRITE_RETRIES=1), self.assertRaises(OperationalError):
+            db.atomic_with_retry(write, 'IMG')
+
+        self.assertEqual(len(attempts), 2)
+        self.assertFalse(PhotoMetadata.objects.exists())
+        self.assertEqual(metrics.write_events(), {'lock_retry': 1, 'lock_failure': 1})
+
+    def test_other_errors_are_not_retried(self):
+        write, attempts = self.locked_writer(failures=1, error='no such table: photo')
+
+        with self.assertRaises(OperationalError):
+            db.atomic_with_retry(write, 'IMG')
+
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(metrics.write_events(), {})
+        self.sleep.assert_not_called()
+
+    def test_no_retry_inside_outer_transaction(self):
+        write, attempts = self.locked_writer(failures=1)
+
+        with self.assertRaises(OperationalError), transaction.atomic():
+            db.atomic_with_retry(write, 'IMG')
+
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(metrics.write_events(), {'lock_failure': 1})
+
+    def test_rejects_unsafe_pragmas(self):
+        with self.assertRaises(ValueError):
+            db.apply_sqlite_pragmas(connection, {'journal_mode': 'WAL; DROP TABLE photo'})
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-results'},
+        'generation': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-generation'},
+    },
+    PHOTO_CACHE_ALIAS='default',
+    PHOTO_CACHE_GENERATION_ALIAS='generation',
+)
+class CacheInvalidationTests(TestCase):
+    START = datetime(2024, 6, 1, 12, 0, 0)
+
+    def setUp(self):
+        photo_cache.get_cache().clear()
+        photo_cache.get_generation_cache().clear()
+        self.calls = 0
+
+    def listing(self):
+        def compute():
+            self.calls += 1
+            return list(PhotoMetadata.objects.values_list('filename', flat=True))
+        return photo_cache.get_or_compute('listing', {'page': 1}, compute)
+
+    def test_write_invalidates_after_commit(self):
+        self.assertEqual(self.listing(), [])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            PhotoMetadata.objects.create(**make_record('IMG_0001.jpg'))
+            # До фиксации транзакции другие запросы видят прежнее поколение
+            self.assertEqual(self.listing(), [])
+        self.assertTrue(callbacks)
+        self.assertEqual(self.listing(), ['IMG_0001.jpg'])
+        self.assertEqual(self.calls, 2)
+
+    def test_generation_is_shared_with_other_processes(self):
+        self.listing()
+        generation = photo_cache.get_generation()
+        # Другой процесс: свой кэш результатов, общий кэш поколения
+        photo_cache.get_cache().clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            PhotoMetadata.objects.create(**make_record('IMG_0002.jpg'))
+        self.assertNotEqual(photo_cache.get_generation(), generation)
+
+    def test_raw_saves_do_not_invalidate(self):
+        generation = photo_cache.get_generation()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            PhotoMetadata(**make_record('fixture.jpg', created_date=self.START)).save_base(raw=True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(photo_cache.get_generation(), generation)
+
+
+@override_settings(PHOTO_WRITE_QUEUE=True, PHOTO_WRITE_LINGER_MS=50)
+class WriteQueueTests(TransactionTestCase):
+    # Писатель пишет в своём потоке и своей транзакции, поэтому не TestCase
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.queue = writes.WriteQueue(idle_timeout=0.05)
+        patcher = mock.patch.object(writes, '_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_coalesces_inserts_into_one_batch(self):
+        futures = [self.queue.submit(PhotoMetadata(**make_record(f'IMG_{number}.jpg'))) for number in range(5)]
+
+        saved = [future.result(timeout=5) for future in futures]
+        self.queue.join(timeout=5)
+
+        self.assertTrue(all(photo.pk for photo in saved))
+        self.assertEqual(PhotoMetadata.objects.count(), 5)
+        self.assertEqual(metrics.write_events(), {'batch': 1, 'batched_record': 5})
+        self.assertEqual(stats.summary()['total'], 5)
+
+    def test_duplicate_fails_only_its_own_record(self):
+        PhotoMetadata.objects.create(**make_record('taken.jpg'))
+        futures = {
+            filename: self.queue.submit(PhotoMetadata(**make_record(filename)))
+            for filename in ('a.jpg', 'taken.jpg', 'b.jpg')
+        }
+
+        with self.assertRaises(IntegrityError):
+            futures['taken.jpg'].result(timeout=5)
+        self.assertEqual(futures['a.jpg'].result(timeout=5).filename, 'a.jpg')
+        self.assertEqual(futures['b.jpg'].result(timeout=5).filename, 'b.jpg')
+
+    def test_timed_out_record_is_not_saved(self):
+        started, release = threading.Event(), threading.Event()
+        bulk_insert = writes.bulk_insert
+
+        def slow_insert(objects):
+            started.set()
+            release.wait(5)
+            return bulk_insert(objects)
+
+        with mock.patch.object(writes, 'bulk_insert', side_effect=slow_insert) as patched:
+            first = self.queue.submit(PhotoMetadata(**make_record('first.jpg')))
+            self.assertTrue(started.wait(5))
+            with override_settings(PHOTO_WRITE_TIMEOUT=0.05), self.assertRaises(writes.WriteTimeout):
+                writes.insert(PhotoMetadata(**make_record('late.jpg')))
+            release.set()
+            first.result(timeout=5)
+            self.queue.join(timeout=5)
+
+        self.assertEqual(patched.call_count, 1)
+        self.assertEqual(list(PhotoMetadata.objects.values_list('filename', flat=True)), ['first.jpg'])
+        self.assertEqual(metrics.write_events()['queue_timeout'], 1)
+
+    def test_writer_flushes_queue_and_exits_when_idle(self):
+        future = self.queue.submit(PhotoMetadata(**make_record('IMG_0001.jpg')))
+        thread = self.queue._thread
+        # Не демон: при остановке процесса интерпретатор дождётся записи очереди
+        self.assertFalse(thread.daemon)
+
+        self.queue.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(future.done())
+        self.assertTrue(PhotoMetadata.objects.filter(filename='IMG_0001.jpg').exists())
+        # Следующая запись запускает нового писателя
+        self.assertIsNotNone(self.queue.submit(PhotoMetadata(**make_record('IMG_0002.jpg'))).result(timeout=5).pk)
+
+    def test_form_reports_timeout_instead_of_failing(self):
+        data = {**make_record('IMG_0001.jpg'), 'save_option': 'db'}
+        with mock.patch.object(writes, 'insert', side_effect=writes.WriteTimeout):
+            response = self.client.post('/input/', data, follow=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('База данных занята', [str(message) for message in response.context['messages']][0])
+        self.assertFalse(PhotoMetadata.objects.exists())
+
+
+@override_settings(PHOTO_IMPORT_ASYNC=False, PHOTO_IMPORT_STALE_AFTER=600)
+class ImportJobTests(MediaRootMixin, TransactionTestCase):
+    # run_import закрывает соединения, как в потоке пула, поэтому не TestCase
+
+    def make_job(self, count):
+        records = [make_record(f'{number}.jpg') for number in range(count)]
+        return ImportedFile.objects.create(file=ContentFile(json.dumps(records).encode(), name='photos.json'))
+
+    def test_slow_validation_is_not_taken_for_stale(self):
+        job = self.make_job(2500)
+        validate = JSONFileProcessor._validate_photo_metadata
+        checks = {}
+
+        def slow_validate(item):
+            # Импорт тоже проверяет записи — учитывается только первый проход, проверка файла
+            if item['filename'] == '0.jpg' and not checks:
+                # Проверка будто бы идёт уже час — дольше PHOTO_IMPORT_STALE_AFTER
+                ImportedFile.objects.filter(pk=job.pk).update(updated_date=datetime.now() - timedelta(hours=1))
+            elif item['filename'] == '500.jpg':
+                checks.setdefault('before_heartbeat', tasks.can_retry(job))
+            elif item['filename'] == '2400.jpg' and 'after_heartbeat' not in checks:
+                checks['after_heartbeat'] = (tasks.can_retry(job), tasks.reset_import(job.pk))
+            return validate(item)
+
+        with mock.patch.object(JSONFileProcessor, '_validate_photo_metadata', side_effect=slow_validate):
+            tasks.run_import(job.pk)
+
+        self.assertEqual(checks, {'before_heartbeat': True, 'after_heartbeat': (False, False)})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.added_count), (ImportedFile.STATUS_DONE, 2500))
+        self.assertEqual(PhotoMetadata.objects.count(), 2500)
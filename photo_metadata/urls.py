@@ -1,6 +1,6 @@
 
 from django.urls import path
-from . import views
+from . import api, views
 
 
 
@@ -8,11 +8,25 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('input/', views.input_form, name='input_form'),
     path('upload/', views.upload_file, name='upload_file'),
+    path('upload/<int:file_id>/status/', views.import_status, name='import_status'),
+    path('upload/<int:file_id>/retry/', views.retry_import, name='retry_import'),
     path('files/', views.view_files, name='view_files'),
     path('files/<str:filename>/', views.view_file_content, name='view_file_content'),
+    path('files/<str:filename>/raw/', views.view_file_raw, name='view_file_raw'),
     path('database/', views.view_database_records, name='database_records'),  
     path('edit/<int:record_id>/', views.edit_record, name='edit_record'),
     path('delete/<int:record_id>/', views.delete_record, name='delete_record'),
     path('search/', views.search_records, name='search_records'),
+    path('tags/facets/', views.search_tag_facets, name='tag_facets'),
+    path('export/', views.export_records, name='export_records'),
     path('view_record/<int:record_id>/', views.view_record, name='view_record'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('stats/', views.catalog_stats, name='catalog_stats'),
+    path('duplicates/', views.near_duplicates, name='near_duplicates'),
+    path('api/v1/photos/', api.photo_list, name='api_photo_list'),
+    path('api/v1/photos/batch/', api.photo_batch, name='api_photo_batch'),
+    path('api/v1/photos/nearby/', api.photo_nearby, name='api_photo_nearby'),
+    path('api/v1/photos/clusters/', api.photo_clusters, name='api_photo_clusters'),
+    path('api/v1/photos/<int:record_id>/', api.photo_detail, name='api_photo_detail'),
+    path('api/v1/stats/', api.catalog_stats, name='api_catalog_stats'),
 ]
\ No newline at end of file
@@ -1,35 +1,182 @@
+import csv
 import json
 import os
 import uuid
+from decimal import Decimal
 from django.core.files.storage import FileSystemStorage
 from .models import PhotoMetadata
+from . import storage
+
+# Размер порции, которой читается файл при потоковом разборе
+READ_CHUNK_SIZE = 64 * 1024
+# Ограничение на размер одной записи, чтобы битый файл не съел всю память
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+# Через сколько записей проверка файла сообщает о ходе работы (on_progress)
+VALIDATE_PROGRESS_EVERY = 1000
+
+JSON_WHITESPACE = ' \t\n\r'
+
+SUPPORTED_EXTENSIONS = ('.json', '.jsonl', '.csv')
+COMPRESSED_EXTENSIONS = ('.gz', '.zst')
+
+
+class UnsupportedJSONStructure(ValueError):
+    pass
+
+
+def _iter_json_lines(f):
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    for line in f:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
+
+
+def _iter_csv(f):
+    # Пустые ячейки означают отсутствующее значение, как пропущенный ключ в JSON
+    for row in csv.DictReader(f):
+        yield {name: value for name, value in row.items() if value != ''}
+
+
+def _iter_json_array(f, buffer):
+    """Поэлементно разбирает массив верхнего уровня.
+
+    В памяти держится только текущая порция файла и одна запись.
+    """
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    pos = 0
+    eof = False
+    state = 'start'
+
+    while True:
+        if pos > READ_CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
+
+        while pos < len(buffer) and buffer[pos] in JSON_WHITESPACE:
+            pos += 1
+
+        if pos == len(buffer):
+            if not eof:
+                chunk = f.read(READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            if state == 'end':
+                return
+            raise json.JSONDecodeError("Unexpected end of file", buffer, pos)
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise json.JSONDecodeError("Expecting '['", buffer, pos)
+            pos += 1
+            state = 'first'
+        elif state == 'first' and char == ']':
+            pos += 1
+            state = 'end'
+        elif state in ('first', 'value'):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof or len(buffer) - pos > MAX_RECORD_SIZE:
+                    raise
+                end = len(buffer)
+            # Запись могла оборваться на границе порции — дочитываем файл
+            if end == len(buffer) and not eof:
+                chunk = f.read(READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield item
+            pos = end
+            state = 'separator'
+        elif state == 'separator':
+            if char == ',':
+                state = 'value'
+            elif char == ']':
+                state = 'end'
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
+        else:
+            raise json.JSONDecodeError("Extra data", buffer, pos)
+
 
 class JSONFileProcessor:
     @staticmethod
     def generate_safe_filename(original_name):
-        ext = 'json'
+        ext = 'jsonl' if JSONFileProcessor.is_json_lines(original_name) else 'json'
         filename = f"{uuid.uuid4().hex}.{ext}"
         return filename
     
     @staticmethod
-    def validate_json_file(file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+    def _base_name(file_name):
+        name = file_name.lower()
+        for ext in COMPRESSED_EXTENSIONS:
+            if name.endswith(ext):
+                return name[:-len(ext)]
+        return name
+    
+    @staticmethod
+    def is_json_lines(file_name):
+        return JSONFileProcessor._base_name(file_name).endswith('.jsonl')
+    
+    @staticmethod
+    def is_supported_file(file_name):
+        return JSONFileProcessor._base_name(file_name).endswith(SUPPORTED_EXTENSIONS)
+    
+    @staticmethod
+    def _open_text(file_path):
+        return storage.open_text(file_path)
+    
+    @staticmethod
+    def iter_records(file_path):
+        """Потоково читает записи из JSON массива, одиночного объекта, JSON Lines или CSV.
+        
+        Файлы, сжатые gzip или zstd, распаковываются на лету.
+        """
+        with JSONFileProcessor._open_text(file_path) as f:
+            yield from JSONFileProcessor.iter_stream_records(f, file_path)
+    
+    @staticmethod
+    def iter_stream_records(f, file_name):
+        """То же, что iter_records, для уже открытого текстового потока."""
+        if JSONFileProcessor.is_json_lines(file_name):
+            yield from _iter_json_lines(f)
+            return
+        if JSONFileProcessor._base_name(file_name).endswith('.csv'):
+            yield from _iter_csv(f)
+            return
         
-            if isinstance(data, list):
-                for item in data:
-                    if not JSONFileProcessor._validate_photo_metadata(item):
-                        return False, "Неверная структура данных в JSON файле"
-            elif isinstance(data, dict):
-                if not JSONFileProcessor._validate_photo_metadata(data):
+        buffer = f.read(READ_CHUNK_SIZE)
+        start = buffer.lstrip(JSON_WHITESPACE)[:1]
+        if start == '[':
+            yield from _iter_json_array(f, buffer)
+        elif start == '{':
+            # Одиночный объект — это одна запись, его можно прочитать целиком
+            yield json.loads(buffer + f.read(), parse_float=Decimal)
+        else:
+            raise UnsupportedJSONStructure("Неподдерживаемая структура JSON файла")
+    
+    @staticmethod
+    def validate_json_file(file_path, on_progress=None):
+        """Проверяет структуру всех записей файла: (валиден ли, сообщение).
+
+        Каждые VALIDATE_PROGRESS_EVERY записей вызывается on_progress(число
+        проверенных записей), если он передан.
+        """
+        try:
+            for count, item in enumerate(JSONFileProcessor.iter_records(file_path), 1):
+                if not JSONFileProcessor._validate_photo_metadata(item):
                     return False, "Неверная структура данных в JSON файле"
-            else:
-                return False, "Неподдерживаемая структура JSON файла"
+                if on_progress and count % VALIDATE_PROGRESS_EVERY == 0:
+                    on_progress(count)
             
             return True, "Файл валиден"
         except json.JSONDecodeError as e:
             return False, f"Ошибка парсинга JSON: {str(e)}"
+        except UnsupportedJSONStructure as e:
+            return False, str(e)
         except Exception as e:
             return False, f"Ошибка при проверке файла: {str(e)}"
     
@@ -48,13 +195,9 @@ class JSONFileProcessor:
     
     @staticmethod
     def save_to_json(data, filename):
-        file_path = os.path.join('media', 'json_files', filename)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        return file_path
+        """Сохраняет данные через хранилище из настройки PHOTO_JSON_STORAGE."""
+        stored_file = storage.get_storage().save(data, filename)
+        return stored_file.full_path
     
     @staticmethod
     def read_json_file(file_path):
@@ -1,15 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import ValidationError
 from django.db import IntegrityError
-from django.db import models 
 import os
 import json
+import itertools
 
 from .forms import PhotoMetadataForm, FileUploadForm, EditPhotoMetadataForm
-from .models import PhotoMetadata, ImportedFile
+from .models import CatalogStat, DuplicateScan, PhotoMetadata, ImportedFile, StoredJSONFile
 from .utils import JSONFileProcessor
+from .tasks import can_retry, enqueue_import, reset_import
+from .pagination import (
+    KeysetPaginator, InvalidCursor, get_page_size, estimate_count,
+    encode_offset_cursor, decode_offset_cursor,
+)
+from . import search
+from .tags import filter_by_tags, normalize_tag, tag_facets
+from . import cache as photo_cache
+from .export import EXPORT_FORMATS, export_filename, iter_export
+from .storage import open_stored_file
+from .serving import serve_stored_file
+from .serializers import EDITABLE_FIELDS, dumps, serialize_record
+from .dedup import file_sha256
+from . import metrics as photo_metrics
+from . import writes
+from . import stats as photo_stats
+from . import neardup
 
 def home(request):
     
@@ -31,26 +52,7 @@ def input_form(request):
                     file_processor = JSONFileProcessor()
                     json_filename = file_processor.generate_safe_filename(photo_data['filename'])
                     
-                    data_for_json = {
-                    'filename': photo_data['filename'],
-                    'format': photo_data['format'],
-                    'file_size': photo_data['file_size'],
-                    'width': photo_data['width'],
-                    'height': photo_data['height'],
-                    'camera_make': photo_data['camera_make'],
-                    'camera_model': photo_data['camera_model'],
-                    'exposure_time': photo_data['exposure_time'],
-                    'aperture': str(photo_data['aperture']) if photo_data['aperture'] else None,
-                    'iso': photo_data['iso'],
-                    'focal_length': str(photo_data['focal_length']) if photo_data['focal_length'] else None,
-                    'latitude': str(photo_data['latitude']) if photo_data['latitude'] else None,
-                    'longitude': str(photo_data['longitude']) if photo_data['longitude'] else None,
-                    'capture_date': photo_data['capture_date'].isoformat() if photo_data['capture_date'] else None,
-                    'description': photo_data['description'],
-                    'tags': photo_data['tags'],
-                    }
-                    
-                    data_for_json = {k: v for k, v in data_for_json.items() if v is not None}
+                    data_for_json = serialize_record(photo_data, fields=EDITABLE_FIELDS)
                     file_processor.save_to_json(data_for_json, json_filename)
                     file_saved = True
                 
@@ -58,9 +60,12 @@ def input_form(request):
                     # Убираем ручную проверку дубликатов - теперь это делает форма
                     photo_metadata = PhotoMetadata(**photo_data)
                     photo_metadata.full_clean()  # Дополнительная валидация
-                    photo_metadata.save()
+                    # Через очередь записи: на SQLite сохранения из разных запросов идут одним пакетом
+                    writes.insert(photo_metadata)
                     db_saved = True
                     
+            except writes.WriteTimeout:
+                messages.error(request, 'База данных занята, запись не сохранена. Попробуйте ещё раз')
             except ValidationError as e:
                 # Обрабатываем ошибки валидации модели
                 duplicate_found = True
@@ -93,198 +98,228 @@ def upload_file(request):
         if form.is_valid():
             uploaded_file = request.FILES['file']
             
-            if not uploaded_file.name.lower().endswith('.json'):
-                messages.error(request, 'Пожалуйста, загружайте только JSON файлы')
+            if not JSONFileProcessor.is_supported_file(uploaded_file.name):
+                messages.error(request, 'Пожалуйста, загружайте только JSON, JSON Lines или CSV файлы')
                 return redirect('upload_file')
             
-            safe_filename = JSONFileProcessor.generate_safe_filename(uploaded_file.name)
-            
-            fs = FileSystemStorage()
-            filename = fs.save(safe_filename, uploaded_file)
-            file_path = fs.path(filename)
-            
-            is_valid, message = JSONFileProcessor.validate_json_file(file_path)
+            # Тот же файл уже загружен — не импортируем его повторно
+            sha256 = file_sha256(uploaded_file.chunks())
+            uploaded_file.seek(0)
+            previous = ImportedFile.objects.filter(sha256=sha256).exclude(status=ImportedFile.STATUS_FAILED).first()
+            if previous is not None:
+                messages.warning(request, 'Этот файл уже загружен, повторный импорт не нужен')
+                return redirect(f"{reverse('upload_file')}?job={previous.id}")
             
-            if is_valid:
-                imported_file = ImportedFile(
-                    file=filename,
-                    is_valid=True
-                )
+            imported_file = ImportedFile(file=uploaded_file, sha256=sha256)
+            try:
                 imported_file.save()
-                
-                try:
-                    file_data = JSONFileProcessor.read_json_file(file_path)
-                    records_added = 0
-                    duplicates_found = 0
-                    
-                    if isinstance(file_data, list):
-                        for item in file_data:
-                            item.pop('id', None)
-                            item.pop('created_date', None)
-                            
-                            duplicate = PhotoMetadata.objects.filter(
-                                filename=item.get('filename'),
-                                format=item.get('format'),
-                                file_size=item.get('file_size'),
-                                width=item.get('width'),
-                                height=item.get('height')
-                            ).exists()
-                            
-                            if not duplicate:
-                                PhotoMetadata.objects.create(**item)
-                                records_added += 1
-                            else:
-                                duplicates_found += 1
-                    else:
-                        file_data.pop('id', None)
-                        file_data.pop('created_date', None)
-                        
-                        duplicate = PhotoMetadata.objects.filter(
-                            filename=file_data.get('filename'),
-                            format=file_data.get('format'),
-                            file_size=file_data.get('file_size'),
-                            width=file_data.get('width'),
-                            height=file_data.get('height')
-                        ).exists()
-                        
-                        if not duplicate:
-                            PhotoMetadata.objects.create(**file_data)
-                            records_added += 1
-                        else:
-                            duplicates_found += 1
-                    
-                    if records_added > 0:
-                        messages.success(request, f'Успешно добавлено {records_added} записей в базу данных!')
-                    if duplicates_found > 0:
-                        messages.warning(request, f'Найдено {duplicates_found} дубликатов (не добавлены в БД)')
-                    
-                except Exception as e:
-                    messages.warning(request, f'Файл загружен, но возникли ошибки при обработке данных: {str(e)}')
-            else:
-                fs.delete(filename)
-                messages.error(request, f'JSON файл не валиден: {message}')
+            except IntegrityError:
+                # Такой же файл только что загружен параллельным запросом
+                imported_file.file.delete(save=False)
+                messages.warning(request, 'Этот файл уже загружается')
+                return redirect('upload_file')
+            enqueue_import(imported_file.id)
             
-            return redirect('upload_file')
+            messages.info(request, 'Файл загружен, записи импортируются в фоновом режиме')
+            return redirect(f"{reverse('upload_file')}?job={imported_file.id}")
     else:
         form = FileUploadForm()
     
-    return render(request, 'photo_metadata/upload_file.html', {'form': form})
+    context = {'form': form}
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        context['job'] = ImportedFile.objects.filter(id=job_id).first()
+        context['can_retry'] = context['job'] is not None and can_retry(context['job'])
+    
+    return render(request, 'photo_metadata/upload_file.html', context)
 
-def view_files(request):
+def retry_import(request, file_id):
+    imported_file = get_object_or_404(ImportedFile, id=file_id)
+    
+    if request.method == 'POST':
+        if reset_import(imported_file.id):
+            enqueue_import(imported_file.id)
+            messages.info(request, 'Импорт запущен заново')
+        else:
+            messages.warning(request, 'Этот импорт нельзя запустить заново: он идёт, завершён или файл загружен повторно')
+    
+    return redirect(f"{reverse('upload_file')}?job={imported_file.id}")
+
+def import_status(request, file_id):
+    imported_file = get_object_or_404(ImportedFile, id=file_id)
+    
+    return JsonResponse({
+        'id': imported_file.id,
+        'file': str(imported_file),
+        'status': imported_file.status,
+        'status_display': imported_file.get_status_display(),
+        'is_valid': imported_file.is_valid,
+        'processed': imported_file.processed_count,
+        'added': imported_file.added_count,
+        'duplicates': imported_file.duplicate_count,
+        'invalid': imported_file.invalid_count,
+        'error': imported_file.error_message,
+        'can_retry': can_retry(imported_file),
+    })
+
+async def view_files(request):
     source = request.GET.get('source', 'files')  
     
     context = {'source': source}
+    page_size = get_page_size(request)
     
     if source == 'db':
-        db_records = PhotoMetadata.objects.all().order_by('-created_date')
-        context['db_records'] = db_records
+        paginator = KeysetPaginator(PhotoMetadata.objects.all(), page_size=page_size)
         
     else:
-        json_files_dir = 'media/json_files'
-        json_uploads_dir = 'media/json_uploads'
-        
-        json_files = []
-     
-        if os.path.exists(json_files_dir):
-            for filename in os.listdir(json_files_dir):
-                if filename.endswith('.json'):
-                    file_path = os.path.join(json_files_dir, filename)
-                    file_size = os.path.getsize(file_path)
-                    json_files.append({
-                        'name': filename,
-                        'path': file_path,
-                        'size': file_size,
-                        'url': f'/media/json_files/{filename}',
-                        'type': 'created'
-                    })
-        
-        if os.path.exists(json_uploads_dir):
-            for filename in os.listdir(json_uploads_dir):
-                if filename.endswith('.json'):
-                    file_path = os.path.join(json_uploads_dir, filename)
-                    file_size = os.path.getsize(file_path)
-                    json_files.append({
-                        'name': filename,
-                        'path': file_path,
-                        'size': file_size,
-                        'url': f'/media/json_uploads/{filename}',
-                        'type': 'uploaded'
-                    })
-        
-        json_files.sort(key=lambda x: x['name'])
-        context['json_files'] = json_files
+        stored_files = StoredJSONFile.objects.all()
+        file_type = request.GET.get('type')
+        if file_type:
+            stored_files = stored_files.filter(file_type=file_type)
+            context['file_type'] = file_type
+        paginator = KeysetPaginator(stored_files, ordering=('name',), page_size=page_size)
     
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = await paginator.apage()
+    
+    context['page'] = page
+    if source == 'db':
+        context['db_records'] = page.object_list
+    else:
+        context['json_files'] = page.object_list
+    
+    # Записи страницы уже прочитаны, шаблон к базе не обращается
     return render(request, 'photo_metadata/view_files.html', context)
 
-def view_file_content(request, filename):
+def _pretty_json(record):
+    # Числа из файла читаются как Decimal — показываем их снова числами
+    return json.dumps(record, ensure_ascii=False, indent=2, default=float)
+
+# Файлы не больше этого размера просматриваются из кэша (PHOTO_CACHE_ALIAS)
+DEFAULT_FILE_CONTENT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+def _read_records(stored_file, offset, limit):
+    """Записи файла с offset по offset + limit (limit=None — до конца): (список JSON строк, ошибка)."""
+    records = []
+    try:
+        with open_stored_file(stored_file) as f:
+            window = itertools.islice(
+                JSONFileProcessor.iter_stream_records(f, stored_file.name),
+                offset, None if limit is None else offset + limit
+            )
+            for record in window:
+                records.append(_pretty_json(record))
+    except Exception as e:
+        return records, f"Ошибка: {str(e)}"
+    return records, None
+
+def _read_records_window(stored_file, offset, limit):
+    """То же окно записей; небольшие файлы разбираются один раз и берутся из кэша.
+
+    Без кэша каждая страница читает файл с начала: дальние страницы
+    большого файла обходятся дороже ближних.
+    """
+    if stored_file.size > getattr(settings, 'PHOTO_FILE_CONTENT_CACHE_MAX_BYTES', DEFAULT_FILE_CONTENT_CACHE_MAX_BYTES):
+        return _read_records(stored_file, offset, limit)
+    
+    cache = photo_cache.get_cache()
+    key = photo_cache.file_key(stored_file)
+    cached = cache.get(key)
+    if cached is None:
+        cached = _read_records(stored_file, 0, None)
+        cache.set(key, cached)
+    records, error = cached
+    window = records[offset:offset + limit]
+    # Ошибка разбора показывается на странице, до которой дошло чтение
+    return window, error if offset + limit > len(records) else None
+
+async def view_file_content(request, filename):
     safe_filename = os.path.basename(filename)
     
-    file_paths = [
-        os.path.join('media', 'json_files', safe_filename),
-        os.path.join('media', 'json_uploads', safe_filename)
-    ]
+    stored_file = await StoredJSONFile.objects.filter(name=safe_filename).afirst()
+    if not stored_file:
+        return HttpResponse("Файл не найден")
     
-    file_path = None
-    file_type = None
+    # Показываем только окно записей: файл читается потоком до конца окна
+    page_size = get_page_size(request)
+    try:
+        offset = decode_offset_cursor(request.GET['cursor']) if request.GET.get('cursor') else 0
+    except InvalidCursor:
+        offset = 0
     
-    for path in file_paths:
-        if os.path.exists(path):
-            file_path = path
-            if 'json_files' in path:
-                file_type = 'created'
-            else:
-                file_type = 'uploaded'
-            break
+    # Чтение и разбор файла — в пуле потоков, не занимая цикл событий
+    records, error = await sync_to_async(_read_records_window, thread_sensitive=False)(
+        stored_file, offset, page_size + 1
+    )
     
-    if not file_path:
-        return HttpResponse("Файл не найден")
+    has_next = len(records) > page_size
+    records = records[:page_size]
     
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        context = {
-            'filename': filename,
-            'content': content,
-            'file_type': file_type,
-            'file_path': file_path
-        }
-        return render(request, 'photo_metadata/view_file_content.html', context)
-        
-    except Exception as e:
-        return HttpResponse(f"Ошибка: {str(e)}")
+    context = {
+        'filename': filename,
+        'records': records,
+        'first_number': offset + 1,
+        'last_number': offset + len(records),
+        'next_cursor': encode_offset_cursor(offset + page_size) if has_next else None,
+        'prev_cursor': encode_offset_cursor(max(offset - page_size, 0)) if offset else None,
+        'error': error,
+        'file_type': stored_file.file_type,
+        'file_path': stored_file.path,
+        'stored_file': stored_file,
+    }
+    return render(request, 'photo_metadata/view_file_content.html', context)
+
+def view_file_raw(request, filename):
+    stored_file = get_object_or_404(StoredJSONFile, name=os.path.basename(filename))
+    return serve_stored_file(request, stored_file, as_attachment=bool(request.GET.get('download')))
+
+SEARCH_RESULT_FIELDS = [
+    'id', 'filename', 'format', 'file_size', 'width', 'height',
+    'camera_make', 'camera_model', 'description', 'created_date',
+]
+
+async def _search_records_payload(q, tags, cursor, page_size, count):
+    records = filter_by_tags(PhotoMetadata.objects.all(), tags)
+    rows = records.values(*SEARCH_RESULT_FIELDS)
+    
+    if q:
+        # Результаты поиска упорядочены по релевантности
+        page_rows, next_cursor, prev_cursor = await search.aranked_page(rows, q, cursor, page_size)
+    else:
+        page = await KeysetPaginator(rows, page_size=page_size).apage(cursor)
+        page_rows, next_cursor, prev_cursor = page.object_list, page.next_cursor, page.prev_cursor
+    
+    payload = {
+        'records': [serialize_record(row, fields=SEARCH_RESULT_FIELDS) for row in page_rows],
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    }
+    if count:
+        counted = (await search.aget_backend()).filter(records, q) if q else records
+        payload['total'] = await sync_to_async(estimate_count)(counted)
+    return payload
 
-def search_records(request):
+async def search_records(request):
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        query = request.GET.get('q', '')
+        params = {
+            'q': photo_cache.normalize_query(request.GET.get('q', '')),
+            'tags': sorted(set(normalize_tag(tag) for tag in request.GET.getlist('tag'))),
+            'cursor': request.GET.get('cursor'),
+            'page_size': get_page_size(request),
+            'count': bool(request.GET.get('count')),
+        }
         
-        if query:
-            records = PhotoMetadata.objects.filter(
-                models.Q(filename__icontains=query) |
-                models.Q(camera_make__icontains=query) |
-                models.Q(camera_model__icontains=query) |
-                models.Q(description__icontains=query) |
-                models.Q(tags__icontains=query)
-            ).order_by('-created_date')
-        else:
-            records = PhotoMetadata.objects.all().order_by('-created_date')
-
-        records_data = []
-        for record in records:
-            records_data.append({
-                'id': record.id,
-                'filename': record.filename,
-                'format': record.format,
-                'file_size': record.file_size,
-                'width': record.width,
-                'height': record.height,
-                'camera_make': record.camera_make,
-                'camera_model': record.camera_model,
-                'description': record.description,
-                'created_date': record.created_date.strftime('%d.%m.%Y %H:%M')
-            })
+        async def compute():
+            return dumps(await _search_records_payload(**params))
+        
+        try:
+            content = await photo_cache.aget_or_compute('search', params, compute)
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
         
-        return JsonResponse({'records': records_data})
+        return HttpResponse(content, content_type='application/json')
     
     return JsonResponse({'error': 'Invalid request'})
 
@@ -325,57 +360,133 @@ def delete_record(request, record_id):
     }
     return render(request, 'photo_metadata/delete_record.html', context)
 def view_database_records(request):
-    records = PhotoMetadata.objects.all().order_by('-created_date')
+    search_query = request.GET.get('q', '')
+    selected_tags = request.GET.getlist('tag')
+    cursor = request.GET.get('cursor')
+    page_size = get_page_size(request)
+    with_count = bool(request.GET.get('count'))
     
+    def load_page():
+        records = PhotoMetadata.objects.all()
+        if search_query:
+            records = search.get_backend().filter(records, search_query)
+        records = filter_by_tags(records, selected_tags)
+        
+        paginator = KeysetPaginator(records, page_size=page_size)
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor:
+            page = paginator.page()
+        
+        return {
+            'page': page,
+            'tag_facets': tag_facets(records, limit=20),
+            'total_count': estimate_count(records) if with_count else None,
+        }
     
-    search_query = request.GET.get('q', '')
-    if search_query:
-        records = records.filter(
-            models.Q(filename__icontains=search_query) |
-            models.Q(camera_make__icontains=search_query) |
-            models.Q(camera_model__icontains=search_query) |
-            models.Q(description__icontains=search_query) |
-            models.Q(tags__icontains=search_query)
-        )
+    cached = photo_cache.get_or_compute('listing', {
+        'q': photo_cache.normalize_query(search_query),
+        'tags': sorted(set(normalize_tag(tag) for tag in selected_tags)),
+        'cursor': cursor,
+        'page_size': page_size,
+        'count': with_count,
+    }, load_page)
     
     context = {
-        'records': records,
-        'search_query': search_query
+        'records': cached['page'].object_list,
+        'page': cached['page'],
+        'search_query': search_query,
+        'selected_tags': selected_tags,
+        'filter_query': urlencode([('q', search_query)] + [('tag', tag) for tag in selected_tags]),
+        'tag_facets': cached['tag_facets'],
+        'total_count': cached['total_count'],
     }
     return render(request, 'photo_metadata/database_records.html', context)
+
+def search_tag_facets(request):
+    records = PhotoMetadata.objects.all()
+    
+    query = request.GET.get('q', '')
+    if query:
+        records = search.get_backend().filter(records, query)
+    records = filter_by_tags(records, request.GET.getlist('tag'))
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    
+    return JsonResponse({'tags': tag_facets(records, limit=limit)})
     
 def view_record(request, record_id):
     record = get_object_or_404(PhotoMetadata, id=record_id)
 
-    record_data = {
-        'id': record.id,
-        'filename': record.filename,
-        'format': record.format,
-        'file_size': record.file_size,
-        'width': record.width,
-        'height': record.height,
-        'camera_make': record.camera_make,
-        'camera_model': record.camera_model,
-        'exposure_time': record.exposure_time,
-        'aperture': str(record.aperture) if record.aperture else None,
-        'iso': record.iso,
-        'focal_length': str(record.focal_length) if record.focal_length else None,
-        'latitude': str(record.latitude) if record.latitude else None,
-        'longitude': str(record.longitude) if record.longitude else None,
-        'capture_date': record.capture_date.isoformat() if record.capture_date else None,
-        'description': record.description,
-        'tags': record.tags,
-        'created_date': record.created_date.isoformat(),
-    }
-    
-    record_data = {k: v for k, v in record_data.items() if v is not None}
+    record_data = serialize_record(record)
 
     formatted_json = json.dumps(record_data, ensure_ascii=False, indent=2)
     
     context = {
         'record': record,
+        'similar_records': neardup.similar_records(record),
         'content': formatted_json,
         'title': f'Запись: {record.filename}'
     }
     
-    return render(request, 'photo_metadata/view_record.html', context)
\ No newline at end of file
+    return render(request, 'photo_metadata/view_record.html', context)
+
+def export_records(request):
+    export_format = request.GET.get('format', 'json')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Unsupported format'}, status=400)
+    compress = bool(request.GET.get('gzip'))
+    
+    records = PhotoMetadata.objects.all()
+    query = request.GET.get('q', '')
+    if query:
+        records = search.get_backend().filter(records, query)
+    records = filter_by_tags(records, request.GET.getlist('tag'))
+    
+    content_type = 'application/gzip' if compress else EXPORT_FORMATS[export_format][0]
+    response = StreamingHttpResponse(
+        iter_export(records, export_format, compress=compress),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export_format, compress)}"'
+    return response
+
+def metrics(request):
+    # Счётчики видят сотрудники и сборщик метрик с адресов из настроек
+    allowed_ips = getattr(settings, 'PHOTO_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in allowed_ips):
+        return HttpResponseForbidden()
+    return HttpResponse(photo_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def catalog_stats(request):
+    summary = photo_stats.summary()
+    sections = []
+    for dimension, title in CatalogStat.DIMENSION_CHOICES:
+        largest = max((item['count'] for item in summary[dimension]), default=0)
+        sections.append({'dimension': dimension, 'title': title, 'items': summary[dimension], 'largest': largest})
+    
+    return render(request, 'photo_metadata/catalog_stats.html', {
+        'total': summary['total'],
+        'sections': sections,
+    })
+
+def near_duplicates(request):
+    page_size = get_page_size(request)
+    try:
+        offset = decode_offset_cursor(request.GET['cursor']) if request.GET.get('cursor') else 0
+    except InvalidCursor:
+        offset = 0
+    
+    clusters = neardup.cluster_page(offset, page_size + 1)
+    has_next = len(clusters) > page_size
+    
+    context = {
+        'clusters': clusters[:page_size],
+        'last_scan': DuplicateScan.objects.order_by('-id').first(),
+        'next_cursor': encode_offset_cursor(offset + page_size) if has_next else None,
+        'prev_cursor': encode_offset_cursor(max(offset - page_size, 0)) if offset else None,
+    }
+    return render(request, 'photo_metadata/near_duplicates.html', context)
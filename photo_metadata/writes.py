@@ -0,0 +1,173 @@
+"""Очередь записи новых PhotoMetadata: один поток-писатель на процесс.
+
+SQLite допускает одного писателя на файл базы. Под ASGI (UvicornWorker)
+один процесс обслуживает много запросов сразу, и синхронные представления
+сохраняют записи из разных потоков — каждая своей транзакцией на общей
+блокировке записи. Очередь собирает новые записи из всех потоков процесса,
+а поток-писатель вставляет всё накопившееся одним bulk_insert в одной
+транзакции: не больше PHOTO_WRITE_BATCH_SIZE записей, ожидая следующие не
+дольше PHOTO_WRITE_LINGER_MS. Между процессами запись по-прежнему разделяет
+блокировка SQLite; столкновения с ними повторяются с задержкой
+(db.atomic_with_retry).
+
+Запрос ждёт свою запись не дольше PHOTO_WRITE_TIMEOUT секунд. Если писатель
+за это время её не взял, запись убирается из очереди и insert() поднимает
+WriteTimeout — запись точно не сохранена. Запись, которую писатель уже
+сохраняет, запрос дожидается.
+
+Поток-писатель не демон: он завершается сам, когда очередь пуста дольше
+IDLE_TIMEOUT секунд. При остановке процесса интерпретатор ждёт его, так что
+принятые в очередь записи сохраняются.
+
+При PHOTO_WRITE_QUEUE = False (по умолчанию для PostgreSQL) запись
+выполняется сразу в потоке запроса, с тем же повтором.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+
+from . import metrics
+from .db import atomic_with_retry
+from .importer import bulk_insert
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_LINGER_MS = 2
+# Сколько секунд запрос ждёт, пока писатель возьмёт его запись
+DEFAULT_TIMEOUT = 30
+# Сколько секунд писатель ждёт новых записей, прежде чем завершиться
+IDLE_TIMEOUT = 1.0
+
+
+class WriteTimeout(Exception):
+    """Писатель не взял запись за PHOTO_WRITE_TIMEOUT секунд; запись не сохранена."""
+
+
+class WriteQueue:
+    def __init__(self, batch_size=None, linger_ms=None, idle_timeout=IDLE_TIMEOUT):
+        self.batch_size = batch_size or getattr(settings, 'PHOTO_WRITE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        linger_ms = getattr(settings, 'PHOTO_WRITE_LINGER_MS', DEFAULT_LINGER_MS) if linger_ms is None else linger_ms
+        self.linger = linger_ms / 1000
+        self.idle_timeout = idle_timeout
+        self._pending = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, obj):
+        """Ставит новую запись в очередь; Future вернёт её с id или исключение записи."""
+        future = Future()
+        with self._lock:
+            self._pending.put((obj, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='photo-writer')
+                self._thread.start()
+        return future
+
+    def join(self, timeout=None):
+        """Ждёт, пока писатель сохранит очередь и завершится."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._collect()
+                if batch is None:
+                    return
+                if batch:
+                    close_old_connections()
+                    self._write(batch)
+        finally:
+            connection.close()
+
+    def _next(self, timeout):
+        """Следующая запись, которую ещё ждут; None — очередь пуста."""
+        while True:
+            try:
+                obj, future = self._pending.get(timeout=timeout) if timeout > 0 else self._pending.get_nowait()
+            except queue.Empty:
+                return None
+            # Запрос, переставший ждать, отменил Future — запись пропускается
+            if future.set_running_or_notify_cancel():
+                return obj, future
+
+    def _collect(self):
+        """Пакет записей; None — писатель простоял без записей и завершается."""
+        item = self._next(self.idle_timeout)
+        if item is None:
+            with self._lock:
+                # Под блокировкой submit() не добавит запись, пока писатель решает завершиться
+                if self._pending.empty():
+                    self._thread = None
+                    return None
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            item = self._next(deadline - time.monotonic())
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _write(self, batch):
+        metrics.count_write('batch')
+        metrics.count_write('batched_record', len(batch))
+        try:
+            saved = atomic_with_retry(bulk_insert, [obj for obj, _ in batch])
+        except IntegrityError:
+            # Одна из записей нарушила уникальность — остальные сохраняются поштучно
+            for obj, future in batch:
+                self._write_one(obj, future)
+            return
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        saved = {obj.filename: obj for obj in saved}
+        for obj, future in batch:
+            future.set_result(saved.get(obj.filename, obj))
+
+    def _write_one(self, obj, future):
+        try:
+            future.set_result(atomic_with_retry(bulk_insert, [obj])[0])
+        except Exception as error:
+            future.set_exception(error)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteQueue()
+        return _queue
+
+
+def insert(obj):
+    """Сохраняет новую запись PhotoMetadata и возвращает её с id.
+
+    Ошибки записи (IntegrityError и другие) поднимаются здесь, в потоке
+    запроса; WriteTimeout — если запись так и не попала к писателю. Внутри
+    открытой транзакции запись выполняется сразу, чтобы остаться в этой
+    транзакции.
+    """
+    if not getattr(settings, 'PHOTO_WRITE_QUEUE', False) or connection.in_atomic_block:
+        return atomic_with_retry(bulk_insert, [obj])[0]
+    future = get_queue().submit(obj)
+    try:
+        return future.result(timeout=getattr(settings, 'PHOTO_WRITE_TIMEOUT', DEFAULT_TIMEOUT))
+    except FutureTimeoutError:
+        if future.cancel():
+            metrics.count_write('queue_timeout')
+            raise WriteTimeout() from None
+    # Писатель уже сохраняет запись — её результат будет скоро
+    return future.result()
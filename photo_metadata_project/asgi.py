@@ -5,6 +5,30 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Запуск под ASGI. Поиск (search_records), просмотр файлов (view_files,
+view_file_content) и API записей /api/v1/photos/ — асинхронные
+представления: пока запрос ждёт базу, чтение файла или медленного
+клиента, воркер обслуживает другие запросы. Под WSGI те же
+представления работают, но каждое занимает поток целиком.
+
+Разработка:
+
+    uvicorn photo_metadata_project.asgi:application --reload
+
+Продакшен — gunicorn управляет процессами, uvicorn обслуживает запросы
+в каждом из них:
+
+    gunicorn photo_metadata_project.asgi:application \
+        -k uvicorn.workers.UvicornWorker --workers 4 --bind 0.0.0.0:8000
+
+Так запускают проект dockerfile и сервис web в docker-compose. Для
+сравнения под WSGI есть сервис web-wsgi (профиль wsgi):
+
+    docker compose --profile wsgi up web-wsgi
+
+Выигрыш при медленных клиентах показывает команда
+"manage.py benchmark_concurrency".
 """
 
 import os
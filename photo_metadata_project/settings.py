@@ -21,6 +21,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замерять и работу остальных middleware
+    'photo_metadata.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,12 +52,87 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'photo_metadata_project.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Даты хранятся и сравниваются без часового пояса, как до Django 5.0,
+# где USE_TZ по умолчанию стал True
+USE_TZ = False
+
+# База данных. docker-compose передаёт DB_HOST и остальные DB_* — тогда
+# используется PostgreSQL; без DB_HOST — SQLite в файле DB_NAME (по умолчанию
+# db.sqlite3 в каталоге проекта). Соединение не закрывается после запроса,
+# а переиспользуется DB_CONN_MAX_AGE секунд и перед этим проверяется
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if os.environ.get('DB_HOST'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'photodb'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ['DB_HOST'],
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5))},
+        }
+    }
+    # Пул из DB_POOL_SIZE соединений на процесс вместо постоянного соединения
+    # на каждый поток. Под ASGI постоянные соединения не переиспользуются,
+    # поэтому сервис web в docker-compose и образ задают DB_POOL_SIZE.
+    # Нужны Django 5.1+ и psycopg 3 с psycopg_pool (см. requirements.txt)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+    if DB_POOL_SIZE:
+        import django
+        from django.core.exceptions import ImproperlyConfigured
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            psycopg_pool = None
+        if django.VERSION < (5, 1) or psycopg_pool is None:
+            raise ImproperlyConfigured('DB_POOL_SIZE требует Django 5.1+ и psycopg[pool] 3')
+        DATABASES['default']['OPTIONS']['pool'] = {'min_size': 1, 'max_size': DB_POOL_SIZE}
+        # С пулом соединение возвращается в пул после каждого запроса
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
+
+# PRAGMA для каждого нового соединения с SQLite (см. photo_metadata/db.py):
+# busy_timeout — сколько миллисекунд ждать блокировку записи вместо
+# немедленной ошибки "database is locked"; mmap_size — чтение страниц через mmap
+PHOTO_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
 }
+# Режим WAL: чтение не ждёт записи, а synchronous=NORMAL не делает fsync на
+# каждую транзакцию — в WAL это теряет при сбое питания только последние
+# транзакции, но не портит базу. Режим сохраняется в самом файле базы.
+# DB_SQLITE_WAL=0 оставляет журнал отката и synchronous=FULL по умолчанию:
+# без WAL synchronous=NORMAL может повредить базу при сбое
+if os.environ.get('DB_SQLITE_WAL', '1') != '0':
+    PHOTO_SQLITE_PRAGMAS.update({'journal_mode': 'wal', 'synchronous': 'normal'})
+
+# Запись в базу (photo_metadata/writes.py, db.atomic_with_retry).
+# PHOTO_WRITE_QUEUE — новые записи из формы сохраняет один поток-писатель
+# процесса пакетами до PHOTO_WRITE_BATCH_SIZE, подождав следующие не дольше
+# PHOTO_WRITE_LINGER_MS; включена для SQLite, где писатель может быть один.
+# Запрос ждёт писателя не дольше PHOTO_WRITE_TIMEOUT секунд, после чего
+# запись не сохраняется и форма сообщает, что база занята.
+# Транзакция, наткнувшаяся на занятую базу, повторяется до
+# PHOTO_WRITE_RETRIES раз; задержка начинается с PHOTO_WRITE_RETRY_DELAY
+# секунд и удваивается
+PHOTO_WRITE_QUEUE = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+PHOTO_WRITE_BATCH_SIZE = 500
+PHOTO_WRITE_LINGER_MS = 2
+PHOTO_WRITE_TIMEOUT = 30
+PHOTO_WRITE_RETRIES = 5
+PHOTO_WRITE_RETRY_DELAY = 0.05
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -63,4 +140,106 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Кэш поиска и списков записей. LocMemCache вытесняет давно не
+# использованные ключи (LRU) и живёт внутри одного процесса, поэтому номер
+# поколения для инвалидации хранится отдельно, в файловом кэше, общем для
+# всех воркеров и команд на этой машине. При нескольких машинах сюда
+# нужен общий бэкенд (Redis, Memcached, DatabaseCache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'photo_search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'photo-search',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    'photo_generation': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'generation'),
+        'TIMEOUT': None,
+    },
+}
+PHOTO_CACHE_ALIAS = 'photo_search'
+PHOTO_CACHE_GENERATION_ALIAS = 'photo_generation'
+# Просмотр файла: файлы до этого размера разбираются один раз и листаются из кэша
+PHOTO_FILE_CONTENT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Фоновый импорт JSON файлов
+PHOTO_IMPORT_ASYNC = True
+PHOTO_IMPORT_WORKERS = 2
+PHOTO_IMPORT_BATCH_SIZE = 1000
+# Импорт в очереди или в работе, не обновлявшийся столько секунд, считается
+# зависшим (процесс перезапущен): его можно запустить заново из формы загрузки
+# или командой recover_imports
+PHOTO_IMPORT_STALE_AFTER = 600
+
+# Постраничный вывод записей
+PHOTO_PAGE_SIZE = 50
+PHOTO_MAX_PAGE_SIZE = 500
+
+# Токены для изменяющих запросов к API (заголовок Authorization: Bearer <токен>),
+# через запятую в переменной окружения PHOTO_API_TOKENS. Без токена изменять
+# записи через API может только пользователь, вошедший на сайт
+PHOTO_API_TOKENS = [token for token in os.environ.get('PHOTO_API_TOKENS', '').split(',') if token]
+
+# Не больше стольких операций в одном пакетном запросе /api/v1/photos/batch/
+PHOTO_API_MAX_BATCH = 500
+
+# Наибольший радиус поиска /api/v1/photos/nearby/, км
+PHOTO_GEO_MAX_RADIUS_KM = 1000
+
+# Поиск похожих записей (photo_metadata/neardup.py): сравниваются снимки одной
+# камеры, снятые с разницей не больше PHOTO_NEAR_DUPLICATE_WINDOW секунд, с
+# соотношением сторон в пределах допуска; группа — пары со сходством от порога
+PHOTO_NEAR_DUPLICATE_WINDOW = 5
+PHOTO_NEAR_DUPLICATE_ASPECT_TOLERANCE = 0.01
+PHOTO_NEAR_DUPLICATE_THRESHOLD = 0.75
+
+# Каталог колоночного снимка для аналитики (команда snapshot_catalog)
+PHOTO_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'snapshots', 'catalog')
+
+# Замеры производительности (photo_metadata/middleware.py, счётчики на /metrics/):
+# предупреждение в лог, если запрос выполнил больше PHOTO_PERF_QUERY_BUDGET
+# SQL запросов или один запрос повторился PHOTO_PERF_REPEATED_QUERY_THRESHOLD раз
+PHOTO_PERF_QUERY_BUDGET = 50
+PHOTO_PERF_REPEATED_QUERY_THRESHOLD = 10
+# Пик памяти каждого запроса через tracemalloc; заметно замедляет работу.
+# Пик общий для процесса — точен, только если воркер обслуживает один запрос за раз
+PHOTO_PERF_TRACE_MEMORY = False
+# /metrics/ открыт сотрудникам (is_staff) и запросам с этих адресов
+PHOTO_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # Предупреждения о бюджете запросов; строка на каждый запрос — при 'DEBUG'
+        'photo_metadata.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Хранилище JSON файлов, созданных через форму (см. photo_metadata/storage.py):
+# 'flat' — все файлы в одном каталоге, 'sharded' — подкаталоги по хэшу имени,
+# 'segments' — записи дописываются в общие файлы-сегменты. Смена хранилища
+# или сжатия меняет расположение и адреса /media/ новых файлов
+PHOTO_JSON_STORAGE = 'flat'
+# None, 'gzip' или 'zstd' (для zstd нужен пакет zstandard)
+PHOTO_JSON_COMPRESSION = None
+PHOTO_JSON_SHARD_DEPTH = 2
+PHOTO_JSON_SEGMENT_SIZE = 64 * 1024 * 1024